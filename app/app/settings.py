@@ -52,6 +52,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.QueryInspectionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,6 +61,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'app.urls'
@@ -95,6 +98,25 @@ DATABASES = {
     }
 }
 
+# The default cache is private to each process. The "auth" cache holds
+# the shared tier of the token authentication cache: point
+# AUTH_CACHE_BACKEND and AUTH_CACHE_LOCATION at Memcached, for example
+# django.core.cache.backends.memcached.PyMemcacheCache and
+# memcached:11211, or at Redis with a Redis cache backend. Left as a
+# local memory cache, tokens are only cached per process.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'auth': {
+        'BACKEND': os.environ.get(
+            'AUTH_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('AUTH_CACHE_LOCATION', 'auth'),
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -138,6 +160,37 @@ MEDIA_URL = '/static/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+# Uploaded patients images are re-encoded as JPEG with their long edge
+# capped. Originals are kept in IMAGE_ORIGINALS_ROOT when it is set.
+IMAGE_MAX_EDGE = int(os.environ.get('IMAGE_MAX_EDGE', 1600))
+IMAGE_JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', 85))
+IMAGE_ORIGINALS_ROOT = os.environ.get('IMAGE_ORIGINALS_ROOT') or None
+
+# Uploads are rejected from their header alone when they exceed these
+# limits, before any pixel is decoded.
+IMAGE_MAX_UPLOAD_BYTES = int(
+    os.environ.get('IMAGE_MAX_UPLOAD_BYTES', 20 * 1024 * 1024)
+)
+IMAGE_MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', 10000))
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 50_000_000))
+IMAGE_ALLOWED_FORMATS = os.environ.get(
+    'IMAGE_ALLOWED_FORMATS', 'JPEG,PNG,WEBP'
+).split(',')
+
+# Patients images are served by the API under content-hash URLs. Set
+# MEDIA_SENDFILE to x-accel-redirect (nginx, with an internal location at
+# MEDIA_ACCEL_PREFIX) or x-sendfile to let the web server send the files.
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', '')
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+MEDIA_CACHE_MAX_AGE = int(
+    os.environ.get('MEDIA_CACHE_MAX_AGE', 60 * 60 * 24 * 365)
+)
+
+# Unreferenced image blobs younger than this are kept by collect_blobs.
+IMAGE_BLOB_GRACE_SECONDS = int(
+    os.environ.get('IMAGE_BLOB_GRACE_SECONDS', 60 * 60)
+)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -152,3 +205,116 @@ REST_FRAMEWORK = {
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
 }
+
+# Face recognition
+
+FACE_EXTRACTOR = 'patients.faces.PixelProjectionExtractor'
+# Previous extractors, still used to serve their embeddings until the
+# reindex_faces command has activated FACE_EXTRACTOR
+FACE_LEGACY_EXTRACTORS = [
+    path for path in os.environ.get('FACE_LEGACY_EXTRACTORS', '').split(',')
+    if path
+]
+# Seconds the active extractor version stays cached. Activation drops it
+# from the shared cache at once, this bounds how long a process with a
+# cache of its own keeps matching the previous version.
+FACE_ACTIVE_VERSION_TTL = int(os.environ.get('FACE_ACTIVE_VERSION_TTL', 30))
+FACE_MATCH_THRESHOLD = float(os.environ.get('FACE_MATCH_THRESHOLD', 0.75))
+FACE_BATCH_MAX_IMAGES = int(os.environ.get('FACE_BATCH_MAX_IMAGES', 16))
+# Face boxes given with the images of one identification request.
+FACE_MAX_BOXES = int(os.environ.get('FACE_MAX_BOXES', 32))
+FACE_GALLERY_CACHE_SIZE = int(os.environ.get('FACE_GALLERY_CACHE_SIZE', 64))
+FACE_DECODE_MAX_EDGE = int(os.environ.get('FACE_DECODE_MAX_EDGE', 1024))
+
+# Gallery encoding: float32, float16, int8, pq or ivf. Quantized
+# galleries re-rank this many candidates per probe with the exact vectors,
+# ivf galleries score the vectors of the FACE_IVF_NPROBE closest lists.
+FACE_MATCHER_QUANTIZATION = os.environ.get(
+    'FACE_MATCHER_QUANTIZATION', 'float32'
+)
+FACE_RERANK_CANDIDATES = int(os.environ.get('FACE_RERANK_CANDIDATES', 50))
+FACE_IVF_NPROBE = int(os.environ.get('FACE_IVF_NPROBE', 8))
+
+# Identification results per process, and seconds in the shared cache.
+FACE_RESULT_CACHE_SIZE = int(os.environ.get('FACE_RESULT_CACHE_SIZE', 1024))
+FACE_RESULT_CACHE_TIMEOUT = int(
+    os.environ.get('FACE_RESULT_CACHE_TIMEOUT', 10 * 60)
+)
+
+# Image decoder processes, 0 runs one per CPU core.
+IMAGE_DECODER_WORKERS = int(os.environ.get('IMAGE_DECODER_WORKERS', 0))
+
+# Largest dHash distance between two near-duplicate images (at most 3).
+IMAGE_DUPLICATE_DISTANCE = int(os.environ.get('IMAGE_DUPLICATE_DISTANCE', 3))
+
+# Seconds an authenticated token stays cached in the AUTH_TOKEN_CACHE
+# cache and in the per-process LRU of at most AUTH_TOKEN_LOCAL_SIZE
+# tokens. With a local memory cache, which is not shared, only the LRU
+# is used.
+AUTH_TOKEN_CACHE = os.environ.get('AUTH_TOKEN_CACHE', 'auth')
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', 60))
+AUTH_TOKEN_LOCAL_TTL = int(os.environ.get('AUTH_TOKEN_LOCAL_TTL', 5))
+AUTH_TOKEN_LOCAL_SIZE = int(os.environ.get('AUTH_TOKEN_LOCAL_SIZE', 1024))
+
+# Lifetimes in seconds of signed access tokens and of refresh tokens.
+AUTH_ACCESS_TOKEN_TTL = int(os.environ.get('AUTH_ACCESS_TOKEN_TTL', 5 * 60))
+AUTH_REFRESH_TOKEN_TTL = int(
+    os.environ.get('AUTH_REFRESH_TOKEN_TTL', 30 * 24 * 60 * 60)
+)
+
+# Login attempts per client IP and per email: bursts of that many
+# attempts, refilled at that many attempts per second. Unknown emails are
+# refused without hashing for LOGIN_UNKNOWN_EMAIL_TTL seconds when set,
+# at the cost of revealing which emails have an account through timing.
+LOGIN_THROTTLE_CACHE = os.environ.get('LOGIN_THROTTLE_CACHE', 'default')
+LOGIN_THROTTLE_IP_BURST = int(os.environ.get('LOGIN_THROTTLE_IP_BURST', 30))
+LOGIN_THROTTLE_IP_RATE = float(os.environ.get('LOGIN_THROTTLE_IP_RATE', 0.5))
+LOGIN_THROTTLE_EMAIL_BURST = int(
+    os.environ.get('LOGIN_THROTTLE_EMAIL_BURST', 5)
+)
+LOGIN_THROTTLE_EMAIL_RATE = float(
+    os.environ.get('LOGIN_THROTTLE_EMAIL_RATE', 0.1)
+)
+LOGIN_UNKNOWN_EMAIL_TTL = int(os.environ.get('LOGIN_UNKNOWN_EMAIL_TTL', 0))
+
+# Seconds DRF auth tokens stay valid after login, and how often, in
+# seconds or tokens used, their last use is written.
+AUTH_TOKEN_TTL = int(os.environ.get('AUTH_TOKEN_TTL', 30 * 24 * 60 * 60))
+AUTH_TOKEN_USAGE_FLUSH_INTERVAL = int(
+    os.environ.get('AUTH_TOKEN_USAGE_FLUSH_INTERVAL', 60)
+)
+AUTH_TOKEN_USAGE_FLUSH_SIZE = int(
+    os.environ.get('AUTH_TOKEN_USAGE_FLUSH_SIZE', 1000)
+)
+
+# Directory shared by the worker processes for their metrics, empty to
+# expose the metrics of the answering process only. METRICS_TOKEN, when
+# set, is required as a bearer token to read /metrics.
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Fraction of requests whose SQL queries are inspected, reporting queries
+# slower than SLOW_QUERY_MS and query shapes repeated at least
+# QUERY_REPEAT_THRESHOLD times in a request. QUERY_INSPECTION_HEADERS adds
+# the findings to the responses of staff users.
+QUERY_INSPECTION_RATE = float(os.environ.get('QUERY_INSPECTION_RATE', 0))
+QUERY_INSPECTION_HEADERS = bool(
+    int(os.environ.get('QUERY_INSPECTION_HEADERS', 0))
+)
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+QUERY_REPEAT_THRESHOLD = int(os.environ.get('QUERY_REPEAT_THRESHOLD', 5))
+
+# Fraction of requests profiled with cProfile into PROFILING_DIR, besides
+# those profiled on demand by staff users. Reports list the PROFILING_TOP
+# heaviest entries, allocation tracebacks keep PROFILING_ALLOC_FRAMES.
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_DIR = os.environ.get('PROFILING_DIR', '/tmp/profiles')
+PROFILING_TOP = int(os.environ.get('PROFILING_TOP', 40))
+PROFILING_ALLOC_FRAMES = int(os.environ.get('PROFILING_ALLOC_FRAMES', 1))
+
+# Directory of the OpenAPI schemas precomputed per code version. The code
+# version is SCHEMA_CODE_VERSION when set, e.g. to the release commit,
+# otherwise a digest of the project sources.
+SCHEMA_CACHE_DIR = os.environ.get('SCHEMA_CACHE_DIR', '/tmp/schema')
+SCHEMA_CODE_VERSION = os.environ.get('SCHEMA_CODE_VERSION', '')
@@ -0,0 +1,170 @@
+"""
+Offline benchmark suites.
+
+Each suite is a module with a DEFAULTS dict of parameters and a run()
+function taking those parameters and returning JSON serializable results.
+"""
+import importlib
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from PIL import Image, ImageDraw
+
+SUITES = {
+    'auth': 'benchmarks.auth',
+    'decode': 'benchmarks.decode',
+    'ingest': 'benchmarks.ingest',
+    'load': 'benchmarks.load',
+    'quantization': 'benchmarks.quantization',
+    'recognition': 'benchmarks.recognition',
+}
+
+
+def get_suite(name):
+    """Return the module of a benchmark suite."""
+    return importlib.import_module(SUITES[name])
+
+
+def parse_params(suite, pairs):
+    """Parse name=value pairs into the typed parameters of a suite."""
+    params = dict(suite.DEFAULTS)
+    for pair in pairs:
+        name, _, value = pair.partition('=')
+        if name not in params:
+            raise ValueError(f'Unknown parameter {name}.')
+        default = params[name]
+        if isinstance(default, bool):
+            params[name] = value.lower() in ('1', 'true', 'yes')
+        elif isinstance(default, (list, tuple)):
+            params[name] = [type(default[0])(v) for v in value.split(',')]
+        else:
+            params[name] = type(default)(value)
+
+    return params
+
+
+def git_commit():
+    """Return the current git commit, if any."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return peak / 1024
+
+
+def run_suite(name, params):
+    """Run a suite and return its results with the run environment."""
+    suite = get_suite(name)
+    started = time.time()
+    results = suite.run(**params)
+
+    return {
+        'suite': name,
+        'params': params,
+        'started': started,
+        'duration': time.time() - started,
+        'environment': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+
+
+def synthetic_photo(width, height, seed=0):
+    """Return a smooth, photo-like RGB image with mild sensor noise."""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(12, 16, 3), dtype=np.uint8)
+    image = Image.fromarray(small, 'RGB').resize(
+        (width, height),
+        Image.BICUBIC,
+    )
+    pixels = np.asarray(image, dtype=np.int16)
+    pixels += rng.integers(-6, 7, size=pixels.shape, dtype=np.int16)
+
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), 'RGB')
+
+
+SKIN_TONES = (
+    (255, 224, 196),
+    (234, 192, 134),
+    (198, 134, 66),
+    (141, 85, 36),
+    (84, 52, 28),
+)
+
+
+def synthetic_face(size=256, seed=0):
+    """Return a frontal cartoon face with randomized proportions."""
+    rng = np.random.default_rng(seed)
+    background = tuple(int(v) for v in rng.integers(40, 220, size=3))
+    image = Image.new('RGB', (size, size), background)
+    draw = ImageDraw.Draw(image)
+
+    def box(cx, cy, rx, ry):
+        return [
+            size * (cx - rx), size * (cy - ry),
+            size * (cx + rx), size * (cy + ry),
+        ]
+
+    cx, cy = 0.5 + rng.uniform(-0.04, 0.04), 0.52 + rng.uniform(-0.04, 0.04)
+    rx, ry = rng.uniform(0.26, 0.34), rng.uniform(0.34, 0.42)
+    skin = np.array(SKIN_TONES[rng.integers(len(SKIN_TONES))])
+    skin = tuple(int(v) for v in np.clip(skin + rng.integers(-12, 13), 0, 255))
+    hair = tuple(int(v) for v in rng.integers(10, 120, size=3))
+    draw.ellipse(box(cx, cy - ry * 0.35, rx * 1.05, ry * 0.75), fill=hair)
+    draw.ellipse(box(cx, cy, rx, ry), fill=skin)
+
+    eye_y = cy - ry * rng.uniform(0.15, 0.3)
+    eye_dx = rx * rng.uniform(0.35, 0.5)
+    eye_r = rx * rng.uniform(0.1, 0.16)
+    iris = tuple(int(v) for v in rng.integers(20, 140, size=3))
+    for side in (-1, 1):
+        ex = cx + side * eye_dx
+        draw.ellipse(box(ex, eye_y, eye_r, eye_r * 0.6), fill='white')
+        draw.ellipse(box(ex, eye_y, eye_r * 0.45, eye_r * 0.45), fill=iris)
+        draw.line(
+            box(ex, eye_y - eye_r * 1.3, eye_r * 1.1, eye_r * 0.2),
+            fill=hair,
+            width=max(1, size // 64),
+        )
+    nose_y = cy + ry * rng.uniform(0.05, 0.2)
+    draw.line(
+        [size * cx, size * eye_y, size * (cx - rx * 0.08), size * nose_y],
+        fill=tuple(int(v * 0.8) for v in skin),
+        width=max(1, size // 96),
+    )
+    mouth_y = cy + ry * rng.uniform(0.4, 0.55)
+    mouth_rx = rx * rng.uniform(0.3, 0.5)
+    draw.arc(
+        box(cx, mouth_y - ry * 0.1, mouth_rx, ry * 0.12),
+        start=20,
+        end=160,
+        fill=(150, 40, 50),
+        width=max(1, size // 64),
+    )
+
+    pixels = np.asarray(image, dtype=np.int16)
+    pixels += rng.integers(-6, 7, size=pixels.shape, dtype=np.int16)
+
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), 'RGB')
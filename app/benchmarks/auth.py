@@ -0,0 +1,107 @@
+"""
+Benchmark of token authentication on the patients list.
+
+Runs the same authenticated list requests with DRF's TokenAuthentication,
+CachedTokenAuthentication and signed access tokens and reports the
+database queries and latency of each request. Its rows are created in
+a transaction that is rolled back at the end.
+"""
+import time
+import uuid
+
+import numpy as np
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Patients
+from patients.views import PatientsViewSet
+from user.authentication import (
+    AccessTokenAuthentication,
+    CachedTokenAuthentication,
+    tokens,
+    users,
+)
+from user.tokens import issue_access_token
+
+DEFAULTS = {
+    'patients': 20,
+    'requests': 200,
+}
+
+# Authentication classes and the keyword of their credentials.
+AUTHENTICATORS = {
+    'token': (TokenAuthentication, 'Token'),
+    'cached_token': (CachedTokenAuthentication, 'Token'),
+    'access_token': (AccessTokenAuthentication, 'Bearer'),
+}
+
+
+def _measure(client, url, requests):
+    queries = []
+    latencies = []
+    for _ in range(requests):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            res = client.get(url)
+            latencies.append(time.perf_counter() - started)
+        assert res.status_code == 200, res.status_code
+        queries.append(len(captured))
+    latencies = np.asarray(latencies) * 1000
+    return {
+        'queries_per_request': float(np.mean(queries)),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+    }
+
+
+def run(patients, requests):
+    results = {}
+    original = PatientsViewSet.authentication_classes
+    with transaction.atomic(), override_settings(ALLOWED_HOSTS=['*']):
+        user = get_user_model().objects.create_user(
+            f'benchmark-{uuid.uuid4().hex}@example.com',
+            'password123',
+        )
+        Patients.objects.bulk_create(
+            Patients(user=user, first_name=f'first {i}', last_name='last',
+                     age=30)
+            for i in range(patients)
+        )
+        token = Token.objects.create(user=user)
+        credentials = {
+            'Token': token.key,
+            'Bearer': issue_access_token(user),
+        }
+        client = APIClient()
+        url = reverse('patients:patients-list')
+        try:
+            for name, (authenticator, keyword) in AUTHENTICATORS.items():
+                PatientsViewSet.authentication_classes = [authenticator]
+                client.credentials(
+                    HTTP_AUTHORIZATION=f'{keyword} {credentials[keyword]}',
+                )
+                tokens.invalidate(token.key)
+                users.invalidate(user.pk)
+                client.get(url)
+                results[name] = _measure(client, url, requests)
+        finally:
+            PatientsViewSet.authentication_classes = original
+            tokens.invalidate(token.key)
+            users.invalidate(user.pk)
+            transaction.set_rollback(True)
+
+    results['queries_saved_per_request'] = {
+        name: (
+            results['token']['queries_per_request']
+            - results[name]['queries_per_request']
+        )
+        for name in AUTHENTICATORS if name != 'token'
+    }
+    return results
@@ -0,0 +1,76 @@
+"""
+Benchmark of thumbnail decoding: full decode vs draft mode vs pool.
+"""
+import os
+import resource
+import tempfile
+import time
+from io import BytesIO
+
+from PIL import Image
+
+from benchmarks import (
+    peak_rss_mb,
+    synthetic_photo,
+)
+from patients import decoding
+
+DEFAULTS = {
+    'images': 8,
+    'width': 4000,
+    'height': 3000,
+    'max_edge': 256,
+    'workers': 0,
+}
+
+
+def _full_decode_thumbnail(path, max_edge):
+    with Image.open(path) as image:
+        image = image.convert('RGB')
+    image.thumbnail((max_edge, max_edge), Image.BILINEAR)
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def _children_peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+
+def _rate(count, fn):
+    started = time.perf_counter()
+    fn()
+    return count / (time.perf_counter() - started)
+
+
+def run(images, width, height, max_edge, workers):
+    with tempfile.TemporaryDirectory() as corpus:
+        paths = []
+        for seed in range(images):
+            path = os.path.join(corpus, f'{seed}.jpg')
+            synthetic_photo(width, height, seed).save(path, quality=90)
+            paths.append(path)
+
+        full = _rate(images, lambda: [
+            _full_decode_thumbnail(path, max_edge) for path in paths
+        ])
+        full_rss = peak_rss_mb()
+        draft = _rate(images, lambda: [
+            decoding.thumbnail(path, max_edge) for path in paths
+        ])
+        with decoding.DecoderPool(workers=workers or None) as pool:
+            pooled = _rate(images, lambda: list(
+                pool.thumbnails(paths, max_edge)
+            ))
+            pool_workers = pool.workers
+
+    return {
+        'full_decode_images_per_second': full,
+        'draft_images_per_second': draft,
+        'pool_images_per_second': pooled,
+        'pool_workers': pool_workers,
+        'draft_speedup': draft / full,
+        'peak_rss_mb': peak_rss_mb(),
+        'full_decode_peak_rss_mb': full_rss,
+        'worker_peak_rss_mb': _children_peak_rss_mb(),
+    }
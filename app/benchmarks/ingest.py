@@ -0,0 +1,67 @@
+"""
+Benchmark of upload normalization: bytes saved and decode time.
+"""
+import time
+from io import BytesIO
+
+from PIL import Image
+
+from benchmarks import synthetic_photo
+from patients.ingest import normalize_image
+
+DEFAULTS = {
+    'images': 5,
+    'width': 4000,
+    'height': 3000,
+    'quality': 95,
+    'max_edge': 1600,
+}
+
+EXIF_ORIENTATION = 0x0112
+
+
+def _camera_jpeg(width, height, quality, seed):
+    """Return the bytes of a camera-like JPEG rotated through EXIF."""
+    image = synthetic_photo(width, height, seed)
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = 6
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=quality, exif=exif.tobytes())
+    buffer.name = f'camera-{seed}.jpg'
+    buffer.seek(0)
+    return buffer
+
+
+def _decode_seconds(data):
+    started = time.perf_counter()
+    with Image.open(BytesIO(data)) as image:
+        image.load()
+    return time.perf_counter() - started
+
+
+def run(images, width, height, quality, max_edge):
+    original_bytes = 0
+    normalized_bytes = 0
+    original_decode = 0.0
+    normalized_decode = 0.0
+    normalize_seconds = 0.0
+    for seed in range(images):
+        upload = _camera_jpeg(width, height, quality, seed)
+        original = upload.getvalue()
+        started = time.perf_counter()
+        normalized = normalize_image(upload, max_edge=max_edge).read()
+        normalize_seconds += time.perf_counter() - started
+        original_bytes += len(original)
+        normalized_bytes += len(normalized)
+        original_decode += _decode_seconds(original)
+        normalized_decode += _decode_seconds(normalized)
+
+    return {
+        'original_bytes': original_bytes,
+        'normalized_bytes': normalized_bytes,
+        'bytes_saved_ratio': 1 - normalized_bytes / original_bytes,
+        'original_decode_ms': original_decode / images * 1000,
+        'normalized_decode_ms': normalized_decode / images * 1000,
+        'decode_speedup': original_decode / normalized_decode,
+        'normalize_ms': normalize_seconds / images * 1000,
+    }
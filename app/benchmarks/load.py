@@ -0,0 +1,416 @@
+"""
+Load test of a running server replaying mobile app scenarios.
+
+Each virtual user logs in as one of the users created by the
+seed_synthetic command and replays a weighted mix of scenarios on its
+own keep-alive HTTP/1.1 connection, from an asyncio client built on the
+standard library. Throughput, latency percentiles, status codes and
+error rates are reported per scenario. Logins count against the login
+throttle of the server, so keep their weight low or raise its bursts.
+Uploads replace the images of the seeded patients, so only point it at
+a disposable server.
+"""
+import asyncio
+import json
+import ssl
+import time
+import urllib.parse
+import uuid
+from io import BytesIO
+
+import numpy as np
+
+from benchmarks import synthetic_face
+
+DEFAULTS = {
+    'url': 'http://127.0.0.1:8000',
+    'users': 10,
+    'seed': 0,
+    'password': 'password123',
+    'concurrency': 10,
+    'duration': 30.0,
+    'requests': 0,
+    'scenarios': [
+        'login', 'roster', 'detail', 'tag_filter', 'upload', 'identify',
+    ],
+    'weights': [1, 40, 30, 15, 4, 10],
+    'faces': 16,
+    'face_size': 256,
+    'timeout': 30.0,
+}
+
+TOKEN_URL = '/api/user/token/'
+PATIENTS_URL = '/api/patients/patientss/'
+TAGS_URL = '/api/patients/tags/'
+PERCENTILES = (50, 90, 95, 99)
+
+
+class Connection:
+    """Keep-alive HTTP/1.1 connection to one server."""
+
+    def __init__(self, url, timeout):
+        parts = urllib.parse.urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.ssl = ssl.create_default_context() if (
+            parts.scheme == 'https'
+        ) else None
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def request(self, method, path, headers=None, body=b''):
+        """Send a request and return its status, headers and body.
+
+        A reused connection closed by the server is reopened once.
+        """
+        while True:
+            reused = self.writer is not None
+            if not reused:
+                self.reader, self.writer = await asyncio.open_connection(
+                    self.host, self.port, ssl=self.ssl,
+                )
+            try:
+                return await asyncio.wait_for(
+                    self._exchange(method, path, headers or {}, body),
+                    self.timeout,
+                )
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if not reused:
+                    raise
+            except BaseException:
+                self.close()
+                raise
+
+    async def _exchange(self, method, path, headers, body):
+        lines = [
+            f'{method} {self.prefix}{path} HTTP/1.1',
+            f'Host: {self.netloc}',
+            f'Content-Length: {len(body)}',
+        ]
+        lines.extend(f'{name}: {value}' for name, value in headers.items())
+        self.writer.write(
+            ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+        )
+        await self.writer.drain()
+
+        status_line = await self.reader.readuntil(b'\r\n')
+        version, status = status_line.split()[:2]
+        response_headers = {}
+        while True:
+            line = await self.reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        connection = response_headers.get('connection', '').lower()
+        keep_alive = connection != 'close' and (
+            version == b'HTTP/1.1' or connection == 'keep-alive'
+        )
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            data = await self._read_chunked()
+        elif 'content-length' in response_headers:
+            data = await self.reader.readexactly(
+                int(response_headers['content-length'])
+            )
+        elif int(status) in (204, 304) or method == 'HEAD':
+            data = b''
+        else:
+            data = await self.reader.read()
+            keep_alive = False
+        if not keep_alive:
+            self.close()
+
+        return int(status), response_headers, data
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            line = await self.reader.readuntil(b'\r\n')
+            size = int(line.split(b';')[0], 16)
+            if size == 0:
+                while await self.reader.readuntil(b'\r\n') != b'\r\n':
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)
+
+
+def multipart(files, fields=None):
+    """Encode (name, filename, bytes) files and form fields.
+
+    Returns the content type and the body.
+    """
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in (fields or {}).items():
+        parts.append((
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f'{value}\r\n'
+        ).encode())
+    for name, filename, data in files:
+        parts.append((
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{name}"; '
+            f'filename="{filename}"\r\n'
+            'Content-Type: image/jpeg\r\n\r\n'
+        ).encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+
+    return f'multipart/form-data; boundary={boundary}', b''.join(parts)
+
+
+class Session:
+    """Virtual user replaying scenarios on its own connection."""
+
+    def __init__(self, connection, email, password, rng, faces):
+        self.connection = connection
+        self.email = email
+        self.password = password
+        self.rng = rng
+        self.faces = faces
+        self.token = None
+        self.patients = []
+        self.tags = []
+
+    async def call(self, method, path, body=b'', content_type=None):
+        """Send an API request, authenticated once logged in."""
+        headers = {'Accept': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Token {self.token}'
+        if content_type:
+            headers['Content-Type'] = content_type
+        status, _, data = await self.connection.request(
+            method, path, headers, body,
+        )
+        return status, data
+
+    async def setup(self):
+        """Log in and load the patients and tags the scenarios pick from."""
+        status = await login(self)
+        if status != 200:
+            return status
+        status, data = await self.call('GET', TAGS_URL)
+        if status == 200:
+            self.tags = [tag['id'] for tag in json.loads(data)]
+        return await roster(self)
+
+    def choose(self, items):
+        return items[self.rng.integers(len(items))]
+
+    def face(self):
+        return self.choose(self.faces)
+
+
+async def login(session):
+    """Log in with email and password."""
+    status, data = await session.call(
+        'POST',
+        TOKEN_URL,
+        urllib.parse.urlencode({
+            'email': session.email,
+            'password': session.password,
+        }).encode(),
+        'application/x-www-form-urlencoded',
+    )
+    if status == 200:
+        session.token = json.loads(data)['token']
+    return status
+
+
+async def roster(session):
+    """List every patients of the user."""
+    status, data = await session.call('GET', PATIENTS_URL)
+    if status == 200:
+        session.patients = [
+            patients['id'] for patients in json.loads(data)
+        ] or session.patients
+    return status
+
+
+async def detail(session):
+    """Open one patients."""
+    if not session.patients:
+        return await roster(session)
+    patients_id = session.choose(session.patients)
+    status, _ = await session.call('GET', f'{PATIENTS_URL}{patients_id}/')
+    return status
+
+
+async def tag_filter(session):
+    """List the patients with one or two tags."""
+    if not session.tags:
+        return await roster(session)
+    tags = {session.choose(session.tags) for _ in range(2)}
+    status, _ = await session.call(
+        'GET',
+        f'{PATIENTS_URL}?tags={",".join(map(str, sorted(tags)))}',
+    )
+    return status
+
+
+async def upload(session):
+    """Replace the image of one patients."""
+    if not session.patients:
+        return await roster(session)
+    patients_id = session.choose(session.patients)
+    content_type, body = multipart([('image', 'face.jpg', session.face())])
+    status, _ = await session.call(
+        'POST',
+        f'{PATIENTS_URL}{patients_id}/upload-image/',
+        body,
+        content_type,
+    )
+    return status
+
+
+async def identify(session):
+    """Identify the face of a photo among the user's patients."""
+    content_type, body = multipart([('image', 'probe.jpg', session.face())])
+    status, _ = await session.call(
+        'POST',
+        f'{PATIENTS_URL}identify/',
+        body,
+        content_type,
+    )
+    return status
+
+
+SCENARIOS = {
+    'login': login,
+    'roster': roster,
+    'detail': detail,
+    'tag_filter': tag_filter,
+    'upload': upload,
+    'identify': identify,
+}
+
+
+def _faces(seed, count, size):
+    """Return JPEG photos of faces of the seed_synthetic face pool."""
+    photos = []
+    for number in range(count):
+        buffer = BytesIO()
+        synthetic_face(size, (seed, number)).save(
+            buffer, format='JPEG', quality=90,
+        )
+        photos.append(buffer.getvalue())
+    return photos
+
+
+def summarize(samples, elapsed):
+    """Describe (status, seconds) samples of one scenario."""
+    statuses = {}
+    for status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    errors = sum(
+        1 for status, _ in samples
+        if not isinstance(status, int) or status >= 400
+    )
+    latencies = np.asarray([seconds for _, seconds in samples]) * 1000
+    summary = {
+        'requests': len(samples),
+        'throughput_rps': len(samples) / elapsed if elapsed else 0.0,
+        'errors': errors,
+        'error_rate': errors / len(samples) if samples else 0.0,
+        'status': statuses,
+    }
+    if samples:
+        summary['latency_ms'] = {
+            f'p{percentile}': float(np.percentile(latencies, percentile))
+            for percentile in PERCENTILES
+        }
+        summary['latency_ms']['mean'] = float(latencies.mean())
+        summary['latency_ms']['max'] = float(latencies.max())
+
+    return summary
+
+
+async def _timed(samples, name, call, session):
+    started = time.perf_counter()
+    try:
+        status = await call(session)
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+            ValueError) as error:
+        status = type(error).__name__
+    samples.setdefault(name, []).append(
+        (status, time.perf_counter() - started),
+    )
+    return status
+
+
+async def _run(
+    url, users, seed, password, concurrency, duration, requests,
+    scenarios, weights, faces, face_size, timeout,
+):
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise ValueError(f'Unknown scenarios {", ".join(unknown)}.')
+    if len(weights) != len(scenarios):
+        raise ValueError('Give one weight per scenario.')
+    probabilities = np.asarray(weights, dtype=float)
+    probabilities /= probabilities.sum()
+    photos = _faces(seed, faces, face_size)
+    samples = {}
+    failed = []
+    issued = 0
+    started = time.perf_counter()
+    deadline = started + duration
+
+    async def worker(number):
+        nonlocal issued
+        session = Session(
+            Connection(url, timeout),
+            f'synthetic-{seed}-{number % users}@example.com',
+            password,
+            np.random.default_rng((seed, number)),
+            photos,
+        )
+        try:
+            status = await _timed(samples, 'setup', Session.setup, session)
+            if status != 200:
+                failed.append(status)
+                return
+            while time.perf_counter() < deadline and (
+                not requests or issued < requests
+            ):
+                issued += 1
+                name = scenarios[session.rng.choice(
+                    len(scenarios), p=probabilities,
+                )]
+                await _timed(samples, name, SCENARIOS[name], session)
+        finally:
+            session.connection.close()
+
+    await asyncio.gather(*(worker(number) for number in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    measured = [
+        sample
+        for name, scenario_samples in samples.items()
+        if name != 'setup'
+        for sample in scenario_samples
+    ]
+    return {
+        'elapsed': elapsed,
+        'failed_sessions': len(failed),
+        'total': summarize(measured, elapsed),
+        'scenarios': {
+            name: summarize(scenario_samples, elapsed)
+            for name, scenario_samples in sorted(samples.items())
+        },
+    }
+
+
+def run(**params):
+    return asyncio.run(_run(**params))
@@ -0,0 +1,90 @@
+"""
+Benchmark of quantized galleries: memory, recall@k and latency.
+"""
+import time
+
+import numpy as np
+
+from patients.matcher import Gallery
+from patients.quantization import INDEXES
+
+DEFAULTS = {
+    'gallery': 100000,
+    'dim': 128,
+    'probes': 200,
+    'noise': 0.6,
+    'k': 10,
+    'rerank': 50,
+    'methods': ['float32', 'float16', 'int8', 'pq'],
+    'seed': 0,
+}
+
+
+def _unit(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def synthetic_gallery(size, dim, seed=0):
+    """Return a matrix of random unit embeddings."""
+    rng = np.random.default_rng(seed)
+    return _unit(rng.standard_normal((size, dim)).astype(np.float32))
+
+
+def noisy_probes(gallery, count, noise, seed=0):
+    """Return noisy copies of random gallery rows and their row numbers."""
+    rng = np.random.default_rng(seed + 1)
+    truth = rng.choice(len(gallery), count, replace=False)
+    probes = gallery[truth] + noise * _unit(
+        rng.standard_normal((count, gallery.shape[1])).astype(np.float32)
+    )
+    return _unit(probes).astype(np.float32), truth
+
+
+def run(gallery, dim, probes, noise, k, rerank, methods, seed):
+    vectors = synthetic_gallery(gallery, dim, seed)
+    queries, truth = noisy_probes(vectors, probes, noise, seed)
+    ids = np.arange(gallery)
+    exact_top1 = (queries @ vectors.T).argmax(axis=1)
+    float32_bytes = vectors.nbytes
+
+    results = {}
+    for method in methods:
+        if method not in INDEXES:
+            raise ValueError(f'Unknown method {method}.')
+        started = time.perf_counter()
+        matcher = Gallery.from_vectors(
+            ids,
+            vectors,
+            method,
+            exact_loader=lambda rows: vectors[rows],
+            rerank=rerank,
+        )
+        build_seconds = time.perf_counter() - started
+
+        first_pass, _ = matcher.index.top(queries, k)
+        first_pass_recall = float(np.mean([
+            top1 in row for top1, row in zip(exact_top1, first_pass)
+        ]))
+
+        started = time.perf_counter()
+        matches = matcher.search(queries, k=k)
+        search_seconds = time.perf_counter() - started
+        recall = float(np.mean([
+            top1 in [row for row, _ in match]
+            for top1, match in zip(exact_top1, matches)
+        ]))
+        top1_accuracy = float(np.mean([
+            match[0][0] == expected for expected, match in zip(truth, matches)
+        ]))
+
+        results[method] = {
+            'nbytes': int(matcher.index.nbytes),
+            'memory_reduction': float32_bytes / matcher.index.nbytes,
+            'build_seconds': build_seconds,
+            f'first_pass_recall_at_{k}': first_pass_recall,
+            f'recall_at_{k}': recall,
+            'top1_accuracy': top1_accuracy,
+            'search_ms_per_probe': search_seconds / probes * 1000,
+        }
+
+    return results
@@ -0,0 +1,158 @@
+"""
+Benchmark of the recognition path against synthetic galleries.
+
+For every gallery size and matcher it reports the index build rate,
+single-probe identification latency percentiles and recall against the
+exact float32 search. Enrollment throughput covers decoding synthetic
+JPEG faces, embedding their largest face with the configured extractor
+and storing the embeddings, in a transaction that is rolled back at the
+end.
+"""
+import time
+import uuid
+from io import BytesIO
+
+import numpy as np
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from benchmarks import synthetic_face
+from benchmarks.quantization import (
+    noisy_probes,
+    synthetic_gallery,
+)
+from core.models import FaceEmbedding, Patients
+from patients.faces import (
+    embed_largest_faces,
+    get_extractor,
+    load_images,
+)
+from patients.matcher import Gallery
+
+DEFAULTS = {
+    'sizes': [10000, 100000],
+    'dim': 128,
+    'probes': 200,
+    'noise': 0.8,
+    'k': 10,
+    'matchers': ['float32', 'ivf', 'int8', 'pq'],
+    'enroll_images': 2000,
+    'enroll_face_size': 256,
+    'seed': 0,
+}
+
+
+def _percentiles(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        f'p{p}_ms': float(np.percentile(samples, p)) for p in (50, 95, 99)
+    }
+
+
+def _jpegs(images, size, seed):
+    datas = []
+    for number in range(images):
+        buffer = BytesIO()
+        synthetic_face(size, (seed, number)).save(
+            buffer, format='JPEG', quality=90,
+        )
+        datas.append(buffer.getvalue())
+    return datas
+
+
+def enrollment_throughput(images, size, seed=0):
+    """Return faces enrolled per second, in batches of 64.
+
+    Every batch of synthetic JPEGs is decoded, its largest faces embedded
+    and the embeddings bulk inserted, like enroll_faces does.
+    """
+    extractor = get_extractor()
+    datas = _jpegs(images, size, seed)
+    with transaction.atomic():
+        user = get_user_model().objects.create_user(
+            f'benchmark-{uuid.uuid4().hex}@example.com',
+            'password123',
+        )
+        Patients.objects.bulk_create(
+            Patients(user=user, first_name=f'first {i}', last_name='last',
+                     age=30)
+            for i in range(images)
+        )
+        patients = list(Patients.objects.filter(user=user).order_by('pk'))
+        started = time.perf_counter()
+        for start in range(0, images, 64):
+            loaded, _, _ = load_images([
+                BytesIO(data) for data in datas[start:start + 64]
+            ])
+            vectors, qualities = embed_largest_faces(loaded, extractor)
+            FaceEmbedding.objects.bulk_create(
+                FaceEmbedding(
+                    user=user,
+                    patients=face_patients,
+                    vector=vector.tobytes(),
+                    quality=quality,
+                    extractor_version=extractor.version,
+                )
+                for face_patients, vector, quality in zip(
+                    patients[start:start + 64], vectors, qualities,
+                )
+            )
+        elapsed = time.perf_counter() - started
+        transaction.set_rollback(True)
+
+    return images / elapsed
+
+
+def run(sizes, dim, probes, noise, k, matchers, enroll_images,
+        enroll_face_size, seed):
+    results = {
+        'enrollment_faces_per_second': enrollment_throughput(
+            enroll_images, enroll_face_size, seed,
+        ),
+        'galleries': {},
+    }
+    for size in sizes:
+        vectors = synthetic_gallery(size, dim, seed)
+        queries, _ = noisy_probes(vectors, probes, noise, seed)
+        exact = queries @ vectors.T
+        truth = np.argpartition(-exact, k - 1, axis=1)[:, :k]
+        truth_top1 = exact.argmax(axis=1)
+        del exact
+        ids = np.arange(size)
+
+        by_matcher = {}
+        for matcher in matchers:
+            started = time.perf_counter()
+            gallery = Gallery.from_vectors(
+                ids,
+                vectors,
+                matcher,
+                exact_loader=lambda rows: vectors[rows],
+            )
+            build_seconds = time.perf_counter() - started
+
+            latencies = []
+            found = []
+            for query in queries:
+                started = time.perf_counter()
+                [match] = gallery.search(query[None, :], k=k)
+                latencies.append(time.perf_counter() - started)
+                found.append([row for row, _ in match])
+
+            by_matcher[matcher] = {
+                'nbytes': int(gallery.index.nbytes),
+                'build_vectors_per_second': size / build_seconds,
+                'latency': _percentiles(latencies),
+                'recall_at_1': float(np.mean([
+                    bool(rows) and rows[0] == top1
+                    for rows, top1 in zip(found, truth_top1)
+                ])),
+                f'recall_at_{k}': float(np.mean([
+                    len(set(rows) & set(expected)) / k
+                    for rows, expected in zip(found, truth)
+                ])),
+            }
+        results['galleries'][str(size)] = by_matcher
+
+    return results
@@ -50,3 +50,10 @@ admin.site.register(models.Patients)
 # admin.site.register(models.Patient)
 admin.site.register(models.Tag)
 admin.site.register(models.Treatment)
+admin.site.register(models.FaceEmbedding)
+admin.site.register(models.ImageBlob)
+admin.site.register(models.PatientsImage)
+admin.site.register(models.FaceTemplate)
+admin.site.register(models.FaceExtractorVersion)
+admin.site.register(models.RefreshToken)
+admin.site.register(models.AuthTokenInfo)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from core.models import Patients, PatientsImage
+        from core.storage import track_blob_references
+
+        track_blob_references(Patients, 'image')
+        track_blob_references(PatientsImage, 'image')
@@ -0,0 +1,45 @@
+"""
+Django command to run an offline benchmark suite.
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+import benchmarks
+
+
+class Command(BaseCommand):
+    """Django command to run a benchmark suite and report JSON."""
+
+    help = 'Run an offline benchmark suite and write its results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=sorted(benchmarks.SUITES))
+        parser.add_argument(
+            '--param',
+            action='append',
+            default=[],
+            help='Suite parameter as name=value, may be repeated.',
+        )
+        parser.add_argument('--output', help='File to write results to.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        suite = benchmarks.get_suite(options['suite'])
+        try:
+            params = benchmarks.parse_params(suite, options['param'])
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        report = json.dumps(
+            benchmarks.run_suite(options['suite'], params),
+            indent=2,
+        )
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report + '\n')
+            self.stdout.write(self.style.SUCCESS(
+                f'Results written to {options["output"]}.'
+            ))
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,91 @@
+"""
+Django command to reclaim unreferenced image blobs.
+"""
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import (
+    ImageBlob,
+    Patients,
+)
+from core.storage import (
+    BLOB_DIR,
+    blob_digest,
+)
+
+
+class Command(BaseCommand):
+    """Django command to delete blobs that nothing references.
+
+    Blobs written or reused within the grace period are kept, so uploads
+    that have stored their file but not yet saved their row are safe.
+    """
+
+    help = 'Delete image blobs that are no longer referenced.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=settings.IMAGE_BLOB_GRACE_SECONDS,
+            help='Seconds a blob is kept after it was last written.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be deleted.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        storage = Patients._meta.get_field('image').storage
+        grace = options['grace']
+        dry_run = options['dry_run']
+        deleted = 0
+        reclaimed = 0
+        for name in self._blob_names(storage):
+            if storage.age(name) < grace:
+                continue
+            digest = blob_digest(name)
+            with transaction.atomic():
+                blob = ImageBlob.objects.select_for_update().filter(
+                    digest=digest,
+                ).first()
+                if blob is not None and blob.refcount > 0:
+                    continue
+                if not storage.exists(name) or storage.age(name) < grace:
+                    continue
+                size = storage.size(name)
+                if not dry_run:
+                    storage.purge(name)
+                    if blob is not None:
+                        blob.delete()
+            deleted += 1
+            reclaimed += size
+
+        if not dry_run:
+            for blob in ImageBlob.objects.filter(refcount__lte=0).iterator():
+                if not storage.exists(blob.name):
+                    ImageBlob.objects.filter(
+                        pk=blob.pk,
+                        refcount__lte=0,
+                    ).delete()
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {deleted} blob(s), {reclaimed} bytes.'
+        ))
+
+    def _blob_names(self, storage):
+        """Yield the storage names of every blob on disk."""
+        root = storage.path(BLOB_DIR)
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, storage.location)
+                if filename.endswith('.part'):
+                    continue
+                yield name.replace(os.sep, '/')
@@ -0,0 +1,51 @@
+"""
+Django command to precompute the OpenAPI schema.
+"""
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import schema
+
+
+class Command(BaseCommand):
+    """Django command to write the schema of the current code version.
+
+    Nothing is generated when the schema of the version exists already.
+    Schemas of other versions are deleted.
+    """
+
+    help = 'Precompute the OpenAPI schema of the current code version.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Generate the schema even if it exists.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        version = schema.code_version()
+        paths = [
+            schema.path(version, renderer.format)
+            for renderer in schema.RENDERERS
+        ]
+        if options['force'] or not all(map(os.path.exists, paths)):
+            schema.write(version=version)
+            self.stdout.write(self.style.SUCCESS(
+                f'Schema of version {version} written.'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Schema of version {version} is up to date.'
+            ))
+
+        extensions = tuple(
+            f'.{renderer.format}' for renderer in schema.RENDERERS
+        )
+        for filename in os.listdir(settings.SCHEMA_CACHE_DIR):
+            stale = os.path.join(settings.SCHEMA_CACHE_DIR, filename)
+            if filename.endswith(extensions) and stale not in paths:
+                os.remove(stale)
@@ -0,0 +1,196 @@
+"""
+Process metrics exposed in the Prometheus text format.
+
+Each process counts in memory. With METRICS_DIR set, every process writes
+a snapshot of its metrics to its own file there at most every
+METRICS_FLUSH_INTERVAL seconds, and the metrics view adds up the files of
+all processes, so any worker can answer a scrape. Files of processes that
+exited are kept so their counts are not lost; clear the directory when
+the server is restarted.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# Name: (type, help, buckets of histograms).
+METRICS = {
+    'http_requests_total': (
+        'counter', 'Requests by view, method and status.', None,
+    ),
+    'http_request_duration_seconds': (
+        'histogram', 'Request latency by view and method.', LATENCY_BUCKETS,
+    ),
+    'http_response_size_bytes': (
+        'histogram', 'Response body size by view and method.', SIZE_BUCKETS,
+    ),
+    'http_request_db_queries': (
+        'histogram', 'SQL queries per request by view and method.',
+        QUERY_BUCKETS,
+    ),
+    'http_request_db_seconds_total': (
+        'counter', 'Time spent in SQL queries by view and method.', None,
+    ),
+    'login_rejections_total': (
+        'counter', 'Login attempts rejected by reason.', None,
+    ),
+}
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Registry:
+    """Counters and histograms of one process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.flushed = 0
+
+    def inc(self, name, labels, value=1):
+        """Add to a counter."""
+        key = (name, _labels_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        """Record a value in a histogram."""
+        buckets = METRICS[name][2]
+        key = (name, _labels_key(labels))
+        with self.lock:
+            counts = self.histograms.get(key)
+            if counts is None:
+                counts = self.histograms[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(buckets)] += 1
+            counts[-1] += value
+
+    def snapshot(self):
+        """Return the metrics as JSON serializable lists."""
+        with self.lock:
+            return {
+                'counters': [
+                    [name, list(labels), value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                'histograms': [
+                    [name, list(labels), list(counts)]
+                    for (name, labels), counts in self.histograms.items()
+                ],
+            }
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def flush(self, force=False):
+        """Write the snapshot file of this process when one is due."""
+        directory = settings.METRICS_DIR
+        now = time.monotonic()
+        if not directory or (
+            not force
+            and now - self.flushed < settings.METRICS_FLUSH_INTERVAL
+        ):
+            return
+        self.flushed = now
+        os.makedirs(directory, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as snapshot_file:
+            json.dump(self.snapshot(), snapshot_file)
+        os.replace(temp, os.path.join(directory, f'{os.getpid()}.json'))
+
+
+registry = Registry()
+
+
+def collect():
+    """Return the snapshots of every process, this one included."""
+    directory = settings.METRICS_DIR
+    if not directory:
+        return [registry.snapshot()]
+    registry.flush(force=True)
+    snapshots = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as snapshot_file:
+                snapshots.append(json.load(snapshot_file))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def merge(snapshots):
+    """Add up snapshots into counters and histograms by key."""
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, counts in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            total = histograms.setdefault(key, [0] * len(counts))
+            for i, count in enumerate(counts):
+                total[i] += count
+    return counters, histograms
+
+
+def _escape(value):
+    return (
+        str(value).replace('\\', '\\\\').replace('"', '\\"')
+        .replace('\n', '\\n')
+    )
+
+
+def _series(name, labels, value):
+    if labels:
+        text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels)
+        return f'{name}{{{text}}} {value}'
+    return f'{name} {value}'
+
+
+def render(snapshots):
+    """Return the Prometheus text exposition of snapshots."""
+    counters, histograms = merge(snapshots)
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(_series(name, labels, value))
+            continue
+        for (metric, labels), counts in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(_series(
+                    f'{name}_bucket',
+                    labels + (('le', bound),),
+                    cumulative,
+                ))
+            lines.append(_series(f'{name}_sum', labels, counts[-1]))
+            lines.append(_series(f'{name}_count', labels, cumulative))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,234 @@
+"""
+Middleware of the project.
+"""
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.urls import Resolver404, resolve
+
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+
+from core import profiling
+from core.metrics import registry
+from core.queries import QueryInspector
+
+query_logger = logging.getLogger('core.queries')
+
+
+class QueryCounter:
+    """Execute wrapper counting the queries of a request and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def view_label(request):
+    """Return the low cardinality name of the view of a request."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unmatched>'
+    return match.view_name
+
+
+def is_staff(request):
+    """Return whether a request was made by a staff user.
+
+    API views authenticate in the view, whose user is set on the request
+    once it has run.
+    """
+    return getattr(getattr(request, 'user', None), 'is_staff', False)
+
+
+def authenticates_staff(request):
+    """Return whether the credentials of a request are a staff user's.
+
+    Unlike is_staff, this runs before the view: the session user is
+    checked, then the authenticators of the API view the request routes
+    to.
+    """
+    if is_staff(request):
+        return True
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return False
+    view_class = getattr(match.func, 'cls', None)
+    api_request = Request(request)
+    for authenticator in getattr(view_class, 'authentication_classes', ()):
+        try:
+            result = authenticator().authenticate(api_request)
+        except APIException:
+            return False
+        if result is not None:
+            return getattr(result[0], 'is_staff', False)
+    return False
+
+
+def response_size(response):
+    """Return the body size of a response, None when unknown."""
+    if response.streaming:
+        length = response.get('Content-Length')
+        return int(length) if length else None
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    """Record the latency, SQL queries, size and status of requests."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        labels = {'view': view_label(request), 'method': request.method}
+        registry.inc(
+            'http_requests_total',
+            {**labels, 'status': str(response.status_code)},
+        )
+        registry.observe('http_request_duration_seconds', labels, duration)
+        registry.observe('http_request_db_queries', labels, queries.count)
+        registry.inc('http_request_db_seconds_total', labels, queries.duration)
+        size = response_size(response)
+        if size is not None:
+            registry.observe('http_response_size_bytes', labels, size)
+        registry.flush()
+
+        return response
+
+
+class QueryInspectionMiddleware:
+    """Report slow and repeated SQL queries of a sample of requests.
+
+    A QUERY_INSPECTION_RATE fraction of requests is inspected and the
+    findings are logged as JSON to the core.queries logger. With
+    QUERY_INSPECTION_HEADERS, staff users also get them in X-Query-*
+    response headers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.QUERY_INSPECTION_RATE
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return self.get_response(request)
+
+        inspector = QueryInspector()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(inspector))
+            response = self.get_response(request)
+
+        findings = inspector.findings()
+        view = view_label(request)
+        for finding in findings:
+            query_logger.warning(json.dumps({
+                'view': view,
+                'method': request.method,
+                'path': request.path,
+                **finding,
+            }))
+        if settings.QUERY_INSPECTION_HEADERS and is_staff(request):
+            self._add_headers(response, inspector, findings)
+
+        return response
+
+    def _add_headers(self, response, inspector, findings):
+        response['X-Query-Count'] = len(inspector.queries)
+        response['X-Query-Time-Ms'] = f'{inspector.total_ms:.1f}'
+        for kind, header in (
+            ('slow_query', 'X-Query-Slow'),
+            ('repeated_query', 'X-Query-Repeated'),
+        ):
+            found = [
+                finding for finding in findings if finding['kind'] == kind
+            ]
+            if found:
+                response[header] = '; '.join(
+                    '{} x{} in {}'.format(
+                        finding['serializer'] or finding['code'] or '-',
+                        finding.get('count', 1),
+                        finding['handler'] or '-',
+                    )
+                    for finding in found
+                )
+
+
+class ProfilingMiddleware:
+    """Profile requests asked for by staff users and a sample of all.
+
+    Staff users add ?_profile=cprofile or ?_profile=alloc to get the
+    report in place of the response, or send an X-Profile header with the
+    same values to keep the response and have the report written to
+    PROFILING_DIR, named in the X-Profile-Report header. Credentials are
+    checked before the profiler starts and other users are refused. A
+    PROFILING_SAMPLE_RATE fraction of requests is profiled with cProfile
+    into PROFILING_DIR.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = request.META.get('HTTP_X_PROFILE')
+        inline = (
+            '_profile' in request.META.get('QUERY_STRING', '')
+            and '_profile' in request.GET
+        )
+        if inline:
+            mode = request.GET['_profile']
+        rate = settings.PROFILING_SAMPLE_RATE
+        sampled = rate > 0 and random.random() < rate
+        requested = mode in profiling.PROFILERS
+        if not requested and not sampled:
+            return self.get_response(request)
+        if requested and not authenticates_staff(request):
+            return HttpResponseForbidden('Profiling is for staff users.')
+
+        profiler = profiling.PROFILERS[mode if requested else 'cprofile']()
+        try:
+            profiler.start()
+        except profiling.ProfilerBusy as error:
+            return HttpResponse(str(error), status=503)
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+
+        if sampled:
+            profiling.dump(profiler, view_label(request))
+        if not requested:
+            return response
+        if inline:
+            return HttpResponse(
+                profiler.report(),
+                content_type='text/plain; charset=utf-8',
+            )
+        response['X-Profile'] = f'{mode} {profiler.summary()}'
+        response['X-Profile-Report'] = profiling.dump(
+            profiler, view_label(request),
+        )
+        return response
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_patients_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vector', models.BinaryField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('patients', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='face_embeddings', to='core.patients')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_face_embedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patients',
+            name='image_hash',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='patients',
+            name='image_hash_0',
+            field=models.PositiveIntegerField(db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='patients',
+            name='image_hash_1',
+            field=models.PositiveIntegerField(db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='patients',
+            name='image_hash_2',
+            field=models.PositiveIntegerField(db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='patients',
+            name='image_hash_3',
+            field=models.PositiveIntegerField(db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:44
+
+import core.models
+import core.storage
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import numpy as np
+
+
+def build_templates(apps, schema_editor):
+    """Build one template per patients from its existing embeddings."""
+    FaceEmbedding = apps.get_model('core', 'FaceEmbedding')
+    FaceTemplate = apps.get_model('core', 'FaceTemplate')
+    vectors = {}
+    for user_id, patients_id, vector in FaceEmbedding.objects.order_by(
+        'patients_id',
+    ).values_list('user_id', 'patients_id', 'vector').iterator():
+        vectors.setdefault((user_id, patients_id), []).append(
+            np.frombuffer(bytes(vector), dtype=np.float32)
+        )
+    templates = []
+    for (user_id, patients_id), rows in vectors.items():
+        template = np.mean(rows, axis=0)
+        template /= np.linalg.norm(template) + 1e-12
+        templates.append(FaceTemplate(
+            user_id=user_id,
+            patients_id=patients_id,
+            vector=template.astype(np.float32).tobytes(),
+            image_count=len(rows),
+        ))
+    FaceTemplate.objects.bulk_create(templates, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_image_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceembedding',
+            name='quality',
+            field=models.FloatField(default=1.0),
+        ),
+        migrations.CreateModel(
+            name='PatientsImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(storage=core.storage.ContentAddressedStorage(), upload_to=core.models.patients_image_file_path)),
+                ('image_hash', models.BigIntegerField(blank=True, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('patients', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='core.patients')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FaceTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vector', models.BinaryField()),
+                ('image_count', models.PositiveIntegerField(default=1)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('patients', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='face_template', to='core.patients')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='faceembedding',
+            name='patients_image',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='face_embeddings', to='core.patientsimage'),
+        ),
+        migrations.RunPython(build_templates, migrations.RunPython.noop),
+    ]
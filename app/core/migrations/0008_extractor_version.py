@@ -0,0 +1,60 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def activate_existing(apps, schema_editor):
+    """Serve the embeddings stored before versions were recorded."""
+    FaceEmbedding = apps.get_model('core', 'FaceEmbedding')
+    FaceExtractorVersion = apps.get_model('core', 'FaceExtractorVersion')
+    if FaceEmbedding.objects.exists():
+        FaceExtractorVersion.objects.create(
+            version='pixproj-1',
+            active=True,
+            activated=timezone.now(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_face_template'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceExtractorVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=64, unique=True)),
+                ('active', models.BooleanField(default=False)),
+                ('checkpoint', models.BigIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('activated', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='faceembedding',
+            name='extractor_version',
+            field=models.CharField(db_index=True, default='pixproj-1', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='facetemplate',
+            name='extractor_version',
+            field=models.CharField(db_index=True, default='pixproj-1', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='facetemplate',
+            name='patients',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='face_templates', to='core.patients'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='facetemplate',
+            unique_together={('patients', 'extractor_version')},
+        ),
+        migrations.RunPython(activate_existing, migrations.RunPython.noop),
+    ]
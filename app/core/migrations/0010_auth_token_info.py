@@ -0,0 +1,42 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:08
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def expire_existing(apps, schema_editor):
+    """Give existing tokens a full lifetime from now."""
+    Token = apps.get_model('authtoken', 'Token')
+    AuthTokenInfo = apps.get_model('core', 'AuthTokenInfo')
+    expires = timezone.now() + timedelta(seconds=settings.AUTH_TOKEN_TTL)
+    AuthTokenInfo.objects.bulk_create(
+        (
+            AuthTokenInfo(token_id=key, expires=expires)
+            for key in Token.objects.values_list('key', flat=True).iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authtoken', '0003_tokenproxy'),
+        ('core', '0009_refresh_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthTokenInfo',
+            fields=[
+                ('token', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='info', serialize=False, to='authtoken.token')),
+                ('expires', models.DateTimeField(db_index=True)),
+                ('last_used', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(expire_existing, migrations.RunPython.noop),
+    ]
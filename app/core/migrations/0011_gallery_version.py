@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_auth_token_info'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GalleryVersion',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='gallery_version', serialize=False, to='core.user')),
+                ('gallery', models.UUIDField(default=uuid.uuid4)),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:57
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_gallery_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='galleryversion',
+            name='filters',
+            field=models.UUIDField(default=uuid.uuid4),
+        ),
+    ]
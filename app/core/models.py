@@ -15,6 +15,8 @@ from django.contrib.auth.models import (
 from django.core.validators import RegexValidator
 # from address.models import AddressField
 
+from core.storage import ContentAddressedStorage
+
 
 def patients_image_file_path(instance, filename):
     """Generate file path for new patients image."""
@@ -109,6 +111,8 @@ class User(AbstractBaseUser, PermissionsMixin):
         )
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Incremented to revoke every access and refresh token of the user.
+    token_version = models.PositiveIntegerField(default=0)
 
     def greet(self):
         if self.gender == "Male":
@@ -139,7 +143,11 @@ class Patients(models.Model):
     link = models.CharField(max_length=255, blank=True)
     tags = models.ManyToManyField('Tag')
     treatment = models.ManyToManyField('Treatment')
-    image = models.ImageField(null=True, upload_to=patients_image_file_path)
+    image = models.ImageField(
+        null=True,
+        upload_to=patients_image_file_path,
+        storage=ContentAddressedStorage(),
+    )
     phone_regex = RegexValidator(regex=r'^\+?1?\d{9,15}$',
                                  message="Phone number must be entered "
                                  + "in the format:'+999999999'. Up" +
@@ -172,6 +180,12 @@ class Patients(models.Model):
 
     is_in_hospital = models.BooleanField(default=True)
 
+    image_hash = models.BigIntegerField(null=True, blank=True, db_index=True)
+    image_hash_0 = models.PositiveIntegerField(null=True, db_index=True)
+    image_hash_1 = models.PositiveIntegerField(null=True, db_index=True)
+    image_hash_2 = models.PositiveIntegerField(null=True, db_index=True)
+    image_hash_3 = models.PositiveIntegerField(null=True, db_index=True)
+
     def greet(self):
         if self.patient_gender == "Male":
             return 'Mr. ' + self.last_name
@@ -207,6 +221,161 @@ class Treatment(models.Model):
     def __str__(self):
         return self.name
 
+
+class ImageBlob(models.Model):
+    """Stored image file shared by every upload with the same content."""
+    digest = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255)
+    refcount = models.IntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class FaceEmbedding(models.Model):
+    """Face embedding extracted from a patients image."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    patients = models.ForeignKey(
+        Patients,
+        on_delete=models.CASCADE,
+        related_name='face_embeddings',
+    )
+    patients_image = models.ForeignKey(
+        'PatientsImage',
+        null=True,
+        on_delete=models.CASCADE,
+        related_name='face_embeddings',
+    )
+    vector = models.BinaryField()
+    quality = models.FloatField(default=1.0)
+    extractor_version = models.CharField(max_length=64, db_index=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.patients} embedding'
+
+
+class PatientsImage(models.Model):
+    """Additional image in the gallery of a patients."""
+    patients = models.ForeignKey(
+        Patients,
+        on_delete=models.CASCADE,
+        related_name='images',
+    )
+    image = models.ImageField(
+        upload_to=patients_image_file_path,
+        storage=ContentAddressedStorage(),
+    )
+    image_hash = models.BigIntegerField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.patients} image'
+
+
+class FaceTemplate(models.Model):
+    """Quality weighted mean of the face embeddings of a patients."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    patients = models.ForeignKey(
+        Patients,
+        on_delete=models.CASCADE,
+        related_name='face_templates',
+    )
+    vector = models.BinaryField()
+    image_count = models.PositiveIntegerField(default=1)
+    extractor_version = models.CharField(max_length=64, db_index=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['patients', 'extractor_version']
+
+    def __str__(self):
+        return f'{self.patients} template'
+
+
+class FaceExtractorVersion(models.Model):
+    """Face extractor whose embeddings are or will be matched against.
+
+    Only the active version is served. A new version is re-indexed in
+    the background, checkpointed by patients id, and activated once all
+    images have an embedding of it.
+    """
+    version = models.CharField(max_length=64, unique=True)
+    active = models.BooleanField(default=False)
+    checkpoint = models.BigIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    activated = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.version
+
+
+class GalleryVersion(models.Model):
+    """Versions of the face gallery of a user and of its filters.
+
+    Replaced whenever the faces, or the tags and treatments of the user
+    change, so every process can tell its cached gallery or filter
+    bitmaps are stale.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='gallery_version',
+    )
+    gallery = models.UUIDField(default=uuid.uuid4)
+    filters = models.UUIDField(default=uuid.uuid4)
+
+    def __str__(self):
+        return f'{self.user} {self.gallery}'
+
+
+class AuthTokenInfo(models.Model):
+    """Expiry and last use of a DRF auth token.
+
+    Last use is written in batches, so it lags by up to
+    AUTH_TOKEN_USAGE_FLUSH_INTERVAL seconds.
+    """
+    token = models.OneToOneField(
+        'authtoken.Token',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='info',
+    )
+    expires = models.DateTimeField(db_index=True)
+    last_used = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.token.user} {self.expires}'
+
+
+class RefreshToken(models.Model):
+    """Refresh token exchanged for signed access tokens.
+
+    Only the SHA-256 of the token is stored. Refreshing rotates the token,
+    and tokens issued before the user's token version was bumped are
+    refused.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='refresh_tokens',
+    )
+    key_hash = models.CharField(max_length=64, unique=True)
+    token_version = models.PositiveIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+    expires = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.user} {self.created}'
+
 # # hereeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeee
 # class Patient(models.Model):
 #     """patient object."""
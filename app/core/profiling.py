@@ -0,0 +1,114 @@
+"""
+Profiling of single requests.
+
+A profiler is started around a request and stopped before its response
+is returned. cprofile records the calls with cProfile, alloc the memory
+allocations with tracemalloc.
+"""
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profiler cannot run alongside another one."""
+
+
+class CallProfiler:
+    """Profile of the function calls of a request."""
+    extension = 'prof'
+
+    def start(self):
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+
+    def report(self):
+        """Return the slowest calls by cumulative time as text."""
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=stream)
+        stats.sort_stats('cumulative').print_stats(settings.PROFILING_TOP)
+        return stream.getvalue()
+
+    def summary(self):
+        """Return the total time of the request."""
+        stats = pstats.Stats(self.profiler)
+        return f'{stats.total_tt:.4f}s'
+
+    def dump(self, path):
+        """Write the stats in the pstats format."""
+        self.profiler.dump_stats(path)
+
+
+class AllocationProfiler:
+    """Profile of the memory allocated by a request.
+
+    tracemalloc traces the whole process, so only one request is traced
+    at a time and none while something else traces. Allocations of other
+    threads during the request are counted too.
+    """
+    extension = 'alloc.txt'
+    lock = threading.Lock()
+
+    def start(self):
+        if not self.lock.acquire(blocking=False):
+            raise ProfilerBusy('Another request is being traced.')
+        if tracemalloc.is_tracing():
+            self.lock.release()
+            raise ProfilerBusy('Memory allocations are traced already.')
+        tracemalloc.start(settings.PROFILING_ALLOC_FRAMES)
+        self.before = tracemalloc.take_snapshot()
+
+    def stop(self):
+        try:
+            self.snapshot = tracemalloc.take_snapshot()
+            self.current, self.peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            self.lock.release()
+
+    def report(self):
+        """Return the lines that allocated the most memory as text."""
+        lines = [f'Peak traced memory: {self.peak / 1024:.1f} KiB', '']
+        for stat in self.snapshot.compare_to(self.before, 'lineno')[
+            :settings.PROFILING_TOP
+        ]:
+            lines.append(str(stat))
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Return the peak traced memory of the request."""
+        return f'{self.peak / 1024:.1f}KiB'
+
+    def dump(self, path):
+        """Write the report as text."""
+        with open(path, 'w') as report_file:
+            report_file.write(self.report())
+
+
+PROFILERS = {
+    'cprofile': CallProfiler,
+    'alloc': AllocationProfiler,
+}
+
+
+def dump(profiler, label):
+    """Write a profile to PROFILING_DIR and return its file name."""
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    safe_label = ''.join(
+        char if char.isalnum() or char in '-_.' else '_' for char in label
+    )
+    filename = (
+        f'{time.strftime("%Y%m%dT%H%M%S")}-{os.getpid()}-'
+        f'{time.monotonic_ns() % 10 ** 6}-{safe_label}.{profiler.extension}'
+    )
+    profiler.dump(os.path.join(settings.PROFILING_DIR, filename))
+    return filename
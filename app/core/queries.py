@@ -0,0 +1,121 @@
+"""
+Detection of slow and repeated SQL queries.
+
+An inspector wraps the database connections of a request, times every
+query and notes where it came from: the view method, the innermost
+serializer field and the innermost frame of project code. Queries slower
+than SLOW_QUERY_MS and query shapes run QUERY_REPEAT_THRESHOLD times or
+more in one request, the signature of N+1 queries, are reported as
+findings.
+"""
+import os
+import re
+import sys
+import time
+
+from django.conf import settings
+
+from rest_framework.serializers import BaseSerializer, ListSerializer
+from rest_framework.views import APIView
+
+PLACEHOLDERS_RE = re.compile(r'\(\s*%s(\s*,\s*%s)+\s*\)')
+SPACES_RE = re.compile(r'\s+')
+SKIPPED_PATHS = (
+    os.path.dirname(__file__) + os.sep + 'queries.py',
+    os.path.dirname(__file__) + os.sep + 'middleware.py',
+)
+
+
+def shape(sql):
+    """Return a query with parameter lists of any length made alike."""
+    return SPACES_RE.sub(' ', PLACEHOLDERS_RE.sub('(%s, ...)', sql)).strip()
+
+
+def _serializer_name(serializer):
+    if isinstance(serializer, ListSerializer):
+        name = type(serializer.child).__name__
+    else:
+        name = type(serializer).__name__
+    parent = serializer.parent
+    if parent is not None and serializer.field_name:
+        if isinstance(parent, ListSerializer):
+            parent = parent.child
+        return f'{type(parent).__name__}.{serializer.field_name}'
+    return name
+
+
+def _is_project_code(filename, base_dir):
+    return (
+        filename.startswith(base_dir)
+        and filename not in SKIPPED_PATHS
+        and f'{os.sep}tests{os.sep}' not in filename
+    )
+
+
+def origin(frame):
+    """Return the view, serializer and project code running a query."""
+    base_dir = str(settings.BASE_DIR) + os.sep
+    found = {'handler': None, 'serializer': None, 'code': None}
+    while frame is not None and None in found.values():
+        instance = frame.f_locals.get('self')
+        if found['serializer'] is None and isinstance(
+            instance, BaseSerializer,
+        ):
+            found['serializer'] = _serializer_name(instance)
+        if found['handler'] is None and isinstance(instance, APIView):
+            found['handler'] = (
+                f'{type(instance).__name__}.{frame.f_code.co_name}'
+            )
+        filename = frame.f_code.co_filename
+        if found['code'] is None and _is_project_code(filename, base_dir):
+            found['code'] = (
+                f'{os.path.relpath(filename, base_dir)}:{frame.f_lineno} '
+                f'in {frame.f_code.co_name}'
+            )
+        frame = frame.f_back
+    return found
+
+
+class QueryInspector:
+    """Execute wrapper recording the queries of a request."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': shape(sql),
+                'ms': (time.perf_counter() - started) * 1000,
+                **origin(sys._getframe(1)),
+            })
+
+    @property
+    def total_ms(self):
+        return sum(query['ms'] for query in self.queries)
+
+    def findings(self):
+        """Return the slow queries and the repeated query shapes."""
+        findings = [
+            {'kind': 'slow_query', **query}
+            for query in self.queries
+            if query['ms'] >= settings.SLOW_QUERY_MS
+        ]
+        repeated = {}
+        for query in self.queries:
+            repeated.setdefault(query['sql'], []).append(query)
+        for sql, queries in repeated.items():
+            if len(queries) >= settings.QUERY_REPEAT_THRESHOLD:
+                findings.append({
+                    'kind': 'repeated_query',
+                    'sql': sql,
+                    'count': len(queries),
+                    'ms': sum(query['ms'] for query in queries),
+                    'handler': queries[0]['handler'],
+                    'serializer': queries[0]['serializer'],
+                    'code': queries[0]['code'],
+                })
+        return findings
@@ -0,0 +1,140 @@
+"""
+Precomputed OpenAPI schema.
+
+Generating the schema introspects every view and serializer, so it is
+rendered once per code version and format, written to SCHEMA_CACHE_DIR
+and kept in memory. The code version is SCHEMA_CODE_VERSION when set,
+otherwise a digest of the project sources and the versions of the
+libraries generating the schema, so a deploy regenerates it and a
+restart does not.
+"""
+import functools
+import hashlib
+import os
+import tempfile
+import threading
+
+import django
+import drf_spectacular
+import rest_framework
+from django.conf import settings
+
+from drf_spectacular.renderers import (
+    OpenApiJsonRenderer,
+    OpenApiYamlRenderer,
+)
+from drf_spectacular.settings import spectacular_settings
+
+RENDERERS = (OpenApiYamlRenderer, OpenApiJsonRenderer)
+
+_schemas = {}
+_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    """Return the version of the code the schema is generated from."""
+    if settings.SCHEMA_CODE_VERSION:
+        return settings.SCHEMA_CODE_VERSION
+    digest = hashlib.sha256()
+    for library in (django, rest_framework, drf_spectacular):
+        digest.update(f'{library.__name__}={library.__version__}\n'.encode())
+    digest.update(repr(sorted(settings.SPECTACULAR_SETTINGS.items())).encode())
+    base_dir = str(settings.BASE_DIR)
+    paths = []
+    for directory, dirnames, filenames in os.walk(base_dir):
+        dirnames[:] = [
+            name for name in dirnames
+            if name not in ('tests', '__pycache__')
+            and not name.startswith('.')
+        ]
+        paths.extend(
+            os.path.join(directory, filename)
+            for filename in filenames
+            if filename.endswith('.py')
+        )
+    for path in sorted(paths):
+        digest.update(os.path.relpath(path, base_dir).encode() + b'\0')
+        with open(path, 'rb') as source:
+            digest.update(hashlib.sha256(source.read()).digest())
+
+    return digest.hexdigest()[:16]
+
+
+def generate():
+    """Introspect the API and return its schema."""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    return generator.get_schema(request=None, public=True)
+
+
+def render(schema, renderer):
+    """Render a schema with an OpenAPI renderer."""
+    return renderer().render(schema, renderer.media_type, {})
+
+
+def etag(content):
+    return f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+
+
+def path(version, fmt):
+    """Return the file of the schema of a version in a format."""
+    return os.path.join(settings.SCHEMA_CACHE_DIR, f'{version}.{fmt}')
+
+
+def write(schema=None, version=None):
+    """Render a schema in every format and store it atomically.
+
+    Returns the written file names.
+    """
+    schema = generate() if schema is None else schema
+    version = version or code_version()
+    os.makedirs(settings.SCHEMA_CACHE_DIR, exist_ok=True)
+    written = []
+    for renderer in RENDERERS:
+        content = render(schema, renderer)
+        target = path(version, renderer.format)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=settings.SCHEMA_CACHE_DIR,
+            suffix='.part',
+        )
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(content)
+            os.replace(tmp_path, target)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        _schemas[(settings.SCHEMA_CACHE_DIR, version, renderer.format)] = (
+            content,
+            etag(content),
+        )
+        written.append(target)
+
+    return written
+
+
+def get(fmt):
+    """Return the content and ETag of the schema in a format.
+
+    The schema is read from SCHEMA_CACHE_DIR, or generated and written
+    there when the code version has none yet.
+    """
+    key = (settings.SCHEMA_CACHE_DIR, code_version(), fmt)
+    cached = _schemas.get(key)
+    if cached is not None:
+        return cached
+    with _lock:
+        if key not in _schemas:
+            try:
+                with open(path(key[1], fmt), 'rb') as schema_file:
+                    content = schema_file.read()
+                _schemas[key] = (content, etag(content))
+            except FileNotFoundError:
+                write(version=key[1])
+
+    return _schemas[key]
+
+
+def clear():
+    """Forget the schemas kept in memory."""
+    _schemas.clear()
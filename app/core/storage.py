@@ -0,0 +1,145 @@
+"""
+Content addressed storage for uploaded images.
+
+Files are named after the SHA-256 of their bytes and sharded in two
+directory levels, so identical uploads are stored once. The ImageBlob
+table counts how many rows reference each blob, and blobs are only
+removed by the collect_blobs command once nothing references them.
+"""
+import hashlib
+import os
+import tempfile
+import time
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (
+    post_delete,
+    post_init,
+    post_save,
+    pre_delete,
+)
+
+BLOB_DIR = 'blobs'
+
+
+def blob_name(digest, ext=''):
+    """Return the sharded storage name of a blob."""
+    return os.path.join(BLOB_DIR, digest[:2], digest[2:4], f'{digest}{ext}')
+
+
+def blob_digest(name):
+    """Return the digest of a blob storage name, None for other files."""
+    if not name or not name.startswith(BLOB_DIR + '/'):
+        return None
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage naming files after their content."""
+
+    def get_available_name(self, name, max_length=None):
+        """Blob names are stable, an existing name has the same content."""
+        return name
+
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1].lower()
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        name = blob_name(digest.hexdigest(), ext)
+        path = self.path(name)
+        if os.path.exists(path):
+            os.utime(path)
+            return name
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    tmp.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        return name
+
+    def delete(self, name):
+        """Leave blobs in place, they are reclaimed by collect_blobs."""
+        if blob_digest(name) is None:
+            super().delete(name)
+
+    def purge(self, name):
+        """Remove a blob from disk."""
+        super().delete(name)
+
+    def age(self, name):
+        """Return the seconds since a blob was last written or reused."""
+        return time.time() - os.path.getmtime(self.path(name))
+
+
+def _change_refcount(name, delta):
+    from core.models import ImageBlob
+
+    digest = blob_digest(name)
+    if digest is None:
+        return
+    with transaction.atomic():
+        blob, created = ImageBlob.objects.select_for_update().get_or_create(
+            digest=digest,
+            defaults={'name': name},
+        )
+        ImageBlob.objects.filter(pk=blob.pk).update(
+            refcount=F('refcount') + delta,
+        )
+
+
+def track_blob_references(model, field_name):
+    """Keep ImageBlob reference counts in sync with a file field."""
+    attname = model._meta.get_field(field_name).attname
+    loaded_attr = f'_loaded_{field_name}'
+    deferred = object()
+
+    def current(instance):
+        value = instance.__dict__.get(attname, deferred)
+        return getattr(value, 'name', value)
+
+    def loaded(sender, instance, **kwargs):
+        setattr(instance, loaded_attr, current(instance))
+
+    def saved(sender, instance, created, **kwargs):
+        old = None if created else getattr(instance, loaded_attr, deferred)
+        new = current(instance)
+        if old is not deferred and new is not deferred and old != new:
+            if new:
+                _change_refcount(new, 1)
+            if old:
+                _change_refcount(old, -1)
+        setattr(instance, loaded_attr, new)
+
+    def deleting(sender, instance, **kwargs):
+        if getattr(instance, loaded_attr, deferred) is deferred:
+            setattr(instance, loaded_attr, model._base_manager.filter(
+                pk=instance.pk,
+            ).values_list(attname, flat=True).first())
+
+    def deleted(sender, instance, **kwargs):
+        name = getattr(instance, loaded_attr, None)
+        if name:
+            _change_refcount(name, -1)
+
+    uid = f'{model._meta.label}.{field_name}'
+    post_init.connect(loaded, sender=model, weak=False, dispatch_uid=uid)
+    post_save.connect(saved, sender=model, weak=False, dispatch_uid=uid)
+    pre_delete.connect(deleting, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(deleted, sender=model, weak=False, dispatch_uid=uid)
@@ -1,13 +1,29 @@
 """
 Test custom Django management commands.
 """
+import json
+import tempfile
+from io import StringIO
+from unittest import skipUnless
 from unittest.mock import patch
 
 from psycopg2 import OperationalError as Psycopg2OpError
 
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import (
+    LiveServerTestCase,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+
+import benchmarks.load
+from core.models import FaceEmbedding
 
 
 @patch('core.management.commands.wait_for_db.Command.check')
@@ -32,3 +48,147 @@ class CommandTests(SimpleTestCase):
 
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+
+class BenchmarkCommandTests(SimpleTestCase):
+    """Test the benchmark command."""
+
+    def test_benchmark_ingest(self):
+        """Test running the ingest suite writes JSON results."""
+        out = StringIO()
+
+        call_command(
+            'benchmark',
+            'ingest',
+            param=['images=1', 'width=320', 'height=240', 'max_edge=100'],
+            stdout=out,
+        )
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['suite'], 'ingest')
+        self.assertEqual(report['params']['width'], 320)
+        self.assertGreater(report['results']['original_bytes'], 0)
+
+    def test_benchmark_unknown_param(self):
+        """Test unknown suite parameters are rejected."""
+        with self.assertRaises(CommandError):
+            call_command('benchmark', 'ingest', param=['bogus=1'])
+
+
+class RecognitionBenchmarkTests(TestCase):
+    """Test the recognition benchmark."""
+
+    def test_benchmark_recognition(self):
+        """Test the recognition suite reports every matcher and size."""
+        out = StringIO()
+
+        call_command(
+            'benchmark',
+            'recognition',
+            param=[
+                'sizes=300,600',
+                'probes=5',
+                'k=3',
+                'enroll_images=10',
+                'enroll_face_size=64',
+                'matchers=float32,ivf',
+            ],
+            stdout=out,
+        )
+
+        results = json.loads(out.getvalue())['results']
+        self.assertEqual(sorted(results['galleries']), ['300', '600'])
+        exact = results['galleries']['300']['float32']
+        self.assertEqual(exact['recall_at_1'], 1.0)
+        self.assertIn('p95_ms', exact['latency'])
+        self.assertIn('ivf', results['galleries']['600'])
+        self.assertGreater(results['enrollment_faces_per_second'], 0)
+        self.assertFalse(get_user_model().objects.exists())
+        self.assertFalse(FaceEmbedding.objects.exists())
+
+
+@override_settings(
+    LOGIN_THROTTLE_IP_BURST=1000,
+    LOGIN_THROTTLE_EMAIL_BURST=1000,
+)
+class LoadBenchmarkTests(LiveServerTestCase):
+    """Test the load suite against a live server."""
+
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings.enable()
+        call_command(
+            'seed_synthetic',
+            users=2,
+            patients=5,
+            image_ratio=1,
+            faces=2,
+            face_size=64,
+            stdout=StringIO(),
+        )
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media.cleanup()
+
+    def _load(self, concurrency):
+        out = StringIO()
+        call_command(
+            'benchmark',
+            'load',
+            param=[
+                f'url={self.live_server_url}',
+                'users=2',
+                f'concurrency={concurrency}',
+                'requests=40',
+                'faces=2',
+                'face_size=64',
+                'weights=1,1,1,1,1,1',
+            ],
+            stdout=out,
+        )
+        return json.loads(out.getvalue())['results']
+
+    def test_scenarios_replayed(self):
+        """Test every scenario is replayed and reported."""
+        results = self._load(concurrency=1)
+
+        self.assertEqual(results['failed_sessions'], 0)
+        self.assertEqual(results['total']['requests'], 40)
+        self.assertEqual(results['total']['errors'], 0)
+        self.assertGreater(results['total']['throughput_rps'], 0)
+        self.assertEqual(
+            sorted(results['scenarios']),
+            sorted(['setup', *benchmarks.load.DEFAULTS['scenarios']]),
+        )
+        self.assertIn('p95', results['scenarios']['roster']['latency_ms'])
+
+    @skipUnless(
+        connection.vendor == 'postgresql',
+        'SQLite locks its tables under concurrent writes.',
+    )
+    def test_concurrent_sessions(self):
+        """Test sessions replay scenarios concurrently without errors."""
+        results = self._load(concurrency=2)
+
+        self.assertEqual(results['failed_sessions'], 0)
+        self.assertEqual(results['total']['requests'], 40)
+        self.assertEqual(results['total']['errors'], 0)
+        self.assertEqual(results['scenarios']['setup']['requests'], 2)
+
+    def test_errors_counted(self):
+        """Test failed logins are reported instead of raised."""
+        results = benchmarks.load.run(**{
+            **benchmarks.load.DEFAULTS,
+            'url': self.live_server_url,
+            'password': 'wrong',
+            'concurrency': 1,
+            'faces': 1,
+            'face_size': 64,
+        })
+
+        self.assertEqual(results['failed_sessions'], 1)
+        self.assertEqual(results['scenarios']['setup']['error_rate'], 1.0)
+        self.assertEqual(results['scenarios']['setup']['status'], {'400': 1})
@@ -0,0 +1,169 @@
+"""
+Tests for request metrics.
+"""
+import json
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import metrics
+
+
+METRICS_URL = reverse('metrics')
+PATIENTS_URL = reverse('patients:patients-list')
+
+
+class RenderTests(SimpleTestCase):
+    """Tests for the Prometheus text exposition."""
+
+    def test_counters_and_histograms(self):
+        """Test counters and cumulative histogram buckets are rendered."""
+        registry = metrics.Registry()
+        registry.inc('login_rejections_total', {'reason': 'ip'}, 2)
+        registry.observe(
+            'http_request_db_queries',
+            {'view': 'v', 'method': 'GET'},
+            3,
+        )
+        registry.observe(
+            'http_request_db_queries',
+            {'view': 'v', 'method': 'GET'},
+            500,
+        )
+
+        text = metrics.render([registry.snapshot()])
+
+        self.assertIn('# TYPE login_rejections_total counter', text)
+        self.assertIn('login_rejections_total{reason="ip"} 2', text)
+        self.assertIn(
+            'http_request_db_queries_bucket{method="GET",view="v",le="2"} 0',
+            text,
+        )
+        self.assertIn(
+            'http_request_db_queries_bucket{method="GET",view="v",le="5"} 1',
+            text,
+        )
+        self.assertIn(
+            'http_request_db_queries_bucket'
+            '{method="GET",view="v",le="+Inf"} 2',
+            text,
+        )
+        self.assertIn(
+            'http_request_db_queries_sum{method="GET",view="v"} 503',
+            text,
+        )
+        self.assertIn(
+            'http_request_db_queries_count{method="GET",view="v"} 2',
+            text,
+        )
+
+    def test_label_values_escaped(self):
+        """Test quotes and newlines in label values are escaped."""
+        registry = metrics.Registry()
+        registry.inc('login_rejections_total', {'reason': 'a"b\nc'})
+
+        text = metrics.render([registry.snapshot()])
+
+        self.assertIn('{reason="a\\"b\\nc"} 1', text)
+
+    def test_snapshots_are_added_up(self):
+        """Test the snapshots of several processes are merged."""
+        first = metrics.Registry()
+        second = metrics.Registry()
+        first.inc('login_rejections_total', {'reason': 'ip'})
+        second.inc('login_rejections_total', {'reason': 'ip'}, 4)
+        snapshots = [
+            json.loads(json.dumps(registry.snapshot()))
+            for registry in (first, second)
+        ]
+
+        text = metrics.render(snapshots)
+
+        self.assertIn('login_rejections_total{reason="ip"} 5', text)
+
+
+class MetricsMiddlewareTests(TestCase):
+    """Tests for recording request metrics."""
+
+    def setUp(self):
+        metrics.registry.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_request_recorded(self):
+        """Test latency, queries, size and status are recorded by view."""
+        self.client.get(PATIENTS_URL)
+
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        text = res.content.decode()
+        labels = 'method="GET",view="patients:patients-list"'
+        self.assertIn(
+            'http_requests_total{method="GET",status="200",'
+            'view="patients:patients-list"} 1',
+            text,
+        )
+        self.assertIn(
+            f'http_request_duration_seconds_count{{{labels}}} 1',
+            text,
+        )
+        self.assertIn(f'http_response_size_bytes_count{{{labels}}} 1', text)
+        self.assertIn(
+            f'http_request_db_queries_bucket{{{labels},le="0"}} 0',
+            text,
+        )
+        self.assertIn(f'http_request_db_seconds_total{{{labels}}}', text)
+
+    def test_unmatched_route(self):
+        """Test requests without a view share one label."""
+        self.client.get('/no/such/page/')
+
+        text = metrics.render([metrics.registry.snapshot()])
+
+        self.assertIn(
+            'http_requests_total{method="GET",status="404",'
+            'view="<unmatched>"} 1',
+            text,
+        )
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_required(self):
+        """Test the metrics need the token when one is configured."""
+        denied = self.client.get(METRICS_URL)
+        allowed = self.client.get(
+            METRICS_URL,
+            HTTP_AUTHORIZATION='Bearer secret',
+        )
+
+        self.assertEqual(denied.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(allowed.status_code, status.HTTP_200_OK)
+
+    def test_multiprocess_directory(self):
+        """Test the files of other processes are added to this one."""
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(METRICS_DIR=directory):
+            other = metrics.Registry()
+            other.inc('login_rejections_total', {'reason': 'email'}, 3)
+            with open(os.path.join(directory, '1.json'), 'w') as other_file:
+                json.dump(other.snapshot(), other_file)
+            metrics.registry.inc('login_rejections_total', {'reason': 'email'})
+
+            res = self.client.get(METRICS_URL)
+
+            self.assertIn(
+                'login_rejections_total{reason="email"} 4',
+                res.content.decode(),
+            )
+            self.assertIn(f'{os.getpid()}.json', os.listdir(directory))
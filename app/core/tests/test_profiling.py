@@ -0,0 +1,157 @@
+"""
+Tests for profiling requests.
+"""
+import os
+import pstats
+import tempfile
+import tracemalloc
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import profiling
+from patients.tests.test_patients_api import create_patients
+from user.tokens import issue_access_token
+
+
+PATIENTS_URL = reverse('patients:patients-list')
+
+
+class ProfilingMiddlewareTests(TestCase):
+    """Tests for on demand and sampled profiling."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings = override_settings(PROFILING_DIR=self.directory.name)
+        self.settings.enable()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'staff@example.com',
+            'password123',
+            is_staff=True,
+        )
+        self.authenticate(self.user)
+        create_patients(user=self.user)
+
+    def tearDown(self):
+        self.settings.disable()
+        self.directory.cleanup()
+
+    def authenticate(self, user):
+        """Send real credentials, the middleware runs before the view."""
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {issue_access_token(user)}',
+        )
+
+    def test_cprofile_in_place(self):
+        """Test staff users get a call profile instead of the response."""
+        res = self.client.get(PATIENTS_URL, {'_profile': 'cprofile'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        self.assertIn('cumulative', res.content.decode())
+        self.assertIn('function calls', res.content.decode())
+
+    def test_alloc_in_place(self):
+        """Test staff users get an allocation report."""
+        res = self.client.get(PATIENTS_URL, {'_profile': 'alloc'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('Peak traced memory', res.content.decode())
+
+    def test_header_keeps_response(self):
+        """Test the header mode keeps the response and saves the report."""
+        res = self.client.get(PATIENTS_URL, HTTP_X_PROFILE='cprofile')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.json()), 1)
+        self.assertTrue(res['X-Profile'].startswith('cprofile '))
+        path = os.path.join(self.directory.name, res['X-Profile-Report'])
+        self.assertGreater(pstats.Stats(path).total_calls, 0)
+
+    def test_other_users_refused(self):
+        """Test users who are not staff are refused before profiling."""
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'password123',
+        )
+        self.authenticate(other)
+
+        with patch('core.profiling.CallProfiler') as profiler:
+            res = self.client.get(PATIENTS_URL, {'_profile': 'cprofile'})
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+        profiler.assert_not_called()
+
+    def test_anonymous_refused(self):
+        """Test requests without credentials are refused."""
+        self.client.credentials()
+
+        with patch('core.profiling.CallProfiler') as profiler:
+            res = self.client.get(PATIENTS_URL, HTTP_X_PROFILE='cprofile')
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+        profiler.assert_not_called()
+
+    def test_invalid_credentials_refused(self):
+        """Test forged tokens are refused."""
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer forged')
+
+        res = self.client.get(PATIENTS_URL, {'_profile': 'cprofile'})
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_alloc_refused_while_tracing(self):
+        """Test allocations are not traced over another trace."""
+        tracemalloc.start()
+        try:
+            res = self.client.get(PATIENTS_URL, {'_profile': 'alloc'})
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_alloc_serialized(self):
+        """Test one request at a time traces allocations."""
+        with profiling.AllocationProfiler.lock:
+            res = self.client.get(PATIENTS_URL, {'_profile': 'alloc'})
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_unknown_mode_ignored(self):
+        """Test unknown profilers leave the request alone."""
+        with patch('core.profiling.CallProfiler') as profiler:
+            res = self.client.get(PATIENTS_URL, {'_profile': 'bogus'})
+
+        self.assertEqual(len(res.json()), 1)
+        profiler.assert_not_called()
+
+    def test_disabled_by_default(self):
+        """Test plain requests are not profiled."""
+        with patch('core.profiling.CallProfiler') as profiler:
+            self.client.get(PATIENTS_URL)
+
+        profiler.assert_not_called()
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sampled_requests_dumped(self):
+        """Test sampled requests are profiled to disk for any user."""
+        self.user.is_staff = False
+        self.user.save()
+        self.client.force_authenticate(self.user)
+
+        res = self.client.get(PATIENTS_URL)
+
+        self.assertEqual(len(res.json()), 1)
+        files = os.listdir(self.directory.name)
+        self.assertEqual(len(files), 1)
+        self.assertIn('patients_patients-list', files[0])
+        self.assertTrue(files[0].endswith('.prof'))
@@ -0,0 +1,122 @@
+"""
+Tests for detecting slow and repeated queries.
+"""
+import json
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import queries
+from core.models import Tag
+from patients.tests.test_patients_api import create_patients
+
+
+PATIENTS_URL = reverse('patients:patients-list')
+
+
+class ShapeTests(SimpleTestCase):
+    """Tests for query shapes."""
+
+    def test_parameter_lists_alike(self):
+        """Test IN lists of any length have the same shape."""
+        self.assertEqual(
+            queries.shape('SELECT 1 WHERE id IN (%s, %s)'),
+            queries.shape('SELECT 1 WHERE id IN (%s,%s,  %s)'),
+        )
+
+    def test_whitespace_collapsed(self):
+        """Test whitespace does not change the shape."""
+        self.assertEqual(
+            queries.shape('SELECT  1\n FROM t'),
+            'SELECT 1 FROM t',
+        )
+
+
+@override_settings(QUERY_INSPECTION_RATE=1, QUERY_REPEAT_THRESHOLD=5)
+class QueryInspectionMiddlewareTests(TestCase):
+    """Tests for reporting queries of requests."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        for i in range(6):
+            patients = create_patients(user=self.user)
+            patients.tags.add(Tag.objects.create(user=self.user, name=str(i)))
+
+    def findings(self, logs):
+        return [json.loads(record.getMessage()) for record in logs.records]
+
+    def test_repeated_queries_attributed(self):
+        """Test N+1 queries are reported with their serializer field."""
+        with self.assertLogs('core.queries', 'WARNING') as logs:
+            self.client.get(PATIENTS_URL)
+
+        repeated = {
+            finding['serializer']: finding
+            for finding in self.findings(logs)
+            if finding['kind'] == 'repeated_query'
+        }
+        self.assertEqual(repeated['PatientsSerializer.tags']['count'], 6)
+        self.assertIn('core_tag', repeated['PatientsSerializer.tags']['sql'])
+        self.assertEqual(
+            repeated['PatientsSerializer.tags']['view'],
+            'patients:patients-list',
+        )
+        self.assertEqual(
+            repeated['PatientsSerializer.tags']['handler'],
+            'PatientsViewSet.list',
+        )
+
+    @override_settings(SLOW_QUERY_MS=0, QUERY_REPEAT_THRESHOLD=1000)
+    def test_slow_queries_reported(self):
+        """Test queries over the threshold are reported with their origin."""
+        with self.assertLogs('core.queries', 'WARNING') as logs:
+            self.client.get(PATIENTS_URL)
+
+        slow = [
+            finding for finding in self.findings(logs)
+            if finding['kind'] == 'slow_query'
+        ]
+        self.assertGreaterEqual(len(slow), 13)
+        self.assertEqual(slow[0]['handler'], 'PatientsViewSet.list')
+        self.assertEqual(slow[0]['serializer'], 'PatientsSerializer')
+        self.assertIn('core_patients', slow[0]['sql'])
+
+    @override_settings(QUERY_INSPECTION_HEADERS=True)
+    def test_staff_headers(self):
+        """Test staff users get the findings in response headers."""
+        self.user.is_staff = True
+        self.user.save()
+
+        with self.assertLogs('core.queries', 'WARNING'):
+            res = self.client.get(PATIENTS_URL)
+
+        self.assertGreater(int(res['X-Query-Count']), 6)
+        self.assertIn(
+            'PatientsSerializer.tags x6 in PatientsViewSet.list',
+            res['X-Query-Repeated'],
+        )
+
+    @override_settings(QUERY_INSPECTION_HEADERS=True)
+    def test_no_headers_for_other_users(self):
+        """Test users who are not staff get no query headers."""
+        with self.assertLogs('core.queries', 'WARNING'):
+            res = self.client.get(PATIENTS_URL)
+
+        self.assertNotIn('X-Query-Count', res)
+
+    @override_settings(QUERY_INSPECTION_RATE=0)
+    def test_disabled(self):
+        """Test requests are not inspected when the rate is zero."""
+        with patch('core.middleware.QueryInspector') as inspector:
+            self.client.get(PATIENTS_URL)
+
+        inspector.assert_not_called()
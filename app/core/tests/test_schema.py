@@ -0,0 +1,130 @@
+"""
+Tests for the precomputed OpenAPI schema.
+"""
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import schema
+
+
+SCHEMA_URL = reverse('api-schema')
+
+
+class SchemaViewTests(TestCase):
+    """Tests for serving the schema."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings = override_settings(
+            SCHEMA_CACHE_DIR=self.directory.name,
+            SCHEMA_CODE_VERSION='v1',
+        )
+        self.settings.enable()
+        schema.code_version.cache_clear()
+        schema.clear()
+        self.client = APIClient()
+
+    def tearDown(self):
+        self.settings.disable()
+        schema.code_version.cache_clear()
+        schema.clear()
+        self.directory.cleanup()
+
+    def test_generated_once(self):
+        """Test the schema is generated on the first request only."""
+        with patch('core.schema.generate', wraps=schema.generate) as generate:
+            first = self.client.get(SCHEMA_URL)
+            second = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertIn(b'/api/patients/patientss/', first.content)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+        generate.assert_called_once()
+        self.assertEqual(
+            sorted(os.listdir(self.directory.name)),
+            ['v1.json', 'v1.yaml'],
+        )
+
+    def test_not_modified(self):
+        """Test a matching If-None-Match gets a 304."""
+        etag = self.client.get(SCHEMA_URL)['ETag']
+
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+        self.assertEqual(res.content, b'')
+
+    def test_json_format(self):
+        """Test the JSON schema is served with its own ETag."""
+        yaml_res = self.client.get(SCHEMA_URL)
+
+        res = self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res['Content-Type'],
+            'application/vnd.oai.openapi+json',
+        )
+        self.assertIn('openapi', json.loads(res.content))
+        self.assertNotEqual(res['ETag'], yaml_res['ETag'])
+
+    def test_read_from_disk(self):
+        """Test other processes serve the stored schema."""
+        content = self.client.get(SCHEMA_URL).content
+        schema.clear()
+
+        with patch('core.schema.generate') as generate:
+            res = self.client.get(SCHEMA_URL)
+
+        generate.assert_not_called()
+        self.assertEqual(res.content, content)
+
+    def test_regenerated_for_new_version(self):
+        """Test a new code version regenerates the schema."""
+        self.client.get(SCHEMA_URL)
+        schema.code_version.cache_clear()
+
+        with override_settings(SCHEMA_CODE_VERSION='v2'), \
+                patch('core.schema.generate', return_value={}) as generate:
+            res = self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        generate.assert_called_once()
+        self.assertEqual(json.loads(res.content), {})
+
+    def test_source_digest(self):
+        """Test the code version defaults to a digest of the sources."""
+        schema.code_version.cache_clear()
+
+        with override_settings(SCHEMA_CODE_VERSION=''):
+            version = schema.code_version()
+
+        self.assertRegex(version, r'^[0-9a-f]{16}$')
+
+    def test_command(self):
+        """Test the command writes the schema and removes stale ones."""
+        stale = os.path.join(self.directory.name, 'v0.yaml')
+        with open(stale, 'w') as stale_file:
+            stale_file.write('openapi: 3.0.3\n')
+        out = StringIO()
+
+        call_command('generate_schema', stdout=out)
+        call_command('generate_schema', stdout=out)
+
+        self.assertIn('Schema of version v1 written.', out.getvalue())
+        self.assertIn('Schema of version v1 is up to date.', out.getvalue())
+        self.assertEqual(
+            sorted(os.listdir(self.directory.name)),
+            ['v1.json', 'v1.yaml'],
+        )
@@ -0,0 +1,124 @@
+"""
+Tests for content addressed image storage.
+"""
+import hashlib
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core.models import (
+    ImageBlob,
+    Patients,
+)
+from core.storage import (
+    ContentAddressedStorage,
+    blob_name,
+)
+from patients.tests.test_patients_api import create_patients
+
+
+class ContentAddressedStorageTests(TestCase):
+    """Test storing and reference counting image blobs."""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings.enable()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media.cleanup()
+
+    def _attach(self, patients, data):
+        patients.image.save('photo.jpg', ContentFile(data))
+
+    def test_identical_content_stored_once(self):
+        """Test identical uploads share one sharded blob."""
+        data = b'image bytes'
+        digest = hashlib.sha256(data).hexdigest()
+        first = create_patients(self.user)
+        second = create_patients(self.user)
+
+        self._attach(first, data)
+        self._attach(second, data)
+
+        self.assertEqual(first.image.name, blob_name(digest, '.jpg'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith(
+            f'blobs/{digest[:2]}/{digest[2:4]}/'
+        ))
+        self.assertEqual(ImageBlob.objects.get(digest=digest).refcount, 2)
+
+    def test_replace_and_delete_release_references(self):
+        """Test replacing an image or deleting a patients decrements."""
+        patients = create_patients(self.user)
+        self._attach(patients, b'old')
+        old_digest = hashlib.sha256(b'old').hexdigest()
+
+        self._attach(patients, b'new')
+        reloaded = Patients.objects.get(id=patients.id)
+        reloaded.delete()
+
+        new_digest = hashlib.sha256(b'new').hexdigest()
+        self.assertEqual(ImageBlob.objects.get(digest=old_digest).refcount, 0)
+        self.assertEqual(ImageBlob.objects.get(digest=new_digest).refcount, 0)
+
+    def test_deferred_image_delete_releases_reference(self):
+        """Test deleting a patients loaded without its image."""
+        patients = create_patients(self.user)
+        self._attach(patients, b'data')
+
+        Patients.objects.only('id').get(id=patients.id).delete()
+
+        self.assertEqual(ImageBlob.objects.get().refcount, 0)
+
+    def test_field_delete_keeps_file(self):
+        """Test deleting the field leaves the blob to garbage collection."""
+        patients = create_patients(self.user)
+        self._attach(patients, b'data')
+        path = patients.image.path
+
+        patients.image.delete()
+
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(ImageBlob.objects.get().refcount, 0)
+
+    def test_collect_blobs(self):
+        """Test only unreferenced blobs past the grace period are deleted."""
+        kept = create_patients(self.user)
+        self._attach(kept, b'kept')
+        dropped = create_patients(self.user)
+        self._attach(dropped, b'dropped')
+        dropped_path = dropped.image.path
+        dropped.delete()
+        out = StringIO()
+
+        call_command('collect_blobs', grace=3600, stdout=out)
+        self.assertTrue(os.path.exists(dropped_path))
+
+        call_command('collect_blobs', grace=0, stdout=out)
+
+        self.assertFalse(os.path.exists(dropped_path))
+        self.assertTrue(os.path.exists(kept.image.path))
+        self.assertEqual(
+            list(ImageBlob.objects.values_list('refcount', flat=True)),
+            [1],
+        )
+
+    def test_storage_ignores_requested_name(self):
+        """Test the blob name only keeps the extension of the request."""
+        storage = ContentAddressedStorage(location=self.media.name)
+
+        name = storage.save('uploads/patients/x.PNG', ContentFile(b'png'))
+
+        digest = hashlib.sha256(b'png').hexdigest()
+        self.assertEqual(name, blob_name(digest, '.png'))
@@ -0,0 +1,65 @@
+"""
+Views of the project.
+"""
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import (
+    SCHEMA_KWARGS,
+    SpectacularAPIView,
+)
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+
+from core import metrics, schema
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+@require_GET
+def metrics_view(request):
+    """Return the metrics of every process for Prometheus.
+
+    When METRICS_TOKEN is set, scrapers must send it as a bearer token.
+    """
+    if settings.METRICS_TOKEN and not constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''),
+        f'Bearer {settings.METRICS_TOKEN}',
+    ):
+        return HttpResponseForbidden()
+
+    return HttpResponse(
+        metrics.render(metrics.collect()),
+        content_type=CONTENT_TYPE,
+    )
+
+
+class SchemaView(SpectacularAPIView):
+    """OpenAPI schema precomputed once per code version.
+
+    Responses carry an ETag, so clients revalidate with If-None-Match
+    and get a 304 until the code changes. Translated schemas, asked for
+    with the lang parameter, are still generated on every request.
+    """
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        if settings.USE_I18N and request.GET.get('lang'):
+            return super().get(request, *args, **kwargs)
+
+        renderer = request.accepted_renderer
+        content, etag = schema.get(renderer.format)
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+
+        return get_conditional_response(
+            request,
+            etag=etag,
+            response=response,
+        )
@@ -0,0 +1,99 @@
+"""
+Tag and treatment bitmaps over the rows of a face gallery.
+
+Every tag and treatment of a user has a packed bitmap with one bit per
+gallery row, so a filter like the one of the patients list is resolved
+with a few bitwise operations before any face is scored. Changes to the
+tags or treatments of patients bump a per-user version stored in the
+database from signals, which rebuilds the bitmaps without reloading the
+gallery.
+"""
+import uuid
+
+import numpy as np
+
+from core.models import GalleryVersion, Patients
+
+
+def filter_version(user_id):
+    """Return the current tag and treatment version for a user."""
+    versions, _ = GalleryVersion.objects.get_or_create(user_id=user_id)
+    return versions.filters.hex
+
+
+def bump_filter_version(user_id):
+    """Mark the tags or treatments of a user as changed in every process.
+
+    Without a version yet, the first one read is new already.
+    """
+    GalleryVersion.objects.filter(user_id=user_id).update(
+        filters=uuid.uuid4(),
+    )
+
+
+def _pack(row_lists, count):
+    bitmaps = {}
+    for key, rows in row_lists.items():
+        bits = np.zeros(count, dtype=bool)
+        bits[rows] = True
+        bitmaps[key] = np.packbits(bits)
+    return bitmaps
+
+
+class FilterBitmaps:
+    """Packed bitmaps of the gallery rows of every tag and treatment."""
+
+    def __init__(self, count, tags, treatments, version=None):
+        self.count = count
+        self.tags = tags
+        self.treatments = treatments
+        self.version = version
+
+    @classmethod
+    def load(cls, user_id, patients_ids, version=None):
+        """Build the bitmaps of a gallery from the relation tables."""
+        patients_ids = np.asarray(patients_ids).tolist()
+        row_of = {
+            patients_id: row for row, patients_id in enumerate(patients_ids)
+        }
+        maps = []
+        for through, field in (
+            (Patients.tags.through, 'tag_id'),
+            (Patients.treatment.through, 'treatment_id'),
+        ):
+            row_lists = {}
+            for patients_id, key in through.objects.filter(
+                patients__user_id=user_id,
+            ).values_list('patients_id', field).iterator():
+                row = row_of.get(patients_id)
+                if row is not None:
+                    row_lists.setdefault(key, []).append(row)
+            maps.append(_pack(row_lists, len(row_of)))
+
+        return cls(len(row_of), *maps, version=version)
+
+    def _any(self, bitmaps, keys):
+        packed = np.zeros((self.count + 7) // 8, dtype=np.uint8)
+        for key in keys:
+            bitmap = bitmaps.get(key)
+            if bitmap is not None:
+                packed |= bitmap
+        return packed
+
+    def select(self, tags=None, treatments=None):
+        """Return the gallery rows matching the filters, None for all.
+
+        Like the patients list, rows must have any of the tags and any of
+        the treatments.
+        """
+        if not tags and not treatments:
+            return None
+        packed = np.full((self.count + 7) // 8, 0xFF, dtype=np.uint8)
+        if tags:
+            packed &= self._any(self.tags, tags)
+        if treatments:
+            packed &= self._any(self.treatments, treatments)
+
+        return np.flatnonzero(
+            np.unpackbits(packed, count=self.count)
+        )
@@ -0,0 +1,92 @@
+"""
+Fast decoding of patients images for thumbnails and face crops.
+
+JPEGs are decoded with Pillow's draft mode, which lets the decoder scale
+by 1/2, 1/4 or 1/8 in the DCT domain instead of decoding every pixel.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from itertools import repeat
+
+from django.conf import settings
+
+from PIL import Image, ImageOps
+
+
+def _open(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Image.open(BytesIO(source))
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return Image.open(source)
+
+
+def open_reduced(source, max_edge):
+    """Decode an image with its long edge reduced to at most max_edge.
+
+    Returns the upright RGB image and the scale from original pixels to
+    the returned ones.
+    """
+    with _open(source) as image:
+        original_edge = max(image.size)
+        if image.format == 'JPEG':
+            image.draft('RGB', (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    image.thumbnail((max_edge, max_edge), Image.BILINEAR)
+
+    return image, max(image.size) / original_edge
+
+
+_encode_buffer = BytesIO()
+
+
+def thumbnail(source, max_edge, quality=85):
+    """Return the JPEG bytes of a thumbnail of an image."""
+    image, _ = open_reduced(source, max_edge)
+    _encode_buffer.seek(0)
+    _encode_buffer.truncate()
+    image.save(_encode_buffer, format='JPEG', quality=quality)
+
+    return _encode_buffer.getvalue()
+
+
+def pool_size():
+    """Return the number of decoder processes to run."""
+    return settings.IMAGE_DECODER_WORKERS or os.cpu_count() or 1
+
+
+class DecoderPool:
+    """Bounded pool of decoder processes.
+
+    At most max_pending images are in flight, so memory stays bounded
+    however many images are submitted.
+    """
+
+    def __init__(self, workers=None, max_pending=None):
+        self.workers = workers or pool_size()
+        self.max_pending = max_pending or self.workers * 2
+        self.executor = None
+
+    def __enter__(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.executor.shutdown()
+        self.executor = None
+
+    def map(self, fn, *iterables):
+        """Yield fn applied to the items of iterables, in order."""
+        pending = deque()
+        for args in zip(*iterables):
+            if len(pending) >= self.max_pending:
+                yield pending.popleft().result()
+            pending.append(self.executor.submit(fn, *args))
+        while pending:
+            yield pending.popleft().result()
+
+    def thumbnails(self, sources, max_edge, quality=85):
+        """Yield the JPEG thumbnails of sources, in order."""
+        return self.map(thumbnail, sources, repeat(max_edge), repeat(quality))
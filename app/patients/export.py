@@ -0,0 +1,163 @@
+"""
+Streaming ZIP export of patients images.
+
+The archive is written to an unseekable sink that is drained after every
+chunk, so an export of any size holds one chunk in memory and never
+touches the disk. Images are already compressed, so entries are stored.
+"""
+import csv
+import io
+import os
+import zipfile
+from datetime import datetime
+
+from core.models import PatientsImage
+from core.storage import blob_digest
+from patients.media import image_storage
+
+CHUNK_SIZE = 64 * 1024
+MANIFEST_NAME = 'manifest.csv'
+MANIFEST_FIELDS = [
+    'filename',
+    'patients_id',
+    'first_name',
+    'last_name',
+    'kind',
+    'image_id',
+    'sha256',
+]
+
+
+class _Sink:
+    """Unseekable file collecting what ZipFile writes until drained."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def image_entries(patients):
+    """Yield a manifest row for every image of a patients queryset."""
+    for patients_id, first_name, last_name, name in patients.exclude(
+        image='',
+    ).exclude(image=None).order_by('id').values_list(
+        'id', 'first_name', 'last_name', 'image',
+    ).iterator():
+        yield {
+            'filename': f'{patients_id}/profile{os.path.splitext(name)[1]}',
+            'patients_id': patients_id,
+            'first_name': first_name,
+            'last_name': last_name,
+            'kind': 'profile',
+            'image_id': '',
+            'sha256': blob_digest(name) or '',
+            'name': name,
+        }
+    for image_id, patients_id, first_name, last_name, name in (
+        PatientsImage.objects.filter(
+            patients__in=patients.values('id'),
+        ).order_by('id').values_list(
+            'id',
+            'patients_id',
+            'patients__first_name',
+            'patients__last_name',
+            'image',
+        ).iterator()
+    ):
+        yield {
+            'filename': (
+                f'{patients_id}/images/{image_id}{os.path.splitext(name)[1]}'
+            ),
+            'patients_id': patients_id,
+            'first_name': first_name,
+            'last_name': last_name,
+            'kind': 'gallery',
+            'image_id': image_id,
+            'sha256': blob_digest(name) or '',
+            'name': name,
+        }
+
+
+def _read_chunks(storage, name):
+    with storage.open(name, 'rb') as image_file:
+        while True:
+            chunk = image_file.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _manifest_chunks(entries):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(
+        buffer,
+        fieldnames=MANIFEST_FIELDS,
+        extrasaction='ignore',
+    )
+    writer.writeheader()
+    for entry in entries:
+        writer.writerow(entry)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def _write_entry(archive, sink, arcname, chunks, size=None):
+    info = zipfile.ZipInfo(arcname, datetime.now().timetuple()[:6])
+    if size is not None:
+        info.file_size = size
+    with archive.open(info, 'w', force_zip64=size is None) as entry:
+        for chunk in chunks:
+            entry.write(chunk)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def stream_images(patients):
+    """Yield the bytes of a ZIP of the images of a patients queryset.
+
+    Images missing from storage are left out of the archive and the
+    manifest, which is written last.
+    """
+    for chunk in _zip_chunks(patients):
+        if chunk:
+            yield chunk
+
+
+def _zip_chunks(patients):
+    storage = image_storage()
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+        for entry in image_entries(patients):
+            if not storage.exists(entry['name']):
+                continue
+            yield from _write_entry(
+                archive,
+                sink,
+                entry['filename'],
+                _read_chunks(storage, entry['name']),
+                storage.size(entry['name']),
+            )
+        yield from _write_entry(
+            archive,
+            sink,
+            MANIFEST_NAME,
+            _manifest_chunks(
+                entry for entry in image_entries(patients)
+                if storage.exists(entry['name'])
+            ),
+        )
+    yield sink.drain()
@@ -0,0 +1,396 @@
+"""
+Face detection and embedding for patients images.
+"""
+import numpy as np
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from PIL import Image, ImageOps
+
+from core.models import (
+    FaceEmbedding,
+    FaceExtractorVersion,
+    FaceTemplate,
+)
+from patients.decoding import open_reduced
+
+
+class PixelProjectionExtractor:
+    """Embed faces with a fixed random projection of normalized pixels.
+
+    The mobile app runs face detection on the device and sends boxes along
+    with the image; when no boxes are given the whole image is one face.
+    """
+    version = 'pixproj-1'
+
+    def __init__(self, size=64, dim=128, seed=0):
+        self.size = size
+        self.dim = dim
+        rng = np.random.default_rng(seed)
+        self.projection = rng.standard_normal(
+            (size * size, dim)
+        ).astype(np.float32) / np.float32(np.sqrt(dim))
+
+    def detect(self, image):
+        """Return the face boxes (x, y, width, height) found in image."""
+        width, height = image.size
+        return [(0, 0, width, height)]
+
+    def crop(self, image, box):
+        """Return the normalized grayscale pixels of one face box."""
+        x, y, width, height = box
+        face = image.crop((x, y, x + width, y + height))
+        face = ImageOps.grayscale(face).resize(
+            (self.size, self.size),
+            Image.BILINEAR,
+        )
+        return np.asarray(face, dtype=np.float32).reshape(-1)
+
+    def embed(self, crops):
+        """Embed a (n, size*size) matrix of crops as unit vectors."""
+        pixels = np.asarray(crops, dtype=np.float32).reshape(
+            -1, self.size * self.size
+        )
+        pixels = pixels - pixels.mean(axis=1, keepdims=True)
+        pixels /= pixels.std(axis=1, keepdims=True) + 1e-6
+        vectors = pixels @ self.projection
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        return vectors.astype(np.float32)
+
+
+_extractors = {}
+
+
+def _load_extractor(path):
+    extractor = _extractors.get(path)
+    if extractor is None:
+        extractor = _extractors[path] = import_string(path)()
+    return extractor
+
+
+def get_extractor(version=None):
+    """Return the configured face extractor, or the one of a version."""
+    extractor = _load_extractor(settings.FACE_EXTRACTOR)
+    if version is None or extractor.version == version:
+        return extractor
+    for path in settings.FACE_LEGACY_EXTRACTORS:
+        extractor = _load_extractor(path)
+        if extractor.version == version:
+            return extractor
+    raise ImproperlyConfigured(f'No face extractor has version {version}.')
+
+
+ACTIVE_VERSION_KEY = 'faces:active-extractor'
+
+
+def active_version():
+    """Return the extractor version whose embeddings are matched.
+
+    Without any active version yet, the configured extractor becomes
+    the active one. The version is read from the database and cached for
+    FACE_ACTIVE_VERSION_TTL seconds.
+    """
+    version = cache.get(ACTIVE_VERSION_KEY)
+    if version is None:
+        version = FaceExtractorVersion.objects.filter(
+            active=True,
+        ).values_list('version', flat=True).first()
+        if version is None:
+            version = get_extractor().version
+            FaceExtractorVersion.objects.update_or_create(
+                version=version,
+                defaults={'active': True, 'activated': timezone.now()},
+            )
+        cache.set(
+            ACTIVE_VERSION_KEY,
+            version,
+            settings.FACE_ACTIVE_VERSION_TTL,
+        )
+    return version
+
+
+def enrolled_versions():
+    """Return the extractor versions new images are embedded with.
+
+    While the configured extractor is not active yet, images are
+    embedded with both, so re-indexing never falls behind uploads.
+    """
+    versions = [active_version()]
+    if get_extractor().version not in versions:
+        versions.append(get_extractor().version)
+    return versions
+
+
+def activate_version(version):
+    """Atomically switch matching to the embeddings of a version."""
+    with transaction.atomic():
+        FaceExtractorVersion.objects.filter(active=True).update(active=False)
+        FaceExtractorVersion.objects.update_or_create(
+            version=version,
+            defaults={'active': True, 'activated': timezone.now()},
+        )
+        transaction.on_commit(lambda: cache.delete(ACTIVE_VERSION_KEY))
+    cache.delete(ACTIVE_VERSION_KEY)
+
+
+def load_images(image_files, boxes=None):
+    """Decode images reduced for face extraction.
+
+    Returns the images, the boxes scaled to and clamped within the
+    reduced images and the scale applied to each image.
+    """
+    images = []
+    scales = []
+    for image_file in image_files:
+        image, scale = open_reduced(image_file, settings.FACE_DECODE_MAX_EDGE)
+        images.append(image)
+        scales.append(scale)
+    if boxes is not None:
+        boxes = [
+            [
+                clamp_box(scale_box(box, scale), image.size)
+                for box in image_boxes
+            ]
+            if image_boxes else None
+            for image_boxes, scale, image in zip(boxes, scales, images)
+        ]
+
+    return images, boxes, scales
+
+
+def scale_box(box, scale):
+    """Scale a (x, y, width, height) box, keeping it at least 1 pixel."""
+    x, y, width, height = box
+    return (
+        int(x * scale),
+        int(y * scale),
+        max(1, round(width * scale)),
+        max(1, round(height * scale)),
+    )
+
+
+def clamp_box(box, size):
+    """Clamp a (x, y, width, height) box within an image of a size.
+
+    Boxes outside the image shrink to 1 pixel on its edge, so a crop is
+    never larger than the image.
+    """
+    x, y, width, height = box
+    image_width, image_height = size
+    x = min(x, image_width - 1)
+    y = min(y, image_height - 1)
+    return (
+        x,
+        y,
+        max(1, min(width, image_width - x)),
+        max(1, min(height, image_height - y)),
+    )
+
+
+def extract_faces(images, boxes=None, extractor=None):
+    """Detect and embed the faces of several images in one batch.
+
+    Returns the list of boxes per image and a single (n, dim) matrix with
+    one row per face, in image order.
+    """
+    extractor = extractor or get_extractor()
+    if boxes is None:
+        boxes = [None] * len(images)
+    image_boxes = []
+    crops = []
+    for image, image_box in zip(images, boxes):
+        if not image_box:
+            image_box = extractor.detect(image)
+        image_box = [tuple(int(v) for v in box) for box in image_box]
+        image_boxes.append(image_box)
+        crops.extend(extractor.crop(image, box) for box in image_box)
+    if not crops:
+        return image_boxes, np.empty((0, extractor.dim), dtype=np.float32)
+
+    return image_boxes, extractor.embed(np.stack(crops))
+
+
+QUALITY_EDGE = 112
+QUALITY_SHARPNESS = 100.0
+
+
+def face_quality(image, box):
+    """Score a face box between 0 and 1 from its size and sharpness.
+
+    Sharpness is the variance of the Laplacian of the grayscale face;
+    faces smaller than QUALITY_EDGE pixels are penalized linearly.
+    """
+    x, y, width, height = box
+    face = ImageOps.grayscale(image.crop((x, y, x + width, y + height)))
+    face.thumbnail((QUALITY_EDGE, QUALITY_EDGE), Image.BILINEAR)
+    pixels = np.asarray(face, dtype=np.float32)
+    if min(pixels.shape) < 3:
+        return 0.0
+    laplacian = (
+        pixels[:-2, 1:-1] + pixels[2:, 1:-1]
+        + pixels[1:-1, :-2] + pixels[1:-1, 2:]
+        - 4 * pixels[1:-1, 1:-1]
+    )
+    variance = float(laplacian.var())
+    sharpness = variance / (variance + QUALITY_SHARPNESS)
+    size = min(1.0, min(width, height) / QUALITY_EDGE)
+
+    return sharpness * size
+
+
+def embed_largest_faces(images, extractor=None):
+    """Embed the largest face of every image in one batch.
+
+    Returns the (n, dim) matrix of embeddings and the quality of each face.
+    """
+    extractor = extractor or get_extractor()
+    boxes = [
+        [max(extractor.detect(image), key=lambda box: box[2] * box[3])]
+        for image in images
+    ]
+    _, vectors = extract_faces(images, boxes, extractor)
+    qualities = [
+        face_quality(image, image_boxes[0])
+        for image, image_boxes in zip(images, boxes)
+    ]
+
+    return vectors, qualities
+
+
+def embed_image(image_field, versions):
+    """Embed the largest face of a stored image with several extractors.
+
+    Returns a {version: (vector, quality)} dict.
+    """
+    with image_field.open('rb') as image_file:
+        images, _, _ = load_images([image_file])
+    embedded = {}
+    for version in versions:
+        vectors, qualities = embed_largest_faces(
+            images,
+            get_extractor(version),
+        )
+        embedded[version] = (vectors[0], qualities[0])
+
+    return embedded
+
+
+def create_embeddings(patients, embedded, patients_image=None):
+    """Store the embeddings returned by embed_image."""
+    return [
+        FaceEmbedding.objects.create(
+            user_id=patients.user_id,
+            patients=patients,
+            patients_image=patients_image,
+            vector=vector.tobytes(),
+            quality=quality,
+            extractor_version=version,
+        )
+        for version, (vector, quality) in embedded.items()
+    ]
+
+
+def enroll(patients, source=None):
+    """Replace the face embeddings of a patients from its image.
+
+    Only the largest face of the image is enrolled, with every enrolled
+    extractor version. When the image is a duplicate of the image of
+    source, its embeddings are reused instead. Gallery images keep their
+    own embeddings.
+    """
+    versions = enrolled_versions()
+    FaceEmbedding.objects.filter(
+        patients=patients,
+        patients_image__isnull=True,
+    ).delete()
+    embeddings = []
+    if patients.image:
+        if source is not None:
+            for embedding in source.face_embeddings.filter(
+                patients_image__isnull=True,
+                extractor_version__in=versions,
+            ):
+                embeddings.append(FaceEmbedding.objects.create(
+                    user_id=patients.user_id,
+                    patients=patients,
+                    vector=embedding.vector,
+                    quality=embedding.quality,
+                    extractor_version=embedding.extractor_version,
+                ))
+        copied = {embedding.extractor_version for embedding in embeddings}
+        missing = [version for version in versions if version not in copied]
+        if missing:
+            embeddings.extend(create_embeddings(
+                patients,
+                embed_image(patients.image, missing),
+            ))
+    update_template(patients, versions)
+
+    return embeddings
+
+
+def enroll_image(patients_image):
+    """Embed the largest face of a gallery image of a patients."""
+    patients = patients_image.patients
+    versions = enrolled_versions()
+    embeddings = create_embeddings(
+        patients,
+        embed_image(patients_image.image, versions),
+        patients_image,
+    )
+    update_template(patients, versions)
+
+    return embeddings
+
+
+MIN_TEMPLATE_WEIGHT = 1e-3
+
+
+def aggregate(vectors, qualities):
+    """Return the unit quality weighted mean of embeddings."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    weights = np.maximum(
+        np.asarray(qualities, dtype=np.float32),
+        MIN_TEMPLATE_WEIGHT,
+    )
+    template = weights @ vectors
+    template /= np.linalg.norm(template) + 1e-12
+
+    return template.astype(np.float32)
+
+
+def update_template(patients, versions=None):
+    """Recompute the face templates of a patients from its embeddings.
+
+    One template is kept per extractor version, by default for every
+    enrolled version.
+    """
+    for version in versions or enrolled_versions():
+        rows = list(FaceEmbedding.objects.filter(
+            patients=patients,
+            extractor_version=version,
+        ).values_list('vector', 'quality'))
+        if not rows:
+            FaceTemplate.objects.filter(
+                patients=patients,
+                extractor_version=version,
+            ).delete()
+            continue
+        template = aggregate(
+            [np.frombuffer(bytes(vector), np.float32) for vector, _ in rows],
+            [quality for _, quality in rows],
+        )
+        FaceTemplate.objects.update_or_create(
+            patients=patients,
+            extractor_version=version,
+            defaults={
+                'user_id': patients.user_id,
+                'vector': template.tobytes(),
+                'image_count': len(rows),
+            },
+        )
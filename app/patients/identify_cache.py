@@ -0,0 +1,81 @@
+"""
+Cache of identification results keyed by probe content.
+
+Keys combine the user, the SHA-256 of the probe bytes, the boxes, k, the
+tag and treatment filters and the gallery version, so any change to a
+user's gallery makes their old entries unreachable. Entries live in a
+bounded in-process LRU backed by the shared Django cache.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def probe_digest(image_file):
+    """Return the SHA-256 of an uploaded probe file."""
+    digest = hashlib.sha256()
+    image_file.seek(0)
+    if hasattr(image_file, 'chunks'):
+        for chunk in image_file.chunks():
+            digest.update(chunk)
+    else:
+        digest.update(image_file.read())
+    image_file.seek(0)
+
+    return digest.hexdigest()
+
+
+def result_key(user_id, version, image_file, boxes, k, filters=None):
+    """Return the cache key of the identification of one probe."""
+    params = json.dumps([boxes, k, filters], separators=(',', ':'))
+    return 'faces:identify:{}:{}:{}:{}'.format(
+        user_id,
+        version,
+        probe_digest(image_file),
+        hashlib.sha256(params.encode()).hexdigest()[:16],
+    )
+
+
+class ResultCache:
+    """Bounded LRU of identification results."""
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return a cached result or None."""
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+                return result
+        result = cache.get(key)
+        if result is not None:
+            self._remember(key, result)
+        return result
+
+    def set(self, key, result):
+        """Cache a result in both tiers."""
+        self._remember(key, result)
+        cache.set(key, result, settings.FACE_RESULT_CACHE_TIMEOUT)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def _remember(self, key, result):
+        max_entries = self.max_entries or settings.FACE_RESULT_CACHE_SIZE
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > max_entries:
+                self.entries.popitem(last=False)
+
+
+results = ResultCache()
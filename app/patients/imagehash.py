@@ -0,0 +1,165 @@
+"""
+Perceptual hashing of patients images to find near-duplicate uploads.
+
+Hashes are 64-bit dHashes. Near-duplicates are looked up with
+multi-index hashing: the hash is split into HASH_BANDS bands that are
+stored in indexed columns, and by the pigeonhole principle any hash
+within HASH_BANDS - 1 bits shares at least one band exactly.
+"""
+from django.db.models import Q
+
+from PIL import Image, ImageOps
+
+HASH_BITS = 64
+HASH_BANDS = 4
+BAND_BITS = HASH_BITS // HASH_BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+
+def dhash(image):
+    """Return the 64-bit difference hash of an image."""
+    if image.format == 'JPEG':
+        image.draft('L', (64, 64))
+    image = ImageOps.grayscale(image).resize((9, 8), Image.LANCZOS)
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+
+    return value
+
+
+def hash_file(image_file):
+    """Return the dHash of an image file."""
+    if hasattr(image_file, 'seek'):
+        image_file.seek(0)
+    with Image.open(image_file) as image:
+        value = dhash(image)
+    if hasattr(image_file, 'seek'):
+        image_file.seek(0)
+
+    return value
+
+
+def hamming(a, b):
+    """Return the number of differing bits of two hashes."""
+    return bin(a ^ b).count('1')
+
+
+def to_signed(value):
+    """Convert an unsigned 64-bit hash to fit a BigIntegerField."""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def to_unsigned(value):
+    """Convert a stored signed hash back to unsigned."""
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+def hash_bands(value):
+    """Split a hash into its bands, most significant first."""
+    return [
+        (value >> (BAND_BITS * (HASH_BANDS - 1 - band))) & BAND_MASK
+        for band in range(HASH_BANDS)
+    ]
+
+
+def hash_fields(value, prefix='image_hash'):
+    """Return the model field values storing a hash and its bands."""
+    if value is None:
+        fields = {prefix: None}
+        fields.update({f'{prefix}_{b}': None for b in range(HASH_BANDS)})
+        return fields
+    fields = {prefix: to_signed(value)}
+    for band, band_value in enumerate(hash_bands(value)):
+        fields[f'{prefix}_{band}'] = band_value
+
+    return fields
+
+
+def find_duplicates(queryset, value, max_distance, prefix='image_hash'):
+    """Return (obj, distance) pairs of queryset within max_distance.
+
+    Only distances below HASH_BANDS are guaranteed to be found.
+    """
+    query = Q()
+    for band, band_value in enumerate(hash_bands(value)):
+        query |= Q(**{f'{prefix}_{band}': band_value})
+    matches = []
+    for obj in queryset.filter(query):
+        distance = hamming(value, to_unsigned(getattr(obj, prefix)))
+        if distance <= max_distance:
+            matches.append((obj, distance))
+
+    return sorted(matches, key=lambda match: match[1])
+
+
+class BKTree:
+    """Burkhard-Keller tree of hashes under the Hamming distance."""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, item):
+        """Add a hash with an associated item."""
+        node = (value, [item], {})
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming(value, current[0])
+            if distance == 0:
+                current[1].append(item)
+                return
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value, max_distance):
+        """Return (item, distance) pairs within max_distance of value."""
+        if self.root is None:
+            return []
+        matches = []
+        stack = [self.root]
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= max_distance:
+                matches.extend((item, distance) for item in items)
+            low = distance - max_distance
+            high = distance + max_distance
+            stack.extend(
+                child for child_distance, child in children.items()
+                if low <= child_distance <= high
+            )
+
+        return matches
+
+
+def duplicate_clusters(hashes, max_distance):
+    """Group (item, hash) pairs into clusters of near-duplicates."""
+    tree = BKTree()
+    for item, value in hashes:
+        tree.add(value, item)
+    parent = {item: item for item, _ in hashes}
+
+    def find(item):
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    for item, value in hashes:
+        for other, _ in tree.search(value, max_distance):
+            parent[find(other)] = find(item)
+    clusters = {}
+    for item, _ in hashes:
+        clusters.setdefault(find(item), []).append(item)
+
+    return [sorted(items) for items in clusters.values() if len(items) > 1]
@@ -0,0 +1,110 @@
+"""
+Normalization of patients images at upload time.
+"""
+import os
+import warnings
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+from PIL import Image, ImageOps
+
+
+class ImageRejected(ValueError):
+    """Upload refused from its size or header."""
+
+
+def check_image(image_file):
+    """Check the size, format and dimensions of an upload.
+
+    Only the header is parsed, so hostile files such as decompression
+    bombs are refused before any pixel is decoded. Returns the format
+    and the (width, height) of the image.
+    """
+    size = getattr(image_file, 'size', None)
+    if size is not None and size > settings.IMAGE_MAX_UPLOAD_BYTES:
+        raise ImageRejected(
+            f'Images must be at most {settings.IMAGE_MAX_UPLOAD_BYTES} bytes.'
+        )
+    image_file.seek(0)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(
+                image_file,
+                formats=settings.IMAGE_ALLOWED_FORMATS,
+            ) as image:
+                image_format = image.format
+                width, height = image.size
+    except Image.DecompressionBombError:
+        raise ImageRejected('Image has too many pixels.')
+    except (OSError, SyntaxError, ValueError):
+        raise ImageRejected(
+            'Upload a valid image in one of these formats: '
+            + ', '.join(settings.IMAGE_ALLOWED_FORMATS) + '.'
+        )
+    finally:
+        image_file.seek(0)
+
+    if max(width, height) > settings.IMAGE_MAX_DIMENSION:
+        raise ImageRejected(
+            f'Image sides must be at most {settings.IMAGE_MAX_DIMENSION} '
+            'pixels.'
+        )
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise ImageRejected(
+            f'Images must have at most {settings.IMAGE_MAX_PIXELS} pixels.'
+        )
+
+    return image_format, (width, height)
+
+
+def normalize_image(image_file, max_edge=None, quality=None):
+    """Return an upright, downscaled JPEG copy of an uploaded image.
+
+    EXIF orientation is applied, the long edge is capped at max_edge and
+    all metadata but the color profile is dropped.
+    """
+    max_edge = max_edge or settings.IMAGE_MAX_EDGE
+    quality = quality or settings.IMAGE_JPEG_QUALITY
+    image_file.seek(0)
+    with Image.open(image_file) as image:
+        if image.format == 'JPEG':
+            image.draft('RGB', (max_edge, max_edge))
+        icc_profile = image.info.get('icc_profile')
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        buffer = BytesIO()
+        options = {'quality': quality, 'optimize': True}
+        if icc_profile:
+            options['icc_profile'] = icc_profile
+        image.save(buffer, format='JPEG', **options)
+    image_file.seek(0)
+
+    name = os.path.splitext(os.path.basename(image_file.name or 'image'))[0]
+    return ContentFile(buffer.getvalue(), name=f'{name}.jpg')
+
+
+def keep_original(name, original):
+    """Store the original upload next to its normalized copy name.
+
+    Originals are only kept when IMAGE_ORIGINALS_ROOT is set.
+    """
+    root = settings.IMAGE_ORIGINALS_ROOT
+    if not root:
+        return None
+    storage = FileSystemStorage(location=root)
+    base = os.path.splitext(os.path.basename(name))[0]
+    ext = os.path.splitext(original.name or '')[1].lower()
+    original.seek(0)
+
+    return storage.save(f'{base}{ext}', original)
@@ -0,0 +1,275 @@
+"""
+Django command to enroll patients faces in bulk.
+"""
+import csv
+import os
+import time
+import zipfile
+from io import BytesIO
+from itertools import repeat
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.models import (
+    FaceEmbedding,
+    Patients,
+)
+from patients import (
+    imagehash,
+    ingest,
+)
+from patients.decoding import DecoderPool
+from patients.faces import (
+    embed_largest_faces,
+    enrolled_versions,
+    get_extractor,
+    load_images,
+    update_template,
+)
+from patients.matcher import bump_gallery_version
+
+
+_archives = {}
+
+
+def _read(source, name):
+    """Read one file of a folder or zip source."""
+    if os.path.isfile(source):
+        if source not in _archives:
+            _archives[source] = zipfile.ZipFile(source)
+        return _archives[source].read(name)
+    root = os.path.realpath(source)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(f'{name} is outside of {source}.')
+    with open(path, 'rb') as image_file:
+        return image_file.read()
+
+
+def prepare_chunk(source, names, versions):
+    """Normalize, hash and embed a chunk of images in a worker process.
+
+    Images are embedded with every extractor version given. Returns
+    (name, image bytes, hash, {version: (vector bytes, quality)}, error)
+    tuples.
+    """
+    prepared = []
+    images = []
+    for name in names:
+        try:
+            upload = BytesIO(_read(source, name))
+            upload.name = os.path.basename(name)
+            ingest.check_image(upload)
+            normalized = ingest.normalize_image(upload).read()
+            value = imagehash.hash_file(BytesIO(normalized))
+            loaded, _, _ = load_images([BytesIO(normalized)])
+        except (OSError, ValueError, KeyError, SyntaxError) as error:
+            prepared.append((name, None, None, str(error)))
+            continue
+        images.extend(loaded)
+        prepared.append((name, normalized, value, None))
+
+    embedded = {}
+    if images:
+        for version in versions:
+            vectors, qualities = embed_largest_faces(
+                images,
+                get_extractor(version),
+            )
+            embedded[version] = iter(zip(vectors, qualities))
+    results = []
+    for name, data, value, error in prepared:
+        if data is None:
+            results.append((name, data, value, None, error))
+            continue
+        faces = {}
+        for version, embeddings in embedded.items():
+            vector, quality = next(embeddings)
+            faces[version] = (vector.tobytes(), quality)
+        results.append((name, data, value, faces, error))
+
+    return results
+
+
+class Command(BaseCommand):
+    """Django command to enroll patients faces from a folder or zip.
+
+    Images are normalized, hashed and embedded across a process pool and
+    written in batches. Enrolled files are appended to a checkpoint file
+    after every batch, so an interrupted run resumes where it stopped and
+    failed files are retried.
+    """
+
+    help = 'Enroll patients faces from a folder or zip of images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Folder or zip file of images.')
+        parser.add_argument(
+            'manifest',
+            help='CSV file with filename and patients_id columns.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=0,
+            help='Worker processes, defaults to one per core.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=16,
+            help='Images embedded together by a worker.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=256,
+            help='Images written per transaction.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='File listing enrolled images, defaults to MANIFEST.done.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        source = options['source']
+        if not os.path.exists(source):
+            raise CommandError(f'{source} does not exist.')
+        if os.path.isfile(source) and not zipfile.is_zipfile(source):
+            raise CommandError(f'{source} is not a folder or zip file.')
+        checkpoint = options['checkpoint'] or f'{options["manifest"]}.done'
+        targets = self._targets(options['manifest'])
+        done = self._done(checkpoint)
+        names = [name for name in targets if name not in done]
+        self.stdout.write(
+            f'{len(names)} image(s) to enroll, {len(done)} already done.'
+        )
+
+        chunk_size = options['chunk_size']
+        chunks = [
+            names[start:start + chunk_size]
+            for start in range(0, len(names), chunk_size)
+        ]
+        started = time.perf_counter()
+        enrolled = 0
+        failed = 0
+        with DecoderPool(workers=options['workers'] or None) as pool, \
+                open(checkpoint, 'a') as log:
+            batch = []
+            for results in pool.map(
+                prepare_chunk,
+                repeat(source),
+                chunks,
+                repeat(enrolled_versions()),
+            ):
+                batch.extend(results)
+                if len(batch) >= options['batch_size']:
+                    written = self._write(batch, targets, log)
+                    enrolled += written
+                    failed += len(batch) - written
+                    batch = []
+            if batch:
+                written = self._write(batch, targets, log)
+                enrolled += written
+                failed += len(batch) - written
+
+        elapsed = time.perf_counter() - started
+        rate = enrolled / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Enrolled {enrolled} image(s), {failed} failed, '
+            f'{rate:.1f} images/s.'
+        ))
+
+    def _targets(self, manifest):
+        """Map manifest filenames to the list of their patients.
+
+        A file may be shared by several patients, but each patients has a
+        single image, so patients listed on several rows are rejected.
+        """
+        with open(manifest, newline='') as manifest_file:
+            rows = list(csv.DictReader(manifest_file))
+        by_patients = {}
+        for line, row in enumerate(rows, start=2):
+            by_patients.setdefault(int(row['patients_id']), []).append(line)
+        duplicates = {
+            patients_id: lines
+            for patients_id, lines in by_patients.items()
+            if len(lines) > 1
+        }
+        if duplicates:
+            raise CommandError('Patients listed on several rows: ' + ', '.join(
+                f'{patients_id} (rows {", ".join(map(str, lines))})'
+                for patients_id, lines in duplicates.items()
+            ) + '.')
+        patients = Patients.objects.in_bulk(list(by_patients))
+        targets = {}
+        for row in rows:
+            patients_id = int(row['patients_id'])
+            if patients_id not in patients:
+                self.stderr.write(f'Patients {patients_id} not found.')
+                continue
+            targets.setdefault(row['filename'], []).append(
+                patients[patients_id],
+            )
+
+        return targets
+
+    def _done(self, checkpoint):
+        """Return the filenames already enrolled."""
+        if not os.path.exists(checkpoint):
+            return set()
+        with open(checkpoint) as log:
+            return {line.rstrip('\n') for line in log if line.strip()}
+
+    def _write(self, batch, targets, log):
+        """Store a batch of prepared images and their embeddings."""
+        hash_fields = list(imagehash.hash_fields(None))
+        embeddings = []
+        enrolled = []
+        names = []
+        with transaction.atomic():
+            for name, data, value, faces, error in batch:
+                if error is not None:
+                    self.stderr.write(f'Cannot enroll {name}: {error}')
+                    continue
+                names.append(name)
+                for patients in targets[name]:
+                    patients.image.save(
+                        os.path.basename(name),
+                        ContentFile(data),
+                        save=False,
+                    )
+                    for field, field_value in imagehash.hash_fields(
+                        value
+                    ).items():
+                        setattr(patients, field, field_value)
+                    patients.save(update_fields=['image'] + hash_fields)
+                    enrolled.append(patients)
+                    embeddings.extend(
+                        FaceEmbedding(
+                            user_id=patients.user_id,
+                            patients=patients,
+                            vector=vector,
+                            quality=quality,
+                            extractor_version=version,
+                        )
+                        for version, (vector, quality) in faces.items()
+                    )
+            FaceEmbedding.objects.filter(
+                patients__in=enrolled,
+                patients_image__isnull=True,
+            ).delete()
+            FaceEmbedding.objects.bulk_create(embeddings)
+            for patients in enrolled:
+                update_template(patients)
+
+        for user_id in {patients.user_id for patients in enrolled}:
+            bump_gallery_version(user_id)
+        log.write(''.join(f'{name}\n' for name in names))
+        log.flush()
+        os.fsync(log.fileno())
+
+        return len(names)
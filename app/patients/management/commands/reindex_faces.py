@@ -0,0 +1,174 @@
+"""
+Django command to re-index faces with the configured extractor.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from core.models import (
+    FaceEmbedding,
+    FaceExtractorVersion,
+    FaceTemplate,
+    Patients,
+    PatientsImage,
+)
+from patients.faces import (
+    activate_version,
+    active_version,
+    create_embeddings,
+    embed_image,
+    get_extractor,
+    update_template,
+)
+
+
+def missing_profiles(version):
+    """Return the patients whose image has no embedding of a version."""
+    return Patients.objects.exclude(image='').exclude(image=None).filter(
+        ~Exists(FaceEmbedding.objects.filter(
+            patients=OuterRef('pk'),
+            patients_image__isnull=True,
+            extractor_version=version,
+        ))
+    )
+
+
+def missing_images(version):
+    """Return the gallery images without an embedding of a version."""
+    return PatientsImage.objects.filter(
+        ~Exists(FaceEmbedding.objects.filter(
+            patients_image=OuterRef('pk'),
+            extractor_version=version,
+        ))
+    )
+
+
+class Command(BaseCommand):
+    """Django command to embed every image with the configured extractor.
+
+    The active extractor keeps being served while this runs. Patients are
+    processed in id order in small transactions, and the last id done is
+    saved with each batch, so an interrupted run resumes where it
+    stopped. Uploads made meanwhile are embedded with both extractors.
+    Once every image has an embedding of the new extractor, matching
+    switches to it in one transaction.
+    """
+
+    help = 'Re-index patients faces with the configured extractor.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Patients re-indexed per transaction.',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=1.0,
+            help='Seconds to pause between batches.',
+        )
+        parser.add_argument(
+            '--no-activate',
+            action='store_true',
+            help='Do not switch to the new extractor when complete.',
+        )
+        parser.add_argument(
+            '--prune',
+            action='store_true',
+            help='Delete embeddings of other extractors once switched.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        current = active_version()
+        version = get_extractor().version
+        state, _ = FaceExtractorVersion.objects.get_or_create(version=version)
+        if version == current:
+            self.stdout.write(f'Extractor {version} is already active.')
+        else:
+            self.stdout.write(
+                f'Re-indexing from {current} to {version}, '
+                f'resuming after patients {state.checkpoint}.'
+            )
+            self._reindex(state, options['batch_size'], options['sleep'])
+            failed = self._catch_up(version)
+            if failed:
+                self.stderr.write(
+                    f'{failed} image(s) could not be re-indexed, '
+                    f'{version} was not activated.'
+                )
+                return
+            if options['no_activate']:
+                self.stdout.write(f'Extractor {version} is ready.')
+                return
+            activate_version(version)
+            self.stdout.write(self.style.SUCCESS(
+                f'Extractor {version} is now active.'
+            ))
+
+        if options['prune']:
+            deleted = 0
+            for model in (FaceTemplate, FaceEmbedding):
+                deleted += model.objects.exclude(
+                    extractor_version=version,
+                ).delete()[0]
+            self.stdout.write(f'Deleted {deleted} old row(s).')
+
+    def _reindex(self, state, batch_size, sleep):
+        """Re-index every patients after the checkpoint, batch by batch."""
+        while True:
+            batch = list(Patients.objects.filter(
+                id__gt=state.checkpoint,
+            ).order_by('id')[:batch_size])
+            if not batch:
+                return
+            with transaction.atomic():
+                for patients in batch:
+                    self._reindex_patients(patients, state.version)
+                state.checkpoint = batch[-1].id
+                state.save(update_fields=['checkpoint'])
+            self.stdout.write(f'Re-indexed up to patients {state.checkpoint}.')
+            if sleep:
+                time.sleep(sleep)
+
+    def _catch_up(self, version):
+        """Re-index images still missing an embedding, return failures."""
+        patients_ids = set(
+            missing_profiles(version).values_list('id', flat=True)
+        )
+        patients_ids.update(
+            missing_images(version).values_list('patients_id', flat=True)
+        )
+        for patients in Patients.objects.filter(id__in=patients_ids):
+            with transaction.atomic():
+                self._reindex_patients(patients, version)
+
+        return (
+            missing_profiles(version).count()
+            + missing_images(version).count()
+        )
+
+    def _reindex_patients(self, patients, version):
+        """Embed the images of a patients missing a version."""
+        sources = []
+        if missing_profiles(version).filter(pk=patients.pk).exists():
+            sources.append((patients.image, None))
+        for patients_image in missing_images(version).filter(
+            patients=patients,
+        ):
+            sources.append((patients_image.image, patients_image))
+        for image, patients_image in sources:
+            try:
+                embedded = embed_image(image, [version])
+            except (OSError, ValueError, SyntaxError) as error:
+                self.stderr.write(
+                    f'Cannot re-index {image.name} of patients '
+                    f'{patients.id}: {error}'
+                )
+                continue
+            create_embeddings(patients, embedded, patients_image)
+        update_template(patients, [version])
@@ -0,0 +1,78 @@
+"""
+Django command to report duplicate patients images.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Patients
+from patients import imagehash
+
+
+class Command(BaseCommand):
+    """Django command to report clusters of near-duplicate images."""
+
+    help = 'Report clusters of near-duplicate patients images per user.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Email of the user to report.')
+        parser.add_argument(
+            '--distance',
+            type=int,
+            default=settings.IMAGE_DUPLICATE_DISTANCE,
+            help='Largest hash distance between duplicates.',
+        )
+        parser.add_argument(
+            '--backfill',
+            action='store_true',
+            help='Hash images uploaded before hashes were stored.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        users = get_user_model().objects.order_by('id')
+        if options['user']:
+            users = users.filter(email=options['user'])
+            if not users.exists():
+                raise CommandError(f'User {options["user"]} not found.')
+        if options['backfill']:
+            self._backfill()
+
+        total = 0
+        for user in users:
+            rows = Patients.objects.filter(
+                user=user,
+                image_hash__isnull=False,
+            ).values_list('id', 'image_hash')
+            hashes = [
+                (patients_id, imagehash.to_unsigned(value))
+                for patients_id, value in rows
+            ]
+            clusters = imagehash.duplicate_clusters(
+                hashes,
+                options['distance'],
+            )
+            for cluster in clusters:
+                ids = ', '.join(str(patients_id) for patients_id in cluster)
+                self.stdout.write(f'{user.email}: {ids}')
+            total += len(clusters)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} duplicate cluster(s) found.'
+        ))
+
+    def _backfill(self):
+        """Store the hash of every image that has none yet."""
+        missing = Patients.objects.filter(
+            image_hash__isnull=True,
+        ).exclude(image='').exclude(image__isnull=True)
+        for patients in missing.iterator():
+            try:
+                with patients.image.open('rb') as image_file:
+                    value = imagehash.hash_file(image_file)
+            except (OSError, ValueError):
+                self.stderr.write(f'Cannot hash image of {patients.id}.')
+                continue
+            Patients.objects.filter(id=patients.id).update(
+                **imagehash.hash_fields(value)
+            )
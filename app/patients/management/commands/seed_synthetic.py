@@ -0,0 +1,484 @@
+"""
+Django command to seed a synthetic dataset for load and benchmark tests.
+"""
+import datetime
+import io
+import time
+from collections import Counter
+from io import BytesIO
+
+import numpy as np
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import F
+
+from benchmarks import synthetic_face
+from core.models import (
+    FaceEmbedding,
+    FaceTemplate,
+    ImageBlob,
+    Patients,
+    Tag,
+    Treatment,
+)
+from core.storage import blob_digest
+from patients import imagehash
+from patients.bitmaps import bump_filter_version
+from patients.faces import (
+    aggregate,
+    embed_largest_faces,
+    enrolled_versions,
+    get_extractor,
+    load_images,
+)
+from patients.matcher import bump_gallery_version
+
+FIRST_NAMES = (
+    'Amelia', 'Ben', 'Carlos', 'Dana', 'Elif', 'Farah', 'George', 'Hana',
+    'Ivan', 'Jun', 'Kofi', 'Lena', 'Mateo', 'Nia', 'Omar', 'Priya',
+    'Quinn', 'Rosa', 'Sven', 'Tariq', 'Uma', 'Victor', 'Wei', 'Yara',
+)
+LAST_NAMES = (
+    'Adams', 'Brown', 'Chen', 'Diaz', 'Evans', 'Fischer', 'Garcia',
+    'Haddad', 'Ito', 'Johnson', 'Kim', 'Lopez', 'Muller', 'Nguyen',
+    'Okafor', 'Patel', 'Rossi', 'Singh', 'Tanaka', 'Walker',
+)
+TAG_NAMES = (
+    'Cardiology', 'Oncology', 'Pediatrics', 'Neurology', 'Orthopedics',
+    'Geriatrics', 'Dermatology', 'Urology', 'Nephrology', 'Psychiatry',
+    'Radiology', 'Surgery', 'ICU', 'Outpatient', 'Follow-up', 'Allergy',
+)
+TREATMENT_NAMES = (
+    'Physical therapy', 'Chemotherapy', 'Dialysis', 'Insulin',
+    'Antibiotics', 'Ventilation', 'Blood transfusion', 'Radiotherapy',
+    'Occupational therapy', 'Wound care', 'Pain management', 'Speech therapy',
+)
+GENDERS = ('Male', 'Female', 'Non-binary/non-conforming')
+# Birth dates are relative to a fixed day so runs are reproducible.
+REFERENCE_DATE = datetime.date(2024, 1, 1)
+
+
+def _copy_value(value):
+    """Format a database value for COPY ... FROM in text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (bytes, memoryview)):
+        return '\\\\x' + bytes(value).hex()
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def insert(model, objs):
+    """Insert objs without signals, with COPY on PostgreSQL.
+
+    Values are prepared like bulk_create prepares them, without compiling
+    SQL for every row. Primary keys are not set on the objs, read them
+    back instead.
+    """
+    if not objs:
+        return
+    db = connections[DEFAULT_DB_ALIAS]
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key or objs[0].pk is not None
+    ]
+    rows = []
+    for obj in objs:
+        values = []
+        for field in fields:
+            value = field.pre_save(obj, True)
+            if not isinstance(value, (bytes, memoryview)):
+                value = field.get_db_prep_save(value, db)
+            values.append(value)
+        rows.append(values)
+    table = db.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(
+        db.ops.quote_name(field.column) for field in fields
+    )
+    with db.cursor() as cursor:
+        if db.vendor != 'postgresql':
+            cursor.executemany(
+                f'INSERT INTO {table} ({columns}) VALUES '
+                f'({", ".join(["%s"] * len(fields))})',
+                rows,
+            )
+            return
+        buffer = io.StringIO()
+        for values in rows:
+            buffer.write('\t'.join(map(_copy_value, values)) + '\n')
+        buffer.seek(0)
+        cursor.copy_expert(f'COPY {table} ({columns}) FROM STDIN', buffer)
+
+
+class Command(BaseCommand):
+    """Django command to generate users, patients and faces in bulk.
+
+    Patients per user follow a log-normal distribution, tags and
+    treatments per patients a Poisson distribution over a Zipf-like
+    popularity, so a few tags are common and most are rare. A pool of
+    synthetic faces is rendered, hashed and embedded once and shared by
+    the patients with an image. Rows are written with bulk inserts, COPY
+    on PostgreSQL, and the same seed always generates the same dataset.
+    """
+
+    help = 'Generate a synthetic dataset of users, patients and faces.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=10,
+            help='Users to create.',
+        )
+        parser.add_argument(
+            '--patients',
+            type=float,
+            default=100,
+            help='Mean number of patients per user.',
+        )
+        parser.add_argument(
+            '--patients-sigma',
+            type=float,
+            default=0.0,
+            help='Log-normal spread of patients per user, 0 for none.',
+        )
+        parser.add_argument(
+            '--tags',
+            type=int,
+            default=16,
+            help='Tags per user.',
+        )
+        parser.add_argument(
+            '--treatments',
+            type=int,
+            default=12,
+            help='Treatments per user.',
+        )
+        parser.add_argument(
+            '--tags-per-patients',
+            type=float,
+            default=2.0,
+            help='Mean number of tags of a patients.',
+        )
+        parser.add_argument(
+            '--treatments-per-patients',
+            type=float,
+            default=1.0,
+            help='Mean number of treatments of a patients.',
+        )
+        parser.add_argument(
+            '--image-ratio',
+            type=float,
+            default=0.5,
+            help='Fraction of patients with a face image.',
+        )
+        parser.add_argument(
+            '--faces',
+            type=int,
+            default=256,
+            help='Distinct synthetic faces shared by the patients.',
+        )
+        parser.add_argument(
+            '--face-size',
+            type=int,
+            default=256,
+            help='Edge of the synthetic face images in pixels.',
+        )
+        parser.add_argument(
+            '--password',
+            default='password123',
+            help='Password of every generated user.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Patients written per transaction.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if not 0 <= options['image_ratio'] <= 1:
+            raise CommandError('--image-ratio must be between 0 and 1.')
+        if options['image_ratio'] and options['faces'] < 1:
+            raise CommandError('--faces must be at least 1 with images.')
+        seed = options['seed']
+        emails = [
+            f'synthetic-{seed}-{number}@example.com'
+            for number in range(options['users'])
+        ]
+        if get_user_model().objects.filter(email__in=emails).exists():
+            raise CommandError(
+                f'Users of seed {seed} exist already, use another --seed.'
+            )
+
+        started = time.perf_counter()
+        rng = np.random.default_rng(seed)
+        faces = self._faces(options) if options['image_ratio'] else []
+        users = self._users(emails, options)
+        tags = self._names(Tag, TAG_NAMES, users, options['tags'])
+        treatments = self._names(
+            Treatment, TREATMENT_NAMES, users, options['treatments'],
+        )
+        counts = self._patients_counts(rng, len(users), options)
+
+        created = 0
+        references = Counter()
+        chunk = []
+        for user_id, count in zip(users, counts):
+            chunk.append((user_id, count))
+            if sum(count for _, count in chunk) >= options['batch_size']:
+                created += self._write(
+                    rng, chunk, tags, treatments, faces, references, options,
+                )
+                chunk = []
+        if chunk:
+            created += self._write(
+                rng, chunk, tags, treatments, faces, references, options,
+            )
+
+        for name, count in references.items():
+            blob, _ = ImageBlob.objects.get_or_create(
+                digest=blob_digest(name),
+                defaults={'name': name},
+            )
+            ImageBlob.objects.filter(pk=blob.pk).update(
+                refcount=F('refcount') + count,
+            )
+        for user_id in users:
+            bump_filter_version(user_id)
+            bump_gallery_version(user_id)
+
+        elapsed = time.perf_counter() - started
+        rate = created / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(users)} user(s) and {created} patients, '
+            f'{sum(references.values())} with an image, '
+            f'{rate:.0f} patients/s.'
+        ))
+
+    def _faces(self, options):
+        """Render, store, hash and embed the pool of synthetic faces.
+
+        Returns (image name, hash fields, {version: (vector, quality,
+        template)}) tuples.
+        """
+        storage = Patients._meta.get_field('image').storage
+        versions = enrolled_versions()
+        datas = []
+        for number in range(options['faces']):
+            buffer = BytesIO()
+            synthetic_face(
+                options['face_size'],
+                (options['seed'], number),
+            ).save(buffer, format='JPEG', quality=90)
+            datas.append(buffer.getvalue())
+        images, _, _ = load_images([BytesIO(data) for data in datas])
+        embedded = {
+            version: embed_largest_faces(images, get_extractor(version))
+            for version in versions
+        }
+
+        faces = []
+        for number, data in enumerate(datas):
+            name = storage.save(
+                f'synthetic-{number}.jpg',
+                ContentFile(data),
+            )
+            hash_fields = imagehash.hash_fields(
+                imagehash.hash_file(BytesIO(data)),
+            )
+            vectors = {}
+            for version, (matrix, qualities) in embedded.items():
+                vector = matrix[number]
+                vectors[version] = (
+                    vector.tobytes(),
+                    qualities[number],
+                    aggregate([vector], [qualities[number]]).tobytes(),
+                )
+            faces.append((name, hash_fields, vectors))
+
+        return faces
+
+    def _users(self, emails, options):
+        """Create the users and return their ids in email order."""
+        password = make_password(options['password'])
+        insert(get_user_model(), [
+            get_user_model()(
+                email=email,
+                password=password,
+                first_name=FIRST_NAMES[number % len(FIRST_NAMES)],
+                last_name=LAST_NAMES[number % len(LAST_NAMES)],
+                role='Doctor',
+            )
+            for number, email in enumerate(emails)
+        ])
+        ids = dict(get_user_model().objects.filter(
+            email__in=emails,
+        ).values_list('email', 'id'))
+
+        return [ids[email] for email in emails]
+
+    def _names(self, model, names, users, count):
+        """Create count tags or treatments per user.
+
+        Returns the ids of every user's rows, most popular first.
+        """
+        insert(model, [
+            model(
+                user_id=user_id,
+                name=(
+                    names[number % len(names)]
+                    if number < len(names)
+                    else f'{names[number % len(names)]} {number}'
+                ),
+            )
+            for user_id in users
+            for number in range(count)
+        ])
+        ids = {user_id: [] for user_id in users}
+        for user_id, pk in model.objects.filter(
+            user_id__in=users,
+        ).order_by('id').values_list('user_id', 'id'):
+            ids[user_id].append(pk)
+
+        return ids
+
+    def _patients_counts(self, rng, users, options):
+        """Draw the number of patients of every user."""
+        mean = options['patients']
+        sigma = options['patients_sigma']
+        if not sigma:
+            return [int(round(mean))] * users
+        # Scaled so that the mean of the distribution stays mean.
+        counts = rng.lognormal(np.log(mean) - sigma ** 2 / 2, sigma, users)
+
+        return [int(count) for count in np.rint(counts)]
+
+    def _pick(self, rng, ids, mean, size):
+        """Pick a Poisson number of ids for each of size patients.
+
+        Ids are drawn without replacement with Zipf-like popularity, as
+        the smallest exponential keys scaled by their weights.
+        """
+        if not ids or not mean:
+            return [[] for _ in range(size)]
+        counts = np.minimum(rng.poisson(mean, size), len(ids))
+        weights = 1 / np.arange(1, len(ids) + 1)
+        keys = rng.exponential(size=(size, len(ids))) / weights
+        order = np.argsort(keys, axis=1)
+
+        return [
+            [ids[index] for index in sorted(row[:count])]
+            for row, count in zip(order, counts)
+        ]
+
+    def _write(
+        self, rng, chunk, tags, treatments, faces, references, options,
+    ):
+        """Create the patients of a chunk of users with their links."""
+        patients = []
+        links = []
+        for user_id, count in chunk:
+            ages = rng.integers(1, 100, count)
+            days = ages * 365 + rng.integers(0, 365, count)
+            first_names = rng.integers(len(FIRST_NAMES), size=count)
+            last_names = rng.integers(len(LAST_NAMES), size=count)
+            phones = rng.integers(10 ** 7, size=count)
+            genders = rng.integers(len(GENDERS), size=count)
+            in_hospital = rng.random(count) < 0.3
+            with_image = rng.random(count) < options['image_ratio']
+            face_numbers = rng.integers(max(len(faces), 1), size=count)
+            tag_ids = self._pick(
+                rng, tags[user_id], options['tags_per_patients'], count,
+            )
+            treatment_ids = self._pick(
+                rng,
+                treatments[user_id],
+                options['treatments_per_patients'],
+                count,
+            )
+            for number in range(count):
+                obj = Patients(
+                    user_id=user_id,
+                    first_name=FIRST_NAMES[first_names[number]],
+                    last_name=LAST_NAMES[last_names[number]],
+                    description='Synthetic patients.',
+                    age=int(ages[number]),
+                    phone_number=f'+1555{phones[number]:07d}',
+                    date_of_birth=REFERENCE_DATE - datetime.timedelta(
+                        days=int(days[number]),
+                    ),
+                    gender=GENDERS[genders[number]],
+                    is_in_hospital=bool(in_hospital[number]),
+                )
+                face = None
+                if faces and with_image[number]:
+                    face = faces[face_numbers[number]]
+                    obj.image = face[0]
+                    for field, value in face[1].items():
+                        setattr(obj, field, value)
+                    references[face[0]] += 1
+                patients.append(obj)
+                links.append(
+                    (tag_ids[number], treatment_ids[number], face),
+                )
+
+        with transaction.atomic():
+            insert(Patients, patients)
+            ids = list(Patients.objects.filter(
+                user_id__in=[user_id for user_id, _ in chunk],
+            ).order_by('id').values_list('id', flat=True))
+            tag_links = []
+            treatment_links = []
+            embeddings = []
+            templates = []
+            for obj, pk, (tag_ids, treatment_ids, face) in zip(
+                patients, ids, links,
+            ):
+                tag_links.extend(
+                    Patients.tags.through(patients_id=pk, tag_id=tag_id)
+                    for tag_id in tag_ids
+                )
+                treatment_links.extend(
+                    Patients.treatment.through(
+                        patients_id=pk,
+                        treatment_id=treatment_id,
+                    )
+                    for treatment_id in treatment_ids
+                )
+                if face is None:
+                    continue
+                for version, (vector, quality, template) in face[2].items():
+                    embeddings.append(FaceEmbedding(
+                        user_id=obj.user_id,
+                        patients_id=pk,
+                        vector=vector,
+                        quality=quality,
+                        extractor_version=version,
+                    ))
+                    templates.append(FaceTemplate(
+                        user_id=obj.user_id,
+                        patients_id=pk,
+                        vector=template,
+                        extractor_version=version,
+                    ))
+            insert(Patients.tags.through, tag_links)
+            insert(Patients.treatment.through, treatment_links)
+            insert(FaceEmbedding, embeddings)
+            insert(FaceTemplate, templates)
+        self.stdout.write(f'{len(patients)} patients written.')
+
+        return len(patients)
@@ -0,0 +1,317 @@
+"""
+Face matching against a user's patients gallery.
+"""
+import copy
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+from django.conf import settings
+
+from core.models import (
+    FaceEmbedding,
+    FaceTemplate,
+    GalleryVersion,
+)
+from patients.faces import (
+    active_version,
+    extract_faces,
+    get_extractor,
+    load_images,
+    scale_box,
+)
+from patients import identify_cache
+from patients.bitmaps import (
+    FilterBitmaps,
+    filter_version,
+)
+from patients.quantization import create_index, top_columns
+
+
+def gallery_version(user_id):
+    """Return the current gallery version for a user.
+
+    The version is stored in the database so every process sees it
+    change, and created with a random value on first use.
+    """
+    versions, _ = GalleryVersion.objects.get_or_create(user_id=user_id)
+    return versions.gallery.hex
+
+
+def bump_gallery_version(user_id):
+    """Mark the gallery of a user as changed in every process.
+
+    Without a version yet, the first one read is new already.
+    """
+    GalleryVersion.objects.filter(user_id=user_id).update(
+        gallery=uuid.uuid4(),
+    )
+
+
+LOAD_CHUNK_ROWS = 10000
+
+
+class Gallery:
+    """In-memory index of the face templates of one user.
+
+    Every patients has one row, the quality weighted mean of the
+    embeddings of its images, so the first pass costs one row per
+    patients. The best candidates are then re-ranked by their best
+    matching image, whose embeddings are only loaded for those rows.
+    Re-ranking is skipped when the index is exact and every patients has
+    a single image, as the template is then that image's embedding.
+    """
+
+    def __init__(self, patients_ids, index, version=None,
+                 exact_loader=None, rerank=None, multi_image=False,
+                 extractor_version=None):
+        self.patients_ids = np.asarray(patients_ids, dtype=np.int64)
+        self.index = index
+        self.version = version
+        self.extractor_version = extractor_version
+        self.exact_loader = exact_loader
+        self.rerank = rerank or settings.FACE_RERANK_CANDIDATES
+        self.multi_image = multi_image
+        self.bitmaps = None
+
+    def __len__(self):
+        return len(self.patients_ids)
+
+    @classmethod
+    def from_vectors(cls, patients_ids, vectors, method='float32', **kwargs):
+        """Build a gallery from a matrix of float32 vectors."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        index = create_index(method, vectors.shape[1])
+        if len(vectors):
+            index.add(vectors)
+
+        return cls(patients_ids, index.freeze(), **kwargs)
+
+    @classmethod
+    def load(cls, user_id, version=None, method=None, extractor_version=None):
+        """Load the gallery of a user from the database in chunks.
+
+        Only the templates of one extractor version are loaded, by default
+        the active one.
+        """
+        method = method or settings.FACE_MATCHER_QUANTIZATION
+        extractor_version = extractor_version or active_version()
+        rows = FaceTemplate.objects.filter(
+            user_id=user_id,
+            extractor_version=extractor_version,
+        ).order_by('id').values_list('patients_id', 'image_count', 'vector')
+        patients_ids = []
+        multi_image = False
+        index = None
+        chunk = []
+        for patients_id, image_count, vector in rows.iterator():
+            patients_ids.append(patients_id)
+            multi_image = multi_image or image_count > 1
+            chunk.append(np.frombuffer(bytes(vector), dtype=np.float32))
+            if len(chunk) == LOAD_CHUNK_ROWS:
+                if index is None:
+                    index = create_index(method, len(chunk[0]))
+                index.add(np.stack(chunk))
+                chunk = []
+        if chunk:
+            if index is None:
+                index = create_index(method, len(chunk[0]))
+            index.add(np.stack(chunk))
+        if index is None:
+            index = create_index('float32', 0)
+
+        return cls(
+            patients_ids,
+            index.freeze(),
+            version,
+            multi_image=multi_image,
+            extractor_version=extractor_version,
+        )
+
+    def exact_scores(self, probes, rows):
+        """Return the (probes, rows) scores of the best image of rows."""
+        if self.exact_loader is not None:
+            return probes @ self.exact_loader(rows).T
+        columns = {
+            patients_id: column
+            for column, patients_id in enumerate(
+                self.patients_ids[rows].tolist()
+            )
+        }
+        embeddings = list(FaceEmbedding.objects.filter(
+            patients_id__in=list(columns),
+            extractor_version=self.extractor_version,
+        ).values_list('patients_id', 'vector'))
+        scores = np.full((len(probes), len(rows)), -np.inf, dtype=np.float32)
+        if not embeddings:
+            return scores
+        image_scores = probes @ np.stack([
+            np.frombuffer(bytes(vector), dtype=np.float32)
+            for _, vector in embeddings
+        ]).T
+        image_columns = np.array(
+            [columns[patients_id] for patients_id, _ in embeddings]
+        )
+        for column in np.unique(image_columns):
+            scores[:, column] = image_scores[
+                :, image_columns == column
+            ].max(axis=1)
+
+        return scores
+
+    def filter_rows(self, user_id, tags=None, treatments=None):
+        """Return the rows of patients with the tags and treatments."""
+        if not tags and not treatments:
+            return None
+        version = filter_version(user_id)
+        bitmaps = self.bitmaps
+        if bitmaps is None or bitmaps.version != version:
+            bitmaps = FilterBitmaps.load(user_id, self.patients_ids, version)
+            self.bitmaps = bitmaps
+
+        return bitmaps.select(tags, treatments)
+
+    def search(self, probes, k=1, threshold=None, rows=None):
+        """Match every probe row against the gallery in one product.
+
+        Returns one list of (patients_id, score) pairs per probe, best
+        first, keeping only scores at or above threshold. When rows is
+        set only those gallery rows are scored.
+        """
+        probes = np.asarray(probes, dtype=np.float32)
+        count = len(self) if rows is None else len(rows)
+        if not count or not len(probes):
+            return [[] for _ in range(len(probes))]
+        if self.index.exact and not self.multi_image:
+            top, top_scores = self.index.top(probes, k, rows)
+            top_rows = top if rows is None else rows[top]
+        else:
+            candidates, approximate = self.index.top(
+                probes, max(k, self.rerank), rows,
+            )
+            if rows is not None:
+                candidates = rows[candidates]
+            unique = np.unique(candidates)
+            exact_scores = self.exact_scores(probes, unique)
+            candidate_scores = np.take_along_axis(
+                exact_scores,
+                np.searchsorted(unique, candidates),
+                axis=1,
+            )
+            candidate_scores[~np.isfinite(approximate)] = -np.inf
+            top, top_scores = top_columns(candidate_scores, k)
+            top_rows = np.take_along_axis(candidates, top, axis=1)
+
+        results = []
+        for probe_rows, row_scores in zip(top_rows, top_scores):
+            results.append([
+                (int(self.patients_ids[row]), float(score))
+                for row, score in zip(probe_rows, row_scores)
+                if np.isfinite(score)
+                and (threshold is None or score >= threshold)
+            ])
+
+        return results
+
+
+_galleries = OrderedDict()
+_galleries_lock = threading.Lock()
+
+
+def current_version(user_id):
+    """Return the version of a user's gallery and of its extractor."""
+    return f'{gallery_version(user_id)}:{active_version()}'
+
+
+def get_gallery(user_id):
+    """Return the up to date gallery of a user, loading it if needed."""
+    version = current_version(user_id)
+    with _galleries_lock:
+        gallery = _galleries.get(user_id)
+        if gallery is not None and gallery.version == version:
+            _galleries.move_to_end(user_id)
+            return gallery
+
+    gallery = Gallery.load(
+        user_id,
+        version,
+        extractor_version=version.rsplit(':', 1)[1],
+    )
+    with _galleries_lock:
+        _galleries[user_id] = gallery
+        _galleries.move_to_end(user_id)
+        while len(_galleries) > settings.FACE_GALLERY_CACHE_SIZE:
+            _galleries.popitem(last=False)
+
+    return gallery
+
+
+def _identify(user_id, image_files, boxes, k, tags=None, treatments=None):
+    gallery = get_gallery(user_id)
+    images, boxes, scales = load_images(image_files, boxes)
+    image_boxes, probes = extract_faces(
+        images,
+        boxes,
+        get_extractor(gallery.extractor_version),
+    )
+    matches = gallery.search(
+        probes,
+        k=k,
+        threshold=settings.FACE_MATCH_THRESHOLD,
+        rows=gallery.filter_rows(user_id, tags, treatments),
+    )
+    results = []
+    face = 0
+    for image_box, scale in zip(image_boxes, scales):
+        faces = []
+        for box in image_box:
+            faces.append({
+                'box': list(scale_box(box, 1 / scale)),
+                'matches': matches[face],
+            })
+            face += 1
+        results.append(faces)
+
+    return results
+
+
+def identify(user_id, image_files, boxes=None, k=1, tags=None,
+             treatments=None):
+    """Identify every face of several images against a user's gallery.
+
+    Boxes are given and returned in the pixels of the original images.
+    With tags or treatments only the patients having any of the tags and
+    any of the treatments are searched. Results of probes already
+    identified against the same gallery are served from the result cache.
+    """
+    if boxes is None:
+        boxes = [None] * len(image_files)
+    version = current_version(user_id)
+    filters = None
+    if tags or treatments:
+        version = f'{version}.{filter_version(user_id)}'
+        filters = [sorted(tags or []), sorted(treatments or [])]
+    keys = [
+        identify_cache.result_key(
+            user_id, version, image_file, box, k, filters,
+        )
+        for image_file, box in zip(image_files, boxes)
+    ]
+    results = [identify_cache.results.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        computed = _identify(
+            user_id,
+            [image_files[i] for i in missing],
+            [boxes[i] for i in missing],
+            k,
+            tags,
+            treatments,
+        )
+        for i, result in zip(missing, computed):
+            identify_cache.results.set(keys[i], result)
+            results[i] = result
+
+    return copy.deepcopy(results)
@@ -0,0 +1,149 @@
+"""
+Serving of stored patients images.
+
+Images are addressed by the SHA-256 of their content, so a URL always
+returns the same bytes and responses are cached as immutable. Files are
+either streamed with byte range support or handed to the front-end web
+server with X-Accel-Redirect or X-Sendfile.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.urls import reverse
+
+from core.models import Patients
+from core.storage import (
+    blob_digest,
+    blob_name,
+)
+
+FILENAME_RE = re.compile(r'^([0-9a-f]{64})(\.[a-z0-9]{1,5})?$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def image_storage():
+    """Return the storage of patients images."""
+    return Patients._meta.get_field('image').storage
+
+
+def image_url(name, request=None):
+    """Return the content-hash URL of a stored image, None for others."""
+    digest = blob_digest(name)
+    if digest is None:
+        return None
+    url = reverse('patients:image-file', args=[os.path.basename(name)])
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def blob_for_filename(filename):
+    """Return the storage name of a content-hash filename, or None."""
+    match = FILENAME_RE.match(filename)
+    if match is None:
+        return None
+    digest, ext = match.groups()
+    return blob_name(digest, ext or '')
+
+
+def parse_range(header, size):
+    """Return the (start, stop) bytes of a single range header.
+
+    Returns None when the header should be ignored and the whole file
+    sent, and raises ValueError when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start = max(0, size - int(last))
+        stop = size
+    else:
+        start = int(first)
+        stop = min(size, int(last) + 1) if last else size
+    if start >= size or start >= stop:
+        raise ValueError('Range not satisfiable.')
+
+    return start, stop
+
+
+def _read_range(path, start, stop):
+    with open(path, 'rb') as image_file:
+        image_file.seek(start)
+        remaining = stop - start
+        while remaining:
+            chunk = image_file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _cache_headers(response, etag):
+    response['ETag'] = etag
+    response['Cache-Control'] = (
+        f'private, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable'
+    )
+    return response
+
+
+def serve_blob(request, name):
+    """Return the response sending a stored image."""
+    storage = image_storage()
+    path = storage.path(name)
+    etag = f'"{blob_digest(name)}"'
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if etag in [tag.strip() for tag in if_none_match.split(',')]:
+        return _cache_headers(HttpResponseNotModified(), etag)
+
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    if settings.MEDIA_SENDFILE:
+        response = HttpResponse(content_type=content_type)
+        if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = (
+                settings.MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + name
+            )
+        else:
+            response['X-Sendfile'] = path
+        return _cache_headers(response, etag)
+
+    size = os.path.getsize(path)
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and (if_range is None or if_range == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(
+            open(path, 'rb'),
+            content_type=content_type,
+        )
+        response['Content-Length'] = size
+    else:
+        start, stop = byte_range
+        response = StreamingHttpResponse(
+            _read_range(path, start, stop),
+            status=206,
+            content_type=content_type,
+        )
+        response['Content-Length'] = stop - start
+        response['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+
+    return _cache_headers(response, etag)
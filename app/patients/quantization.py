@@ -0,0 +1,350 @@
+"""
+In-memory indexes of face embeddings for first-pass search.
+
+Quantized indexes keep compact codes and return approximate scores;
+exact float32 vectors are only needed to re-rank the top candidates.
+"""
+import numpy as np
+
+from django.conf import settings
+
+SCORE_CHUNK_ROWS = 65536
+
+
+def top_columns(scores, k):
+    """Return the best k columns of every row of scores, best first."""
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+
+    return (
+        np.take_along_axis(top, order, axis=1),
+        np.take_along_axis(top_scores, order, axis=1),
+    )
+
+
+class Float32Index:
+    """Exact float32 vectors, 4 bytes per dimension."""
+    exact = True
+    dtype = np.float32
+
+    def __init__(self, dim):
+        self.dim = dim
+        self._chunks = []
+        self.codes = np.empty((0, dim), dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    def add(self, vectors):
+        """Encode and append a chunk of vectors."""
+        self._chunks.append(self._encode(np.asarray(vectors, np.float32)))
+
+    def freeze(self):
+        """Concatenate the appended chunks."""
+        if self._chunks:
+            self.codes = np.concatenate([self.codes] + self._chunks)
+            self._chunks = []
+        return self
+
+    def _encode(self, vectors):
+        return vectors.astype(self.dtype)
+
+    def _decode(self, rows):
+        return self.codes[rows].astype(np.float32)
+
+    def scores(self, probes, rows=None):
+        """Return the (probes, rows) matrix of approximate scores.
+
+        Only the given rows are scored when rows is set, in that order.
+        """
+        probes = np.asarray(probes, dtype=np.float32)
+        count = len(self) if rows is None else len(rows)
+        scores = np.empty((len(probes), count), dtype=np.float32)
+        for start in range(0, count, SCORE_CHUNK_ROWS):
+            stop = start + SCORE_CHUNK_ROWS
+            chunk = slice(start, stop) if rows is None else rows[start:stop]
+            scores[:, start:stop] = probes @ self._decode(chunk).T
+        return scores
+
+    def top(self, probes, k, rows=None):
+        """Return the best k columns of scores and their scores per probe.
+
+        Columns index rows when it is set, like those of scores.
+        """
+        return top_columns(self.scores(probes, rows), k)
+
+
+class Float16Index(Float32Index):
+    """Half precision vectors, 2 bytes per dimension."""
+    exact = False
+    dtype = np.float16
+
+
+class Int8Index(Float32Index):
+    """Per-vector scaled int8 vectors, 1 byte per dimension."""
+    exact = False
+    dtype = np.int8
+
+    def __init__(self, dim):
+        super().__init__(dim)
+        self.scales = np.empty(0, dtype=np.float32)
+        self._scale_chunks = []
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scales.nbytes
+
+    def _encode(self, vectors):
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        self._scale_chunks.append(scales.astype(np.float32))
+        return np.round(vectors / scales[:, None]).astype(np.int8)
+
+    def freeze(self):
+        if self._scale_chunks:
+            self.scales = np.concatenate([self.scales] + self._scale_chunks)
+            self._scale_chunks = []
+        return super().freeze()
+
+    def _decode(self, rows):
+        return self.codes[rows] * self.scales[rows, None]
+
+
+def _kmeans(points, clusters, iterations, rng):
+    """Return the centroids of a plain Lloyd k-means."""
+    centroids = points[rng.choice(len(points), clusters, replace=False)]
+    for _ in range(iterations):
+        distances = (
+            (points ** 2).sum(axis=1)[:, None]
+            - 2 * points @ centroids.T
+            + (centroids ** 2).sum(axis=1)[None, :]
+        )
+        labels = distances.argmin(axis=1)
+        for cluster in range(clusters):
+            members = points[labels == cluster]
+            if len(members):
+                centroids[cluster] = members.mean(axis=0)
+    return centroids
+
+
+class PQIndex(Float32Index):
+    """Product quantization, one byte per subspace.
+
+    The codebooks are trained on a sample of the first chunk added.
+    """
+    exact = False
+    dtype = np.uint8
+
+    def __init__(self, dim, subspaces=16, centroids=256, iterations=10,
+                 train_size=10000, seed=0):
+        super().__init__(dim)
+        if dim % subspaces:
+            raise ValueError('Dimension must be divisible by subspaces.')
+        self.subspaces = subspaces
+        self.sub_dim = dim // subspaces
+        self.centroids = centroids
+        self.iterations = iterations
+        self.train_size = train_size
+        self.rng = np.random.default_rng(seed)
+        self.codebooks = None
+        self.codes = np.empty((0, subspaces), dtype=self.dtype)
+
+    @property
+    def nbytes(self):
+        codebooks = 0 if self.codebooks is None else self.codebooks.nbytes
+        return self.codes.nbytes + codebooks
+
+    def _split(self, vectors):
+        return vectors.reshape(len(vectors), self.subspaces, self.sub_dim)
+
+    def train(self, sample):
+        """Train one codebook per subspace on sample vectors."""
+        sample = np.asarray(sample, dtype=np.float32)
+        if len(sample) > self.train_size:
+            sample = sample[self.rng.choice(
+                len(sample), self.train_size, replace=False,
+            )]
+        parts = self._split(sample)
+        clusters = min(self.centroids, len(sample))
+        self.codebooks = np.stack([
+            _kmeans(parts[:, sub], clusters, self.iterations, self.rng)
+            for sub in range(self.subspaces)
+        ])
+
+    def _encode(self, vectors):
+        if self.codebooks is None:
+            self.train(vectors)
+        parts = self._split(vectors)
+        codes = np.empty((len(vectors), self.subspaces), dtype=self.dtype)
+        for sub in range(self.subspaces):
+            codebook = self.codebooks[sub]
+            distances = (
+                -2 * parts[:, sub] @ codebook.T
+                + (codebook ** 2).sum(axis=1)[None, :]
+            )
+            codes[:, sub] = distances.argmin(axis=1)
+        return codes
+
+    def _decode(self, rows):
+        codes = self.codes[rows]
+        return np.concatenate([
+            self.codebooks[sub][codes[:, sub]]
+            for sub in range(self.subspaces)
+        ], axis=1)
+
+    def scores(self, probes, rows=None):
+        """Score with per-probe lookup tables instead of decoding."""
+        probes = np.asarray(probes, dtype=np.float32)
+        codes = self.codes if rows is None else self.codes[rows]
+        scores = np.zeros((len(probes), len(codes)), dtype=np.float32)
+        if self.codebooks is None:
+            return scores
+        parts = self._split(probes)
+        tables = np.einsum('psd,scd->psc', parts, self.codebooks)
+        for sub in range(self.subspaces):
+            scores += tables[:, sub, codes[:, sub]]
+        return scores
+
+
+class IVFIndex(Float32Index):
+    """Inverted file index for approximate nearest neighbour search.
+
+    Vectors are partitioned around coarse centroids trained on a sample
+    of the first chunk added, and a probe only scores the vectors of its
+    nprobe closest partitions. Unscored rows get -inf in dense scores,
+    and top only ranks the scored ones.
+    """
+    exact = True
+
+    def __init__(self, dim, lists=None, nprobe=None, iterations=10,
+                 train_size=20000, seed=0):
+        super().__init__(dim)
+        self.lists = lists
+        self.nprobe = nprobe or settings.FACE_IVF_NPROBE
+        self.iterations = iterations
+        self.train_size = train_size
+        self.rng = np.random.default_rng(seed)
+        self.centroids = None
+        self.assignments = np.empty(0, dtype=np.int32)
+        self._assignment_chunks = []
+        self.members = []
+
+    @property
+    def nbytes(self):
+        centroids = 0 if self.centroids is None else self.centroids.nbytes
+        return self.codes.nbytes + self.assignments.nbytes + centroids
+
+    def train(self, sample):
+        """Train the coarse centroids on sample vectors."""
+        if len(sample) > self.train_size:
+            sample = sample[self.rng.choice(
+                len(sample), self.train_size, replace=False,
+            )]
+        lists = self.lists or max(1, int(np.sqrt(len(sample))))
+        self.centroids = _kmeans(
+            sample.copy(),
+            min(lists, len(sample)),
+            self.iterations,
+            self.rng,
+        )
+
+    def _encode(self, vectors):
+        if self.centroids is None:
+            self.train(vectors)
+        self._assignment_chunks.append(
+            (vectors @ self.centroids.T).argmax(axis=1).astype(np.int32)
+        )
+        return vectors
+
+    def freeze(self):
+        if self._assignment_chunks:
+            self.assignments = np.concatenate(
+                [self.assignments] + self._assignment_chunks
+            )
+            self._assignment_chunks = []
+        super().freeze()
+        if self.centroids is not None:
+            order = np.argsort(self.assignments, kind='stable')
+            bounds = np.searchsorted(
+                self.assignments[order],
+                np.arange(len(self.centroids) + 1),
+            )
+            self.members = [
+                order[bounds[i]:bounds[i + 1]]
+                for i in range(len(self.centroids))
+            ]
+        return self
+
+    def candidates(self, probes, rows=None):
+        """Return the columns and scores of the rows each probe scores.
+
+        Columns index rows when it is set, like those of scores.
+        """
+        probes = np.asarray(probes, dtype=np.float32)
+        if self.centroids is None:
+            empty = (np.empty(0, dtype=np.int64), np.empty(0, np.float32))
+            return [empty] * len(probes)
+        if rows is not None:
+            columns = np.full(len(self), -1, dtype=np.int64)
+            columns[rows] = np.arange(len(rows))
+        nprobe = min(self.nprobe, len(self.centroids))
+        coarse = probes @ self.centroids.T
+        nearest = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+        candidates = []
+        for probe, lists in zip(probes, nearest):
+            members = np.concatenate([self.members[i] for i in lists])
+            if rows is None:
+                targets = members
+            else:
+                targets = columns[members]
+                members = members[targets >= 0]
+                targets = targets[targets >= 0]
+            candidates.append((targets, self.codes[members] @ probe))
+        return candidates
+
+    def scores(self, probes, rows=None):
+        count = len(self) if rows is None else len(rows)
+        scores = np.full((len(probes), count), -np.inf, dtype=np.float32)
+        for probe, (targets, values) in enumerate(
+            self.candidates(probes, rows)
+        ):
+            scores[probe, targets] = values
+        return scores
+
+    def top(self, probes, k, rows=None):
+        """Select the best k of the candidates of each probe only.
+
+        Probes with fewer candidates are padded with -inf scores.
+        """
+        k = min(k, len(self) if rows is None else len(rows))
+        top = np.zeros((len(probes), k), dtype=np.int64)
+        top_scores = np.full((len(probes), k), -np.inf, dtype=np.float32)
+        for probe, (targets, values) in enumerate(
+            self.candidates(probes, rows)
+        ):
+            if not len(values):
+                continue
+            best, best_scores = top_columns(values[None, :], k)
+            top[probe, :best.shape[1]] = targets[best[0]]
+            top_scores[probe, :best.shape[1]] = best_scores[0]
+        return top, top_scores
+
+
+INDEXES = {
+    'float32': Float32Index,
+    'float16': Float16Index,
+    'int8': Int8Index,
+    'pq': PQIndex,
+    'ivf': IVFIndex,
+}
+
+
+def create_index(method, dim):
+    """Return an empty index of the given quantization method."""
+    return INDEXES[method](dim)
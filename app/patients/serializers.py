@@ -1,13 +1,20 @@
 """
 Serializers for patients APIs
 """
+from django.conf import settings
+
 from rest_framework import serializers
 
 from core.models import (
     Patients,
+    PatientsImage,
     Tag,
     Treatment,
 )
+from patients import (
+    ingest,
+    media,
+)
 
 
 class TreatmentSerializer(serializers.ModelSerializer):
@@ -28,6 +35,28 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class GuardedImageField(serializers.ImageField):
+    """Image field checking the upload header before decoding it.
+
+    Stored images are represented by their content-hash URL.
+    """
+
+    def to_internal_value(self, data):
+        if hasattr(data, 'seek'):
+            try:
+                ingest.check_image(data)
+            except ingest.ImageRejected as error:
+                raise serializers.ValidationError(str(error))
+        return super().to_internal_value(data)
+
+    def to_representation(self, value):
+        if value and getattr(value, 'name', None):
+            url = media.image_url(value.name, self.context.get('request'))
+            if url is not None:
+                return url
+        return super().to_representation(value)
+
+
 class PatientsSerializer(serializers.ModelSerializer):
     """Serializer for patients."""
 
@@ -66,6 +95,7 @@ class PatientsSerializer(serializers.ModelSerializer):
 
 class PatientsDetailSerializer(PatientsSerializer):
     """Serializer for Patients detail view."""
+    image = GuardedImageField(required=False, allow_null=True)
 
     class Meta(PatientsSerializer.Meta):
         fields = PatientsSerializer.Meta.fields + ['description', 'image']
@@ -117,11 +147,126 @@ class PatientsDetailSerializer(PatientsSerializer):
         return instance
 
 
-class PatientsImageSerializer(serializers.ModelSerializer):
+class NormalizedImageMixin:
+    """Normalize uploaded images and optionally keep the originals."""
+
+    def validate_image(self, value):
+        """Normalize the image before it is stored."""
+        self._original = value
+        return ingest.normalize_image(value)
+
+    def keep_original(self, instance):
+        original = getattr(self, '_original', None)
+        if original is not None:
+            ingest.keep_original(instance.image.name, original)
+
+
+class PatientsImageSerializer(NormalizedImageMixin,
+                              serializers.ModelSerializer):
     """Serializer for uploading images to patients."""
+    image = GuardedImageField(required=True)
 
     class Meta:
         model = Patients
         fields = ['id', 'image']
         read_only_fields = ['id']
-        extra_kwargs = {'image': {'required': 'True'}}
+
+    def update(self, instance, validated_data):
+        """Store the image and optionally keep the original upload."""
+        instance = super().update(instance, validated_data)
+        self.keep_original(instance)
+
+        return instance
+
+
+class PatientsGalleryImageSerializer(NormalizedImageMixin,
+                                     serializers.ModelSerializer):
+    """Serializer for the gallery images of patients."""
+    image = GuardedImageField()
+
+    class Meta:
+        model = PatientsImage
+        fields = ['id', 'image', 'created']
+        read_only_fields = ['id', 'created']
+
+    def create(self, validated_data):
+        """Store the image and optionally keep the original upload."""
+        instance = super().create(validated_data)
+        self.keep_original(instance)
+
+        return instance
+
+
+def _validate_boxes(boxes):
+    """Check a list of face boxes given as [x, y, width, height].
+
+    Boxes must fit in the largest image accepted; the matcher clamps
+    them within the decoded image.
+    """
+    if not isinstance(boxes, list):
+        raise serializers.ValidationError('Boxes must be a list.')
+    _check_box_count(len(boxes))
+    edge = settings.IMAGE_MAX_DIMENSION
+    for box in boxes:
+        if (
+            not isinstance(box, list) or len(box) != 4
+            or not all(
+                isinstance(v, int) and not isinstance(v, bool) and v >= 0
+                for v in box
+            )
+            or box[2] == 0 or box[3] == 0
+            or box[0] + box[2] > edge or box[1] + box[3] > edge
+        ):
+            raise serializers.ValidationError(
+                'Each box must be [x, y, width, height] within the image.'
+            )
+    return boxes
+
+
+def _check_box_count(count):
+    if count > settings.FACE_MAX_BOXES:
+        raise serializers.ValidationError(
+            f'At most {settings.FACE_MAX_BOXES} boxes allowed.'
+        )
+
+
+class IdentifySerializer(serializers.Serializer):
+    """Serializer for identifying the faces of an image."""
+    image = GuardedImageField()
+    boxes = serializers.JSONField(required=False)
+    k = serializers.IntegerField(default=1, min_value=1, max_value=10)
+
+    def validate_boxes(self, value):
+        return _validate_boxes(value)
+
+
+class BatchIdentifySerializer(serializers.Serializer):
+    """Serializer for identifying the faces of several images."""
+    images = serializers.ListField(
+        child=GuardedImageField(),
+        allow_empty=False,
+    )
+    boxes = serializers.JSONField(required=False)
+    k = serializers.IntegerField(default=1, min_value=1, max_value=10)
+
+    def validate_images(self, value):
+        if len(value) > settings.FACE_BATCH_MAX_IMAGES:
+            raise serializers.ValidationError(
+                f'At most {settings.FACE_BATCH_MAX_IMAGES} images allowed.'
+            )
+        return value
+
+    def validate_boxes(self, value):
+        if not isinstance(value, list):
+            raise serializers.ValidationError('Boxes must be a list.')
+        value = [_validate_boxes(boxes) if boxes else None for boxes in value]
+        _check_box_count(sum(len(boxes) for boxes in value if boxes))
+        return value
+
+    def validate(self, attrs):
+        boxes = attrs.get('boxes')
+        if boxes is not None and len(boxes) != len(attrs['images']):
+            raise serializers.ValidationError(
+                {'boxes': 'Give one list of boxes per image.'}
+            )
+        return attrs
@@ -0,0 +1,48 @@
+"""
+Signal handlers for the patients app.
+"""
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+)
+from django.dispatch import receiver
+
+from core.models import (
+    FaceEmbedding,
+    FaceTemplate,
+    Patients,
+    Tag,
+    Treatment,
+)
+from patients.bitmaps import bump_filter_version
+from patients.faces import active_version
+from patients.matcher import bump_gallery_version
+
+
+@receiver(post_save, sender=FaceEmbedding)
+@receiver(post_delete, sender=FaceEmbedding)
+@receiver(post_save, sender=FaceTemplate)
+@receiver(post_delete, sender=FaceTemplate)
+def face_embedding_changed(sender, instance, **kwargs):
+    """Invalidate the gallery of the user owning the embedding.
+
+    Embeddings of an extractor being re-indexed are not served yet.
+    """
+    if instance.extractor_version == active_version():
+        bump_gallery_version(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Patients.tags.through)
+@receiver(m2m_changed, sender=Patients.treatment.through)
+def patients_filters_changed(sender, instance, action, **kwargs):
+    """Rebuild the tag and treatment bitmaps of the user."""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_filter_version(instance.user_id)
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Treatment)
+def filter_deleted(sender, instance, **kwargs):
+    """Drop the bitmap of a deleted tag or treatment."""
+    bump_filter_version(instance.user_id)
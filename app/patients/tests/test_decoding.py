@@ -0,0 +1,56 @@
+"""
+Tests for fast image decoding.
+"""
+from io import BytesIO
+
+from PIL import Image
+from django.test import SimpleTestCase
+
+from patients import decoding
+from patients.tests.test_ingest import camera_jpeg
+
+
+def jpeg_bytes(width, height, color=(10, 200, 10)):
+    """Return the bytes of a plain JPEG image."""
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class DecodingTests(SimpleTestCase):
+    """Tests for reduced decoding and thumbnails."""
+
+    def test_open_reduced_scales_long_edge(self):
+        """Test the long edge is capped and the scale reported."""
+        image, scale = decoding.open_reduced(jpeg_bytes(800, 400), 100)
+
+        self.assertEqual(image.size, (100, 50))
+        self.assertEqual(scale, 100 / 800)
+
+    def test_open_reduced_applies_orientation(self):
+        """Test the EXIF orientation is applied."""
+        image, scale = decoding.open_reduced(camera_jpeg(400, 300), 200)
+
+        self.assertEqual(image.size, (150, 200))
+        self.assertEqual(scale, 0.5)
+
+    def test_open_reduced_small_image_unchanged(self):
+        """Test images under the cap keep their size."""
+        image, scale = decoding.open_reduced(jpeg_bytes(40, 30), 100)
+
+        self.assertEqual(image.size, (40, 30))
+        self.assertEqual(scale, 1)
+
+    def test_pool_thumbnails_in_order(self):
+        """Test the pool returns thumbnails in submission order."""
+        colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255)]
+        sources = [jpeg_bytes(64, 64, color) for color in colors]
+
+        with decoding.DecoderPool(workers=1, max_pending=1) as pool:
+            thumbnails = list(pool.thumbnails(sources, 16))
+
+        for data, color in zip(thumbnails, colors):
+            with Image.open(BytesIO(data)) as image:
+                self.assertEqual(image.size, (16, 16))
+                pixel = image.getpixel((8, 8))
+                self.assertEqual(pixel.index(max(pixel)), color.index(255))
@@ -0,0 +1,141 @@
+"""
+Tests for duplicate patients image detection.
+"""
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    FaceEmbedding,
+    Patients,
+)
+from patients import imagehash
+from patients.tests.test_identify_api import (
+    create_face,
+    image_file,
+)
+from patients.tests.test_patients_api import (
+    TemporaryMediaMixin,
+    create_patients,
+    image_upload_url,
+)
+
+
+class ImageHashTests(TestCase):
+    """Tests for perceptual hashing helpers."""
+
+    def test_dhash_stable_across_encoding(self):
+        """Test re-encoded images hash within the duplicate distance."""
+        face = create_face(0)
+        with image_file(face) as first:
+            value = imagehash.hash_file(first)
+        resized = face.resize((128, 128))
+        with image_file(resized) as second:
+            other = imagehash.hash_file(second)
+
+        self.assertLessEqual(imagehash.hamming(value, other), 3)
+
+    def test_signed_round_trip(self):
+        """Test hashes survive storage in a signed column."""
+        value = (1 << 64) - 5
+        self.assertEqual(
+            imagehash.to_unsigned(imagehash.to_signed(value)),
+            value,
+        )
+
+    def test_bk_tree_search(self):
+        """Test the BK-tree finds hashes within the distance only."""
+        tree = imagehash.BKTree()
+        tree.add(0b0000, 'a')
+        tree.add(0b0001, 'b')
+        tree.add(0b0111, 'c')
+        tree.add(0b1111, 'd')
+
+        found = sorted(item for item, _ in tree.search(0b0000, 1))
+
+        self.assertEqual(found, ['a', 'b'])
+
+    def test_duplicate_clusters(self):
+        """Test near-duplicates are grouped transitively."""
+        hashes = [(1, 0b0000), (2, 0b0001), (3, 0b0011), (4, 0xff00)]
+
+        clusters = imagehash.duplicate_clusters(hashes, 1)
+
+        self.assertEqual(clusters, [[1, 2, 3]])
+
+
+class DuplicateUploadTests(TemporaryMediaMixin, TestCase):
+    """Tests for flagging duplicate image uploads."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.patients = create_patients(user=self.user)
+        self.other = create_patients(user=self.user)
+
+    def tearDown(self):
+        for patients in Patients.objects.all():
+            patients.image.delete()
+
+    def _upload(self, patients, image):
+        with image_file(image) as upload:
+            return self.client.post(
+                image_upload_url(patients.id),
+                {'image': upload},
+                format='multipart',
+            )
+
+    def test_upload_stores_hash(self):
+        """Test uploading an image stores its hash and bands."""
+        res = self._upload(self.patients, create_face(0))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['duplicate_of'], [])
+        self.patients.refresh_from_db()
+        self.assertIsNotNone(self.patients.image_hash)
+        self.assertIsNotNone(self.patients.image_hash_3)
+
+    def test_reupload_same_image_skipped(self):
+        """Test re-uploading the same image keeps the stored one."""
+        self._upload(self.patients, create_face(0))
+        self.patients.refresh_from_db()
+        original = self.patients.image.name
+
+        res = self._upload(self.patients, create_face(0))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['duplicate_of'], [self.patients.id])
+        self.patients.refresh_from_db()
+        self.assertEqual(self.patients.image.name, original)
+
+    def test_duplicate_of_other_patients_flagged(self):
+        """Test an image of another patients is flagged and reused."""
+        self._upload(self.other, create_face(0))
+
+        res = self._upload(self.patients, create_face(0))
+
+        self.assertEqual(res.data['duplicate_of'], [self.other.id])
+        vectors = FaceEmbedding.objects.values_list('vector', flat=True)
+        self.assertEqual(len(set(bytes(v) for v in vectors)), 1)
+
+    def test_report_duplicates_command(self):
+        """Test the command reports clusters of duplicates."""
+        self._upload(self.patients, create_face(0))
+        self._upload(self.other, create_face(0))
+        create_patients(user=self.user)
+        out = StringIO()
+
+        call_command('report_duplicates', user='user@example.com', stdout=out)
+
+        ids = sorted([self.patients.id, self.other.id])
+        self.assertIn(f'user@example.com: {ids[0]}, {ids[1]}', out.getvalue())
+        self.assertIn('1 duplicate cluster(s) found.', out.getvalue())
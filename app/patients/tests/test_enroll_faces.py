@@ -0,0 +1,180 @@
+"""
+Tests for the bulk face enrollment command.
+"""
+import csv
+import os
+import tempfile
+import zipfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from core.models import (
+    FaceEmbedding,
+    Patients,
+)
+from patients.matcher import gallery_version, get_gallery
+from patients.tests.test_identify_api import create_face
+from patients.tests.test_patients_api import (
+    TemporaryMediaMixin,
+    create_patients,
+)
+
+
+class EnrollFacesCommandTests(TemporaryMediaMixin, TestCase):
+    """Tests for enrolling faces from a folder or zip."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.patients = [create_patients(user=self.user) for _ in range(3)]
+        self.workdir = tempfile.TemporaryDirectory()
+        self.folder = os.path.join(self.workdir.name, 'photos')
+        os.mkdir(self.folder)
+        for seed, patients in enumerate(self.patients):
+            create_face(seed).save(
+                os.path.join(self.folder, f'{seed}.jpg'),
+                quality=95,
+            )
+        self.manifest = os.path.join(self.workdir.name, 'manifest.csv')
+        self._write_manifest([
+            (f'{seed}.jpg', patients.id)
+            for seed, patients in enumerate(self.patients)
+        ])
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def _write_manifest(self, rows):
+        with open(self.manifest, 'w', newline='') as manifest:
+            writer = csv.writer(manifest)
+            writer.writerow(['filename', 'patients_id'])
+            writer.writerows(rows)
+
+    def _enroll(self, source, **options):
+        out = StringIO()
+        call_command(
+            'enroll_faces',
+            source,
+            self.manifest,
+            workers=1,
+            chunk_size=2,
+            batch_size=2,
+            stdout=out,
+            stderr=StringIO(),
+            **options
+        )
+        return out.getvalue()
+
+    def test_enroll_folder(self):
+        """Test every image is stored and embedded."""
+        out = self._enroll(self.folder)
+
+        self.assertIn('Enrolled 3 image(s), 0 failed', out)
+        for patients in Patients.objects.all():
+            self.assertTrue(patients.image.name.startswith('blobs/'))
+            self.assertIsNotNone(patients.image_hash)
+            self.assertEqual(patients.face_embeddings.count(), 1)
+        self.assertEqual(len(get_gallery(self.user.id)), 3)
+
+    def test_gallery_version_bumped(self):
+        """Test enrolling changes the gallery version in the database."""
+        before = gallery_version(self.user.id)
+
+        self._enroll(self.folder)
+        cache.clear()
+
+        after = gallery_version(self.user.id)
+        self.assertNotEqual(after, before)
+        self.assertEqual(gallery_version(self.user.id), after)
+
+    def test_enroll_zip(self):
+        """Test images are read from a zip archive."""
+        archive = os.path.join(self.workdir.name, 'photos.zip')
+        with zipfile.ZipFile(archive, 'w') as photos:
+            for name in os.listdir(self.folder):
+                photos.write(os.path.join(self.folder, name), name)
+
+        out = self._enroll(archive)
+
+        self.assertIn('Enrolled 3 image(s)', out)
+        self.assertEqual(FaceEmbedding.objects.count(), 3)
+
+    def test_resume_skips_enrolled(self):
+        """Test a second run only enrolls images not yet done."""
+        with open(f'{self.manifest}.done', 'w') as log:
+            log.write('0.jpg\n1.jpg\n')
+
+        out = self._enroll(self.folder)
+
+        self.assertIn('1 image(s) to enroll, 2 already done.', out)
+        self.assertEqual(
+            list(FaceEmbedding.objects.values_list('patients', flat=True)),
+            [self.patients[2].id],
+        )
+        with open(f'{self.manifest}.done') as log:
+            self.assertEqual(log.read().split(), ['0.jpg', '1.jpg', '2.jpg'])
+
+    def test_missing_file_retried(self):
+        """Test unreadable files fail without stopping the run."""
+        os.remove(os.path.join(self.folder, '1.jpg'))
+
+        out = self._enroll(self.folder)
+
+        self.assertIn('Enrolled 2 image(s), 1 failed', out)
+        with open(f'{self.manifest}.done') as log:
+            self.assertNotIn('1.jpg', log.read().split())
+
+    def test_shared_file_enrolls_every_patients(self):
+        """Test a file listed for several patients enrolls each of them."""
+        self._write_manifest([
+            ('0.jpg', self.patients[0].id),
+            ('0.jpg', self.patients[1].id),
+        ])
+
+        out = self._enroll(self.folder)
+
+        self.assertIn('Enrolled 1 image(s), 0 failed', out)
+        self.assertEqual(
+            sorted(FaceEmbedding.objects.values_list('patients', flat=True)),
+            [self.patients[0].id, self.patients[1].id],
+        )
+        first, second = (
+            Patients.objects.get(pk=patients.pk)
+            for patients in self.patients[:2]
+        )
+        self.assertEqual(first.image_hash, second.image_hash)
+
+    def test_duplicate_patients_rejected(self):
+        """Test patients listed on several rows are named in the error."""
+        self._write_manifest([
+            ('0.jpg', self.patients[0].id),
+            ('1.jpg', self.patients[0].id),
+            ('2.jpg', self.patients[2].id),
+        ])
+
+        with self.assertRaisesMessage(
+            CommandError,
+            f'{self.patients[0].id} (rows 2, 3)',
+        ):
+            self._enroll(self.folder)
+        self.assertFalse(FaceEmbedding.objects.exists())
+
+    def test_path_outside_source_rejected(self):
+        """Test manifest paths cannot escape the source folder."""
+        self._write_manifest([('../manifest.csv', self.patients[0].id)])
+
+        out = self._enroll(self.folder)
+
+        self.assertIn('Enrolled 0 image(s), 1 failed', out)
+
+    def test_invalid_source(self):
+        """Test a source that is neither a folder nor a zip."""
+        with self.assertRaises(CommandError):
+            self._enroll(self.manifest)
@@ -0,0 +1,136 @@
+"""
+Tests for exporting patients images.
+"""
+import csv
+import io
+import tracemalloc
+import zipfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag
+from patients import export
+from patients.tests.test_identify_api import (
+    create_face,
+    image_file,
+)
+from patients.tests.test_patients_api import (
+    TemporaryMediaMixin,
+    create_patients,
+    image_upload_url,
+)
+from patients.tests.test_patients_images import images_url
+
+EXPORT_URL = reverse('patients:patients-export-images')
+
+
+class ExportApiTests(TemporaryMediaMixin, TestCase):
+    """Tests for the images export API."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.patients = []
+        for seed in range(3):
+            patients = create_patients(user=self.user, first_name=str(seed))
+            self._post(image_upload_url(patients.id), seed)
+            self.patients.append(patients)
+        self._post(images_url(self.patients[0].id), 10)
+
+    def _post(self, url, seed, size=(64, 64)):
+        with image_file(create_face(seed, size=size)) as upload:
+            return self.client.post(url, {'image': upload}, format='multipart')
+
+    def _archive(self, res):
+        return zipfile.ZipFile(io.BytesIO(b''.join(res.streaming_content)))
+
+    def test_export_images(self):
+        """Test every image and a manifest are in the archive."""
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/zip')
+        self.assertIn('attachment', res['Content-Disposition'])
+        archive = self._archive(res)
+        self.assertIsNone(archive.testzip())
+        names = archive.namelist()
+        self.assertEqual(names[-1], export.MANIFEST_NAME)
+        self.assertEqual(len(names), 5)
+        self.patients[1].refresh_from_db()
+        with self.patients[1].image.open('rb') as stored:
+            self.assertEqual(
+                archive.read(f'{self.patients[1].id}/profile.jpg'),
+                stored.read(),
+            )
+
+    def test_manifest(self):
+        """Test the manifest describes every archived image."""
+        archive = self._archive(self.client.get(EXPORT_URL))
+
+        rows = list(csv.DictReader(
+            io.StringIO(archive.read(export.MANIFEST_NAME).decode())
+        ))
+
+        self.assertEqual(
+            sorted(row['filename'] for row in rows),
+            sorted(set(archive.namelist()) - {export.MANIFEST_NAME}),
+        )
+        gallery = [row for row in rows if row['kind'] == 'gallery']
+        self.assertEqual(len(gallery), 1)
+        self.assertEqual(gallery[0]['patients_id'], str(self.patients[0].id))
+        self.assertEqual(len(gallery[0]['sha256']), 64)
+
+    def test_export_limited_to_user(self):
+        """Test images of other users are not exported."""
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'password123',
+        )
+        client = APIClient()
+        client.force_authenticate(other)
+
+        archive = self._archive(client.get(EXPORT_URL))
+
+        self.assertEqual(archive.namelist(), [export.MANIFEST_NAME])
+
+    def test_export_filtered_by_tag(self):
+        """Test the list filters restrict the export."""
+        tag = Tag.objects.create(user=self.user, name='Ward A')
+        self.patients[2].tags.add(tag)
+
+        archive = self._archive(self.client.get(f'{EXPORT_URL}?tags={tag.id}'))
+
+        self.assertEqual(
+            archive.namelist(),
+            [f'{self.patients[2].id}/profile.jpg', export.MANIFEST_NAME],
+        )
+
+    def test_export_memory_constant(self):
+        """Test the archive is streamed without being held in memory."""
+        for seed in range(20, 30):
+            self._post(images_url(self.patients[1].id), seed, (600, 600))
+        res = self.client.get(EXPORT_URL)
+
+        tracemalloc.start()
+        try:
+            total = 0
+            largest = 0
+            for chunk in res.streaming_content:
+                total += len(chunk)
+                largest = max(largest, len(chunk))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertGreater(total, 2 * 1024 * 1024)
+        self.assertLessEqual(largest, export.CHUNK_SIZE + 1024)
+        self.assertLess(peak, total / 4)
@@ -0,0 +1,161 @@
+"""
+Tests for face identification filtered by tags and treatments.
+"""
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Tag,
+    Treatment,
+)
+from patients import matcher
+from patients.bitmaps import FilterBitmaps, _pack, filter_version
+from patients.tests.test_identify_api import (
+    IDENTIFY_URL,
+    create_face,
+    image_file,
+)
+from patients.tests.test_patients_api import (
+    TemporaryMediaMixin,
+    create_patients,
+    detail_url,
+    image_upload_url,
+)
+
+
+class FilterBitmapsTests(SimpleTestCase):
+    """Tests for selecting gallery rows from bitmaps."""
+
+    def setUp(self):
+        self.bitmaps = FilterBitmaps(
+            10,
+            _pack({1: [0, 1, 2], 2: [8]}, 10),
+            _pack({5: [1, 8, 9]}, 10),
+        )
+
+    def test_no_filters_selects_everything(self):
+        """Test no filter means no restriction."""
+        self.assertIsNone(self.bitmaps.select())
+
+    def test_any_of_tags(self):
+        """Test rows with any of the tags are selected."""
+        rows = self.bitmaps.select(tags=[1, 2])
+
+        self.assertEqual(rows.tolist(), [0, 1, 2, 8])
+
+    def test_tags_and_treatments(self):
+        """Test tags and treatments must both match."""
+        rows = self.bitmaps.select(tags=[1, 2], treatments=[5])
+
+        self.assertEqual(rows.tolist(), [1, 8])
+
+    def test_unknown_tag_selects_nothing(self):
+        """Test an unknown tag selects no rows."""
+        rows = self.bitmaps.select(tags=[99])
+
+        self.assertEqual(len(rows), 0)
+
+
+class FilteredIdentifyApiTests(TemporaryMediaMixin, TestCase):
+    """Tests for identifying faces among tagged patients."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.ward = Tag.objects.create(user=self.user, name='Ward A')
+        self.treatment = Treatment.objects.create(
+            user=self.user,
+            name='Dialysis',
+        )
+        self.patients = []
+        for seed in range(3):
+            patients = create_patients(user=self.user, first_name=str(seed))
+            with image_file(create_face(seed)) as upload:
+                self.client.post(
+                    image_upload_url(patients.id),
+                    {'image': upload},
+                    format='multipart',
+                )
+            self.patients.append(patients)
+        self.patients[0].tags.add(self.ward)
+        self.patients[1].tags.add(self.ward)
+        self.patients[1].treatment.add(self.treatment)
+
+    def _identify(self, seed, query):
+        with image_file(create_face(seed)) as upload:
+            return self.client.post(
+                f'{IDENTIFY_URL}?{query}',
+                {'image': upload, 'k': 3},
+                format='multipart',
+            )
+
+    def _match_ids(self, res):
+        return [match['id'] for match in res.data['faces'][0]['matches']]
+
+    def test_identify_within_tag(self):
+        """Test a tagged patients is found when filtering on its tag."""
+        res = self._identify(1, f'tags={self.ward.id}')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._match_ids(res)[0], self.patients[1].id)
+
+    def test_untagged_patients_excluded(self):
+        """Test patients without the tag are never matched."""
+        res = self._identify(2, f'tags={self.ward.id}')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn(self.patients[2].id, self._match_ids(res))
+
+    def test_tags_and_treatment(self):
+        """Test the treatment filter narrows the tag filter."""
+        res = self._identify(
+            0,
+            f'tags={self.ward.id}&treatment={self.treatment.id}',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn(self.patients[0].id, self._match_ids(res))
+
+    def test_tag_change_updates_filter(self):
+        """Test tagging a patients makes it searchable within the tag."""
+        self._identify(2, f'tags={self.ward.id}')
+        self.client.patch(
+            detail_url(self.patients[2].id),
+            {'tags': [{'name': 'Ward A'}]},
+            format='json',
+        )
+
+        res = self._identify(2, f'tags={self.ward.id}')
+
+        self.assertEqual(self._match_ids(res)[0], self.patients[2].id)
+
+    def test_filter_version_in_database(self):
+        """Test tag changes bump a version kept outside the cache."""
+        before = filter_version(self.user.id)
+
+        self.patients[2].tags.add(self.ward)
+        cache.clear()
+
+        after = filter_version(self.user.id)
+        self.assertNotEqual(after, before)
+        self.assertEqual(filter_version(self.user.id), after)
+
+    def test_filtered_search_scores_fewer_rows(self):
+        """Test the filter is applied before scoring."""
+        gallery = matcher.get_gallery(self.user.id)
+        rows = gallery.filter_rows(self.user.id, tags=[self.ward.id])
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(
+            sorted(np.asarray(gallery.patients_ids)[rows].tolist()),
+            sorted([self.patients[0].id, self.patients[1].id]),
+        )
@@ -0,0 +1,239 @@
+"""
+Tests for the face identification APIs.
+"""
+import json
+import tempfile
+
+import numpy as np
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import FaceEmbedding
+from patients import faces
+from patients.tests.test_patients_api import (
+    TemporaryMediaMixin,
+    create_patients,
+    image_upload_url,
+)
+
+IDENTIFY_URL = reverse('patients:patients-identify')
+IDENTIFY_BATCH_URL = reverse('patients:patients-identify-batch')
+
+
+def create_face(seed, size=(64, 64)):
+    """Create and return a distinct synthetic face image."""
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+    return Image.fromarray(pixels, 'RGB')
+
+
+def image_file(image):
+    """Save an image to a temporary JPEG file ready for upload."""
+    tmp = tempfile.NamedTemporaryFile(suffix='.jpg')
+    image.save(tmp, format='JPEG', quality=95)
+    tmp.seek(0)
+    return tmp
+
+
+class IdentifyApiTests(TemporaryMediaMixin, TestCase):
+    """Tests for identifying patients from face images."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.patients = []
+        for seed in range(3):
+            patients = create_patients(user=self.user, first_name=str(seed))
+            with image_file(create_face(seed)) as upload:
+                self.client.post(
+                    image_upload_url(patients.id),
+                    {'image': upload},
+                    format='multipart',
+                )
+            self.patients.append(patients)
+
+    def tearDown(self):
+        for patients in self.patients:
+            patients.refresh_from_db()
+            patients.image.delete()
+
+    def test_upload_image_enrolls_face(self):
+        """Test uploading an image stores one face embedding."""
+        for patients in self.patients:
+            self.assertEqual(patients.face_embeddings.count(), 1)
+
+    def test_identify(self):
+        """Test identifying a known face."""
+        with image_file(create_face(1)) as upload:
+            res = self.client.post(
+                IDENTIFY_URL,
+                {'image': upload},
+                format='multipart',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['faces']), 1)
+        matches = res.data['faces'][0]['matches']
+        self.assertEqual(matches[0]['id'], self.patients[1].id)
+
+    def test_identify_unknown_face(self):
+        """Test an unknown face has no matches."""
+        with image_file(create_face(99)) as upload:
+            res = self.client.post(
+                IDENTIFY_URL,
+                {'image': upload},
+                format='multipart',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['faces'][0]['matches'], [])
+
+    def test_identify_group_photo(self):
+        """Test identifying every box of a group photo."""
+        group = Image.new('RGB', (128, 64))
+        group.paste(create_face(2), (0, 0))
+        group.paste(create_face(0), (64, 0))
+        boxes = [[0, 0, 64, 64], [64, 0, 64, 64]]
+        with image_file(group) as upload:
+            res = self.client.post(
+                IDENTIFY_URL,
+                {'image': upload, 'boxes': json.dumps(boxes)},
+                format='multipart',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = [face['matches'][0]['id'] for face in res.data['faces']]
+        self.assertEqual(ids, [self.patients[2].id, self.patients[0].id])
+
+    def test_identify_batch(self):
+        """Test identifying several images in one request."""
+        with image_file(create_face(0)) as first, \
+                image_file(create_face(2)) as second:
+            res = self.client.post(
+                IDENTIFY_BATCH_URL,
+                {'images': [first, second], 'k': 2},
+                format='multipart',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        results = res.data['results']
+        self.assertEqual(len(results), 2)
+        self.assertEqual(
+            results[0]['faces'][0]['matches'][0]['id'],
+            self.patients[0].id,
+        )
+        self.assertEqual(
+            results[1]['faces'][0]['matches'][0]['id'],
+            self.patients[2].id,
+        )
+
+    def test_identify_batch_boxes_mismatch(self):
+        """Test boxes must be given for every image of a batch."""
+        with image_file(create_face(0)) as upload:
+            res = self.client.post(
+                IDENTIFY_BATCH_URL,
+                {'images': [upload], 'boxes': json.dumps([None, None])},
+                format='multipart',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_identify_huge_box_rejected(self):
+        """Test boxes larger than any accepted image are refused."""
+        with image_file(create_face(0)) as upload:
+            res = self.client.post(
+                IDENTIFY_URL,
+                {'image': upload, 'boxes': json.dumps([[0, 0, 10 ** 9, 1]])},
+                format='multipart',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(FACE_MAX_BOXES=2)
+    def test_identify_box_count_capped(self):
+        """Test a request gives at most FACE_MAX_BOXES boxes."""
+        boxes = [[[0, 0, 8, 8]] * 2, [[0, 0, 8, 8]]]
+        with image_file(create_face(0)) as first, \
+                image_file(create_face(2)) as second:
+            res = self.client.post(
+                IDENTIFY_BATCH_URL,
+                {'images': [first, second], 'boxes': json.dumps(boxes)},
+                format='multipart',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('boxes', res.data)
+
+    def test_identify_box_clamped(self):
+        """Test boxes past the edges are clamped within the image."""
+        with image_file(create_face(0)) as upload:
+            res = self.client.post(
+                IDENTIFY_URL,
+                {'image': upload, 'boxes': json.dumps([[32, 32, 5000, 5000]])},
+                format='multipart',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['faces'][0]['box'], [32, 32, 32, 32])
+
+    def test_identify_limited_to_user(self):
+        """Test faces of other users' patients are not matched."""
+        other_user = get_user_model().objects.create_user(
+            'other@example.com',
+            'password123',
+        )
+        other_client = APIClient()
+        other_client.force_authenticate(other_user)
+        with image_file(create_face(1)) as upload:
+            res = other_client.post(
+                IDENTIFY_URL,
+                {'image': upload},
+                format='multipart',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['faces'][0]['matches'], [])
+
+    def test_deleting_patients_removes_face(self):
+        """Test deleting a patients removes it from the gallery."""
+        patients = self.patients.pop()
+        patients.image.delete()
+        patients.delete()
+
+        self.assertFalse(
+            FaceEmbedding.objects.filter(patients_id=patients.id).exists()
+        )
+        with image_file(create_face(2)) as upload:
+            res = self.client.post(
+                IDENTIFY_URL,
+                {'image': upload},
+                format='multipart',
+            )
+
+        self.assertEqual(res.data['faces'][0]['matches'], [])
+
+
+class ExtractFacesTests(TestCase):
+    """Tests for batched face extraction."""
+
+    def test_extract_faces_batch(self):
+        """Test one embedding row is returned per face."""
+        images = [create_face(0), create_face(1, size=(128, 64))]
+        boxes = [None, [[0, 0, 64, 64], [64, 0, 64, 64]]]
+
+        image_boxes, vectors = faces.extract_faces(images, boxes)
+
+        self.assertEqual([len(b) for b in image_boxes], [1, 2])
+        self.assertEqual(vectors.shape[0], 3)
+        np.testing.assert_allclose(
+            np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-5
+        )
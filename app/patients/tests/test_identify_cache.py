@@ -0,0 +1,109 @@
+"""
+Tests for the identification result cache.
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from patients import (
+    faces,
+    identify_cache,
+)
+from patients.tests.test_identify_api import (
+    IDENTIFY_URL,
+    create_face,
+    image_file,
+)
+from patients.tests.test_patients_api import (
+    TemporaryMediaMixin,
+    create_patients,
+    image_upload_url,
+)
+
+
+class IdentifyCacheTests(TemporaryMediaMixin, TestCase):
+    """Tests for caching identification results."""
+
+    def setUp(self):
+        cache.clear()
+        identify_cache.results.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.patients = create_patients(user=self.user)
+        self._upload(self.patients, create_face(0))
+
+    def tearDown(self):
+        self.patients.refresh_from_db()
+        self.patients.image.delete()
+
+    def _upload(self, patients, image):
+        with image_file(image) as upload:
+            self.client.post(
+                image_upload_url(patients.id),
+                {'image': upload},
+                format='multipart',
+            )
+
+    def _identify(self, seed=0, **params):
+        with image_file(create_face(seed)) as upload:
+            return self.client.post(
+                IDENTIFY_URL,
+                {'image': upload, **params},
+                format='multipart',
+            )
+
+    @patch('patients.matcher.extract_faces', wraps=faces.extract_faces)
+    def test_repeated_probe_served_from_cache(self, patched_extract):
+        """Test the same probe is only extracted once."""
+        first = self._identify()
+        second = self._identify()
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(patched_extract.call_count, 1)
+
+    @patch('patients.matcher.extract_faces', wraps=faces.extract_faces)
+    def test_different_params_not_shared(self, patched_extract):
+        """Test k is part of the cache key."""
+        self._identify(k=1)
+        self._identify(k=2)
+
+        self.assertEqual(patched_extract.call_count, 2)
+
+    @patch('patients.matcher.extract_faces', wraps=faces.extract_faces)
+    def test_gallery_change_invalidates(self, patched_extract):
+        """Test an image update makes cached results stale."""
+        first = self._identify(seed=1)
+        other = create_patients(user=self.user)
+        self._upload(other, create_face(1))
+
+        second = self._identify(seed=1)
+
+        self.assertEqual(first.data['faces'][0]['matches'], [])
+        self.assertEqual(second.data['faces'][0]['matches'][0]['id'], other.id)
+        self.assertEqual(patched_extract.call_count, 2)
+        other.image.delete()
+
+
+class ResultCacheTests(TestCase):
+    """Tests for the bounded in-process cache."""
+
+    def test_lru_eviction(self):
+        """Test the least recently used entry is evicted."""
+        results = identify_cache.ResultCache(max_entries=2)
+        results.set('a', [1])
+        results.set('b', [2])
+        results.get('a')
+
+        results.set('c', [3])
+
+        self.assertEqual(list(results.entries), ['a', 'c'])
@@ -0,0 +1,170 @@
+"""
+Tests for rejecting hostile images from their header.
+"""
+import os
+import struct
+import tracemalloc
+import zlib
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from patients import ingest
+from patients.tests.test_identify_api import (
+    IDENTIFY_URL,
+    create_face,
+)
+from patients.tests.test_patients_api import (
+    create_patients,
+    image_upload_url,
+)
+
+
+def _chunk(kind, data):
+    crc = zlib.crc32(kind + data) & 0xffffffff
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', crc)
+
+
+def png_bytes(width, height, rows=True):
+    """Return a grayscale PNG whose pixels are all black.
+
+    The pixel data is compressed row by row, so even huge images are
+    built without holding their pixels in memory. Without rows only the
+    header is written.
+    """
+    data = b''
+    if rows:
+        compressor = zlib.compressobj(9)
+        row = b'\x00' * (width + 1)
+        data = b''.join(compressor.compress(row) for _ in range(height))
+        data += compressor.flush()
+    header = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + _chunk(b'IHDR', header)
+        + _chunk(b'IDAT', data)
+        + _chunk(b'IEND', b'')
+    )
+
+
+def upload(data, name='image.png'):
+    """Wrap bytes as an uploaded file."""
+    return SimpleUploadedFile(name, data, content_type='image/png')
+
+
+def current_rss():
+    """Return the resident memory of this process in bytes."""
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class CheckImageTests(SimpleTestCase):
+    """Tests for the header checks."""
+
+    def test_accepts_normal_image(self):
+        """Test a normal photo passes with its format and size."""
+        buffer = BytesIO()
+        create_face(0, size=(640, 480)).save(buffer, format='JPEG')
+
+        result = ingest.check_image(upload(buffer.getvalue(), 'face.jpg'))
+
+        self.assertEqual(result, ('JPEG', (640, 480)))
+
+    def test_rejects_long_side(self):
+        """Test images wider than the limit are rejected."""
+        with self.assertRaisesRegex(ingest.ImageRejected, 'sides'):
+            ingest.check_image(upload(png_bytes(20000, 10, rows=False)))
+
+    def test_rejects_pixel_count(self):
+        """Test images with too many pixels are rejected."""
+        with self.assertRaisesRegex(ingest.ImageRejected, 'pixels'):
+            ingest.check_image(upload(png_bytes(9000, 9000, rows=False)))
+
+    def test_rejects_pillow_bombs(self):
+        """Test images beyond Pillow's own bomb limit are rejected."""
+        with self.assertRaises(ingest.ImageRejected):
+            ingest.check_image(upload(png_bytes(20000, 20000, rows=False)))
+
+    @override_settings(IMAGE_MAX_UPLOAD_BYTES=100)
+    def test_rejects_large_files(self):
+        """Test files over the byte limit are rejected unread."""
+        with self.assertRaisesRegex(ingest.ImageRejected, 'bytes'):
+            ingest.check_image(upload(png_bytes(10, 10) + b'\x00' * 200))
+
+    def test_rejects_other_formats(self):
+        """Test formats outside the allowed list are rejected."""
+        buffer = BytesIO()
+        create_face(0).save(buffer, format='GIF')
+
+        with self.assertRaisesRegex(ingest.ImageRejected, 'formats'):
+            ingest.check_image(upload(buffer.getvalue(), 'face.gif'))
+
+    def test_rejects_garbage(self):
+        """Test files that are not images are rejected."""
+        with self.assertRaises(ingest.ImageRejected):
+            ingest.check_image(upload(b'not an image'))
+
+
+class ImageGuardApiTests(TestCase):
+    """Tests for refusing hostile uploads in the APIs."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.patients = create_patients(user=self.user)
+        self.bomb = png_bytes(9000, 9000)
+
+    def test_upload_bomb_rejected(self):
+        """Test a decompression bomb is refused and nothing is stored."""
+        res = self.client.post(
+            image_upload_url(self.patients.id),
+            {'image': upload(self.bomb)},
+            format='multipart',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', res.data)
+        self.patients.refresh_from_db()
+        self.assertFalse(self.patients.image)
+
+    def test_identify_bomb_rejected(self):
+        """Test identification refuses decompression bombs."""
+        res = self.client.post(
+            IDENTIFY_URL,
+            {'image': upload(self.bomb)},
+            format='multipart',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bomb_memory_stays_flat(self):
+        """Test rejecting bombs allocates a tiny fraction of their pixels.
+
+        Decoding one bomb would take 81 MB, so resident memory and the
+        traced peak must stay far below that.
+        """
+        rss = current_rss()
+        tracemalloc.start()
+        try:
+            for _ in range(5):
+                res = self.client.post(
+                    image_upload_url(self.patients.id),
+                    {'image': upload(self.bomb)},
+                    format='multipart',
+                )
+                self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertLess(peak, 10 * 1024 * 1024)
+        self.assertLess(current_rss() - rss, 20 * 1024 * 1024)
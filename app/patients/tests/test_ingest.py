@@ -0,0 +1,103 @@
+"""
+Tests for patients image normalization.
+"""
+import os
+import tempfile
+from io import BytesIO
+
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from patients import ingest
+from patients.tests.test_patients_api import (
+    TemporaryMediaMixin,
+    create_patients,
+    image_upload_url,
+)
+
+
+def camera_jpeg(width=400, height=300, orientation=6):
+    """Return a JPEG upload rotated through its EXIF orientation."""
+    image = Image.new('RGB', (width, height), (200, 10, 10))
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', exif=exif.tobytes())
+    buffer.name = 'camera.jpeg'
+    buffer.seek(0)
+    return buffer
+
+
+class NormalizeImageTests(TestCase):
+    """Tests for normalizing uploaded images."""
+
+    def test_exif_orientation_applied(self):
+        """Test the EXIF rotation is applied to the pixels."""
+        normalized = ingest.normalize_image(camera_jpeg(), max_edge=1000)
+
+        with Image.open(normalized) as image:
+            self.assertEqual(image.size, (300, 400))
+            self.assertNotIn(0x0112, image.getexif())
+        self.assertEqual(normalized.name, 'camera.jpg')
+
+    def test_long_edge_capped(self):
+        """Test the long edge is capped at the configured size."""
+        normalized = ingest.normalize_image(
+            camera_jpeg(orientation=1),
+            max_edge=100,
+        )
+
+        with Image.open(normalized) as image:
+            self.assertEqual(image.size, (100, 75))
+
+    def test_transparent_png_flattened(self):
+        """Test transparent images are re-encoded as JPEG."""
+        buffer = BytesIO()
+        Image.new('RGBA', (20, 10), (0, 0, 0, 0)).save(buffer, format='PNG')
+        buffer.name = 'logo.png'
+
+        normalized = ingest.normalize_image(buffer)
+
+        with Image.open(normalized) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.getpixel((0, 0)), (255, 255, 255))
+
+
+class IngestUploadTests(TemporaryMediaMixin, TestCase):
+    """Tests for normalizing images uploaded through the API."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.patients = create_patients(user=self.user)
+
+    def tearDown(self):
+        self.patients.image.delete()
+
+    def test_upload_stores_normalized_image(self):
+        """Test the stored image is the normalized JPEG."""
+        with tempfile.TemporaryDirectory() as originals, \
+                override_settings(IMAGE_ORIGINALS_ROOT=originals,
+                                  IMAGE_MAX_EDGE=200):
+            res = self.client.post(
+                image_upload_url(self.patients.id),
+                {'image': camera_jpeg()},
+                format='multipart',
+            )
+            kept = os.listdir(originals)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.patients.refresh_from_db()
+        self.assertTrue(self.patients.image.name.endswith('.jpg'))
+        with Image.open(self.patients.image.path) as image:
+            self.assertEqual(image.size, (150, 200))
+        base = os.path.splitext(os.path.basename(self.patients.image.name))[0]
+        self.assertEqual(kept, [f'{base}.jpeg'])
@@ -0,0 +1,197 @@
+"""
+Tests for serving patients images.
+"""
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.storage import blob_digest
+from patients import media
+from patients.tests.test_identify_api import (
+    create_face,
+    image_file,
+)
+from patients.tests.test_patients_api import (
+    TemporaryMediaMixin,
+    create_patients,
+    image_upload_url,
+)
+from patients.tests.test_patients_images import images_url
+
+
+def content(res):
+    """Return the body of a streaming response."""
+    body = b''.join(res.streaming_content)
+    res.close()
+    return body
+
+
+class ParseRangeTests(SimpleTestCase):
+    """Tests for parsing Range headers."""
+
+    def test_ranges(self):
+        """Test the supported single range forms."""
+        self.assertEqual(media.parse_range('bytes=0-9', 100), (0, 10))
+        self.assertEqual(media.parse_range('bytes=90-', 100), (90, 100))
+        self.assertEqual(media.parse_range('bytes=-5', 100), (95, 100))
+        self.assertEqual(media.parse_range('bytes=50-500', 100), (50, 100))
+
+    def test_ignored_ranges(self):
+        """Test malformed and multiple ranges fall back to the full file."""
+        self.assertIsNone(media.parse_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(media.parse_range('items=0-1', 100))
+
+    def test_unsatisfiable_range(self):
+        """Test ranges past the end of the file are refused."""
+        with self.assertRaises(ValueError):
+            media.parse_range('bytes=100-', 100)
+
+
+class ImageFileApiTests(TemporaryMediaMixin, TestCase):
+    """Tests for the image file view."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.patients = create_patients(user=self.user)
+        with image_file(create_face(0)) as upload:
+            res = self.client.post(
+                image_upload_url(self.patients.id),
+                {'image': upload},
+                format='multipart',
+            )
+        self.url = res.data['image']
+        self.patients.refresh_from_db()
+        with self.patients.image.open('rb') as stored:
+            self.data = stored.read()
+
+    def test_upload_returns_content_hash_url(self):
+        """Test image URLs are named after the image content."""
+        digest = blob_digest(self.patients.image.name)
+
+        self.assertIn(f'/api/patients/images/{digest}.jpg', self.url)
+
+    def test_get_image(self):
+        """Test the image is served with immutable cache headers."""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(content(res), self.data)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', res['Cache-Control'])
+        self.assertIn('private', res['Cache-Control'])
+        self.assertTrue(res['ETag'].startswith('"'))
+
+    def test_if_none_match(self):
+        """Test a matching ETag returns 304 without a body."""
+        etag = self.client.get(self.url)['ETag']
+
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_range_request(self):
+        """Test a byte range returns only those bytes."""
+        res = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+
+        self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(content(res), self.data[10:20])
+        self.assertEqual(
+            res['Content-Range'],
+            f'bytes 10-19/{len(self.data)}',
+        )
+
+    def test_suffix_range_request(self):
+        """Test a suffix range returns the end of the file."""
+        res = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+
+        self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(content(res), self.data[-5:])
+
+    def test_unsatisfiable_range(self):
+        """Test a range past the end returns 416."""
+        res = self.client.get(
+            self.url,
+            HTTP_RANGE=f'bytes={len(self.data)}-',
+        )
+
+        self.assertEqual(
+            res.status_code,
+            status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+        )
+        self.assertEqual(res['Content-Range'], f'bytes */{len(self.data)}')
+
+    def test_if_range_mismatch_sends_full_file(self):
+        """Test a stale If-Range ignores the range."""
+        res = self.client.get(
+            self.url,
+            HTTP_RANGE='bytes=0-9',
+            HTTP_IF_RANGE='"other"',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(content(res), self.data)
+
+    @override_settings(
+        MEDIA_SENDFILE='x-accel-redirect',
+        MEDIA_ACCEL_PREFIX='/protected/',
+    )
+    def test_accel_redirect(self):
+        """Test the web server can be asked to send the file."""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res['X-Accel-Redirect'],
+            f'/protected/{self.patients.image.name}',
+        )
+        self.assertEqual(res.content, b'')
+        self.assertIn('immutable', res['Cache-Control'])
+
+    @override_settings(MEDIA_SENDFILE='x-sendfile')
+    def test_sendfile(self):
+        """Test the file path is handed to the web server."""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res['X-Sendfile'], self.patients.image.path)
+
+    def test_other_user_not_found(self):
+        """Test images of other users' patients are not served."""
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'password123',
+        )
+        client = APIClient()
+        client.force_authenticate(other)
+
+        res = client.get(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_auth_required(self):
+        """Test images are not served anonymously."""
+        res = APIClient().get(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_gallery_image_served(self):
+        """Test gallery images are served by their URL too."""
+        with image_file(create_face(1)) as upload:
+            res = self.client.post(
+                images_url(self.patients.id),
+                {'image': upload},
+                format='multipart',
+            )
+
+        image = self.client.get(res.data['image'])
+
+        self.assertEqual(image.status_code, status.HTTP_200_OK)
+        image.close()
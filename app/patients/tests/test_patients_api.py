@@ -3,10 +3,11 @@ Tests for patients APIs.
 """
 import tempfile
 import os
+import shutil
 
 from PIL import Image
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from rest_framework import status
@@ -26,6 +27,27 @@ from patients.serializers import (
 PATIENTS_URL = reverse('patients:patients-list')
 
 
+class TemporaryMediaMixin:
+    """Store the files written by a test case in a temporary MEDIA_ROOT.
+
+    Deleting an image leaves its blob until collect_blobs runs, so the
+    whole directory is removed after the test case.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+
 def detail_url(patients_id):
     """Create and return a patients detail URL."""
     return reverse('patients:patients-detail', args=[patients_id])
@@ -489,7 +511,7 @@ class PrivatePatientsApiTests(TestCase):
         self.assertNotIn(s3.data, res.data)
 
 
-class ImageUploadTests(TestCase):
+class ImageUploadTests(TemporaryMediaMixin, TestCase):
     """Tests for the image upload API."""
 
     def setUp(self):
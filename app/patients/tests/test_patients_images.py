@@ -0,0 +1,202 @@
+"""
+Tests for patients image galleries and face templates.
+"""
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    FaceTemplate,
+    PatientsImage,
+)
+from patients import faces
+from patients.tests.test_identify_api import (
+    IDENTIFY_URL,
+    create_face,
+    image_file,
+)
+from patients.tests.test_patients_api import (
+    TemporaryMediaMixin,
+    create_patients,
+    image_upload_url,
+)
+
+
+def images_url(patients_id):
+    """Create and return a patients gallery URL."""
+    return reverse('patients:patients-images', args=[patients_id])
+
+
+def image_delete_url(patients_id, image_id):
+    """Create and return a gallery image delete URL."""
+    return reverse(
+        'patients:patients-delete-image',
+        args=[patients_id, image_id],
+    )
+
+
+class AggregateTests(SimpleTestCase):
+    """Tests for aggregating embeddings into templates."""
+
+    def test_aggregate_weights_by_quality(self):
+        """Test better quality embeddings weigh more in the template."""
+        vectors = np.eye(2, dtype=np.float32)
+
+        template = faces.aggregate(vectors, [0.9, 0.1])
+
+        self.assertAlmostEqual(float(np.linalg.norm(template)), 1, places=5)
+        self.assertGreater(template[0], template[1])
+
+    def test_aggregate_ignores_zero_quality(self):
+        """Test faces without quality still contribute a little."""
+        vectors = np.eye(2, dtype=np.float32)
+
+        template = faces.aggregate(vectors, [0, 0])
+
+        self.assertTrue(np.all(np.isfinite(template)))
+
+    def test_face_quality_prefers_sharp_large_faces(self):
+        """Test blurred and small faces score lower."""
+        sharp = create_face(0, size=(128, 128))
+        blurred = sharp.resize((16, 16)).resize((128, 128))
+
+        sharp_quality = faces.face_quality(sharp, (0, 0, 128, 128))
+
+        self.assertGreater(
+            sharp_quality,
+            faces.face_quality(blurred, (0, 0, 128, 128)),
+        )
+        self.assertGreater(
+            sharp_quality,
+            faces.face_quality(sharp, (0, 0, 32, 32)),
+        )
+
+
+class PatientsImagesApiTests(TemporaryMediaMixin, TestCase):
+    """Tests for the patients gallery API."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.patients = create_patients(user=self.user)
+
+    def _add_image(self, seed, patients=None):
+        patients = patients or self.patients
+        with image_file(create_face(seed)) as upload:
+            return self.client.post(
+                images_url(patients.id),
+                {'image': upload},
+                format='multipart',
+            )
+
+    def test_add_images_updates_template(self):
+        """Test every gallery image is enrolled into the template."""
+        res = self._add_image(1)
+        self._add_image(2)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['duplicate_of'], [])
+        self.assertEqual(self.patients.images.count(), 2)
+        self.assertEqual(self.patients.face_embeddings.count(), 2)
+        template = FaceTemplate.objects.get(patients=self.patients)
+        self.assertEqual(template.image_count, 2)
+
+    def test_list_images(self):
+        """Test listing the gallery of a patients."""
+        self._add_image(1)
+        self._add_image(2)
+
+        res = self.client.get(images_url(self.patients.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 2)
+
+    def test_duplicate_image_not_stored(self):
+        """Test a near duplicate of a gallery image is not added again."""
+        first = self._add_image(1)
+        res = self._add_image(1)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['duplicate_of'], [first.data['id']])
+        self.assertEqual(self.patients.images.count(), 1)
+
+    def test_delete_image_updates_template(self):
+        """Test removing gallery images shrinks then drops the template."""
+        first = self._add_image(1)
+        second = self._add_image(2)
+
+        res = self.client.delete(
+            image_delete_url(self.patients.id, first.data['id'])
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.patients.face_embeddings.count(), 1)
+        template = FaceTemplate.objects.get(patients=self.patients)
+        self.assertEqual(template.image_count, 1)
+
+        self.client.delete(
+            image_delete_url(self.patients.id, second.data['id'])
+        )
+        self.assertFalse(
+            FaceTemplate.objects.filter(patients=self.patients).exists()
+        )
+
+    def test_delete_other_users_image_not_found(self):
+        """Test images of other users patients cannot be deleted."""
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'password123',
+        )
+        other_patients = create_patients(user=other)
+        image = PatientsImage.objects.create(
+            patients=other_patients,
+            image='uploads/patients/other.jpg',
+        )
+
+        res = self.client.delete(image_delete_url(other_patients.id, image.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertTrue(PatientsImage.objects.filter(id=image.id).exists())
+
+    def test_identify_matches_any_gallery_image(self):
+        """Test a probe matching one gallery image finds its patients."""
+        others = [create_patients(user=self.user) for _ in range(3)]
+        for seed, patients in enumerate(others, start=10):
+            with image_file(create_face(seed)) as upload:
+                self.client.post(
+                    image_upload_url(patients.id),
+                    {'image': upload},
+                    format='multipart',
+                )
+        with image_file(create_face(1)) as upload:
+            self.client.post(
+                image_upload_url(self.patients.id),
+                {'image': upload},
+                format='multipart',
+            )
+        self._add_image(2)
+        self._add_image(3)
+
+        with image_file(create_face(3)) as upload:
+            res = self.client.post(
+                IDENTIFY_URL,
+                {'image': upload},
+                format='multipart',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        match = res.data['faces'][0]['matches'][0]
+        self.assertEqual(match['id'], self.patients.id)
+        self.assertGreater(match['score'], 0.9)
+        self.assertEqual(
+            FaceTemplate.objects.filter(user=self.user).count(),
+            4,
+        )
@@ -0,0 +1,176 @@
+"""
+Tests for quantized face galleries.
+"""
+from unittest.mock import patch
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.models import FaceEmbedding
+from patients import quantization
+from patients.faces import (
+    active_version,
+    update_template,
+)
+from patients.matcher import Gallery
+from patients.tests.test_patients_api import create_patients
+
+
+def unit_vectors(count, dim=128, seed=0):
+    """Return random unit vectors."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class IndexTests(SimpleTestCase):
+    """Tests for the quantized indexes."""
+
+    def setUp(self):
+        self.vectors = unit_vectors(500)
+
+    def test_scores_close_to_exact(self):
+        """Test every index approximates the exact scores."""
+        exact = self.vectors[:5] @ self.vectors.T
+        tolerances = {'float16': 1e-2, 'int8': 3e-2, 'float32': 1e-6}
+        for method, tolerance in tolerances.items():
+            index = quantization.create_index(method, 128)
+            index.add(self.vectors[:200])
+            index.add(self.vectors[200:])
+            index.freeze()
+
+            scores = index.scores(self.vectors[:5])
+
+            np.testing.assert_allclose(scores, exact, atol=tolerance)
+
+    def test_memory_reduction(self):
+        """Test the compact indexes use fewer bytes."""
+        vectors = unit_vectors(2000)
+        sizes = {}
+        for method in quantization.INDEXES:
+            index = quantization.create_index(method, 128)
+            index.add(vectors)
+            sizes[method] = index.freeze().nbytes
+
+        self.assertEqual(sizes['float16'] * 2, sizes['float32'])
+        self.assertLess(sizes['int8'], sizes['float16'])
+        self.assertLess(sizes['pq'], sizes['int8'])
+
+    def test_pq_rerank_finds_exact_match(self):
+        """Test re-ranking PQ candidates recovers the exact best match."""
+        gallery = Gallery.from_vectors(
+            np.arange(500),
+            self.vectors,
+            'pq',
+            exact_loader=lambda rows: self.vectors[rows],
+            rerank=20,
+        )
+
+        matches = gallery.search(self.vectors[[3, 42]], k=1)
+
+        self.assertEqual(matches[0][0][0], 3)
+        self.assertEqual(matches[1][0][0], 42)
+        self.assertAlmostEqual(matches[0][0][1], 1.0, places=5)
+
+    def test_ivf_finds_stored_vectors(self):
+        """Test the IVF index finds vectors in their own partition."""
+        gallery = Gallery.from_vectors(np.arange(500), self.vectors, 'ivf')
+
+        matches = gallery.search(self.vectors[:20], k=3)
+
+        self.assertEqual([match[0][0] for match in matches], list(range(20)))
+        self.assertTrue(all(len(match) <= 3 for match in matches))
+
+    def test_scores_subset_of_rows(self):
+        """Test scoring a subset of rows matches the full scores."""
+        rows = np.array([7, 3, 450, 120])
+        for method in quantization.INDEXES:
+            index = quantization.create_index(method, 128)
+            index.add(self.vectors)
+            index.freeze()
+
+            scores = index.scores(self.vectors[:3], rows)
+
+            np.testing.assert_allclose(
+                scores,
+                index.scores(self.vectors[:3])[:, rows],
+                atol=1e-6,
+            )
+
+    def test_search_within_rows(self):
+        """Test a restricted search only returns the given rows."""
+        gallery = Gallery.from_vectors(np.arange(500), self.vectors)
+
+        matches = gallery.search(
+            self.vectors[[3, 42]],
+            k=2,
+            rows=np.array([10, 42, 99]),
+        )
+
+        self.assertTrue(all(
+            patients_id in (10, 42, 99)
+            for match in matches for patients_id, _ in match
+        ))
+        self.assertEqual(matches[1][0][0], 42)
+
+    def test_ivf_scores_fewer_rows(self):
+        """Test a probe only scores its closest partitions."""
+        index = quantization.IVFIndex(128, lists=20, nprobe=2)
+        index.add(self.vectors)
+        index.freeze()
+
+        scores = index.scores(self.vectors[:1])
+
+        self.assertLess(np.isfinite(scores).sum(), len(self.vectors))
+
+    def test_ivf_top_from_candidates(self):
+        """Test the IVF top k ranks the candidates without dense scores."""
+        index = quantization.IVFIndex(128, lists=20, nprobe=2)
+        index.add(self.vectors)
+        index.freeze()
+        rows = np.arange(0, 500, 3)
+        dense = index.scores(self.vectors[:4], rows)
+
+        with patch.object(index, 'scores') as scores:
+            top, top_scores = index.top(self.vectors[:4], 5, rows)
+
+        scores.assert_not_called()
+        expected, expected_scores = quantization.top_columns(dense, 5)
+        np.testing.assert_allclose(top_scores, expected_scores, rtol=1e-6)
+        finite = np.isfinite(expected_scores)
+        np.testing.assert_array_equal(top[finite], expected[finite])
+
+
+class QuantizedGalleryTests(TestCase):
+    """Tests for loading quantized galleries from the database."""
+
+    @override_settings(FACE_MATCHER_QUANTIZATION='int8')
+    def test_rerank_loads_exact_vectors(self):
+        """Test exact scores come from the stored float32 vectors."""
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        vectors = unit_vectors(30)
+        patients = []
+        for vector in vectors:
+            patients.append(create_patients(user=user))
+            FaceEmbedding.objects.create(
+                user=user,
+                patients=patients[-1],
+                vector=vector.tobytes(),
+                extractor_version=active_version(),
+            )
+            update_template(patients[-1])
+
+        gallery = Gallery.load(user.id)
+        matches = gallery.search(vectors[7:8], k=2)
+
+        self.assertIsInstance(gallery.index, quantization.Int8Index)
+        self.assertEqual(matches[0][0][0], patients[7].id)
+        self.assertAlmostEqual(
+            matches[0][0][1],
+            float(vectors[7] @ vectors[7]),
+            places=6,
+        )
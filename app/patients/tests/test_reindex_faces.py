@@ -0,0 +1,178 @@
+"""
+Tests for re-indexing faces with a new extractor.
+"""
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from rest_framework.test import APIClient
+
+from core.models import (
+    FaceEmbedding,
+    FaceExtractorVersion,
+    FaceTemplate,
+)
+from patients import faces, matcher
+from patients.tests.test_identify_api import (
+    create_face,
+    image_file,
+)
+from patients.tests.test_patients_api import (
+    TemporaryMediaMixin,
+    create_patients,
+    image_upload_url,
+)
+
+OLD_VERSION = faces.PixelProjectionExtractor.version
+NEW_VERSION = 'pixproj-test'
+
+
+class ReindexExtractor(faces.PixelProjectionExtractor):
+    """Extractor with other projections, incompatible with the default."""
+    version = NEW_VERSION
+
+    def __init__(self):
+        super().__init__(seed=1)
+
+
+NEW_EXTRACTOR = override_settings(
+    FACE_EXTRACTOR='patients.tests.test_reindex_faces.ReindexExtractor',
+    FACE_LEGACY_EXTRACTORS=['patients.faces.PixelProjectionExtractor'],
+)
+
+
+class ReindexFacesCommandTests(TemporaryMediaMixin, TestCase):
+    """Tests for the reindex_faces command."""
+
+    def setUp(self):
+        cache.delete(faces.ACTIVE_VERSION_KEY)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.patients = []
+        for seed in range(3):
+            self.patients.append(self._upload(seed))
+
+    def tearDown(self):
+        cache.delete(faces.ACTIVE_VERSION_KEY)
+
+    def _upload(self, seed):
+        patients = create_patients(user=self.user)
+        with image_file(create_face(seed)) as upload:
+            self.client.post(
+                image_upload_url(patients.id),
+                {'image': upload},
+                format='multipart',
+            )
+        return patients
+
+    def _reindex(self, *args):
+        out = StringIO()
+        call_command(
+            'reindex_faces', '--sleep', '0', *args,
+            stdout=out, stderr=StringIO(),
+        )
+        return out.getvalue()
+
+    def _identify(self, seed):
+        with image_file(create_face(seed)) as upload:
+            return matcher.identify(self.user.id, [upload])[0][0]['matches']
+
+    def test_embeddings_record_version(self):
+        """Test enrolled embeddings record their extractor version."""
+        versions = set(
+            FaceEmbedding.objects.values_list('extractor_version', flat=True)
+        )
+
+        self.assertEqual(versions, {OLD_VERSION})
+
+    @NEW_EXTRACTOR
+    def test_old_index_served_until_complete(self):
+        """Test matching keeps the active extractor during re-indexing."""
+        self._reindex('--no-activate')
+
+        self.assertEqual(faces.active_version(), OLD_VERSION)
+        self.assertEqual(
+            FaceTemplate.objects.filter(
+                extractor_version=NEW_VERSION,
+            ).count(),
+            3,
+        )
+        gallery = matcher.get_gallery(self.user.id)
+        self.assertEqual(gallery.extractor_version, OLD_VERSION)
+        self.assertEqual(self._identify(1)[0][0], self.patients[1].id)
+
+    @NEW_EXTRACTOR
+    def test_uploads_during_reindex_use_both_extractors(self):
+        """Test new images are embedded with the old and new extractor."""
+        patients = self._upload(5)
+
+        versions = set(patients.face_embeddings.values_list(
+            'extractor_version',
+            flat=True,
+        ))
+        self.assertEqual(versions, {OLD_VERSION, NEW_VERSION})
+
+    @NEW_EXTRACTOR
+    def test_switch_when_complete(self):
+        """Test the new extractor is activated once every image is done."""
+        self._reindex()
+
+        self.assertEqual(faces.active_version(), NEW_VERSION)
+        state = FaceExtractorVersion.objects.get(version=NEW_VERSION)
+        self.assertTrue(state.active)
+        self.assertFalse(FaceExtractorVersion.objects.get(
+            version=OLD_VERSION,
+        ).active)
+        gallery = matcher.get_gallery(self.user.id)
+        self.assertEqual(gallery.extractor_version, NEW_VERSION)
+        self.assertEqual(self._identify(2)[0][0], self.patients[2].id)
+
+    @override_settings(FACE_ACTIVE_VERSION_TTL=0)
+    def test_activation_reaches_other_processes(self):
+        """Test a version activated elsewhere is read once expired."""
+        cache.delete(faces.ACTIVE_VERSION_KEY)
+        self.assertEqual(faces.active_version(), OLD_VERSION)
+        self.assertIsNone(cache.get(faces.ACTIVE_VERSION_KEY))
+
+        FaceExtractorVersion.objects.update(active=False)
+        FaceExtractorVersion.objects.create(version=NEW_VERSION, active=True)
+
+        self.assertEqual(faces.active_version(), NEW_VERSION)
+
+    @NEW_EXTRACTOR
+    def test_resume_after_checkpoint(self):
+        """Test an interrupted run resumes after the last patients done."""
+        FaceExtractorVersion.objects.create(
+            version=NEW_VERSION,
+            checkpoint=self.patients[0].id,
+        )
+
+        out = self._reindex('--batch-size', '1', '--no-activate')
+
+        self.assertIn(f'resuming after patients {self.patients[0].id}', out)
+        self.assertNotIn(f'up to patients {self.patients[0].id}.', out)
+        self.assertIn(f'up to patients {self.patients[2].id}.', out)
+        self.assertEqual(
+            FaceExtractorVersion.objects.get(version=NEW_VERSION).checkpoint,
+            self.patients[2].id,
+        )
+
+    @NEW_EXTRACTOR
+    def test_prune_old_embeddings(self):
+        """Test pruning drops the embeddings of the old extractor."""
+        self._reindex('--prune')
+
+        self.assertFalse(FaceEmbedding.objects.filter(
+            extractor_version=OLD_VERSION,
+        ).exists())
+        self.assertFalse(FaceTemplate.objects.filter(
+            extractor_version=OLD_VERSION,
+        ).exists())
+        self.assertEqual(FaceEmbedding.objects.count(), 3)
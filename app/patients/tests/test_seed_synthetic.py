@@ -0,0 +1,147 @@
+"""
+Tests for the synthetic dataset command.
+"""
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.models import (
+    FaceEmbedding,
+    FaceTemplate,
+    ImageBlob,
+    Patients,
+    Tag,
+    Treatment,
+)
+from patients.management.commands.seed_synthetic import _copy_value
+from patients.matcher import get_gallery
+
+
+def seed(**options):
+    """Run the command and return its output."""
+    out = StringIO()
+    params = {
+        'users': 3,
+        'patients': 20,
+        'faces': 4,
+        'face_size': 64,
+        'batch_size': 25,
+    }
+    params.update(options)
+    call_command('seed_synthetic', stdout=out, **params)
+    return out.getvalue()
+
+
+def dataset():
+    """Return the generated patients with their links, in creation order."""
+    return [
+        (
+            patients.user.email,
+            patients.first_name,
+            patients.age,
+            patients.date_of_birth,
+            patients.image.name,
+            sorted(tag.name for tag in patients.tags.all()),
+            sorted(treatment.name for treatment in patients.treatment.all()),
+        )
+        for patients in Patients.objects.order_by('id')
+    ]
+
+
+class CopyValueTests(SimpleTestCase):
+    """Tests for formatting values for COPY."""
+
+    def test_special_values(self):
+        """Test NULL, booleans and binary values are formatted."""
+        self.assertEqual(_copy_value(None), '\\N')
+        self.assertEqual(_copy_value(True), 't')
+        self.assertEqual(_copy_value(b'\x01\xff'), '\\\\x01ff')
+
+    def test_text_escaped(self):
+        """Test separators and backslashes in text are escaped."""
+        self.assertEqual(_copy_value('a\tb\nc\\d'), 'a\\tb\\nc\\\\d')
+
+
+class SeedSyntheticCommandTests(TestCase):
+    """Tests for generating a synthetic dataset."""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media.cleanup()
+
+    def test_dataset_created(self):
+        """Test users, patients, links and faces are created."""
+        out = seed(tags=5, treatments=3)
+
+        self.assertIn('Created 3 user(s) and 60 patients', out)
+        user = get_user_model().objects.get(email='synthetic-0-0@example.com')
+        self.assertTrue(user.check_password('password123'))
+        self.assertEqual(Patients.objects.filter(user=user).count(), 20)
+        self.assertEqual(Tag.objects.filter(user=user).count(), 5)
+        self.assertEqual(Treatment.objects.filter(user=user).count(), 3)
+        self.assertGreater(Patients.tags.through.objects.count(), 0)
+        self.assertGreater(Patients.treatment.through.objects.count(), 0)
+        for patients in Patients.objects.filter(user=user):
+            self.assertTrue(all(
+                tag.user_id == user.id for tag in patients.tags.all()
+            ))
+
+    def test_faces_shared_and_enrolled(self):
+        """Test images come from the face pool and are embedded."""
+        seed()
+
+        with_image = Patients.objects.exclude(image='')
+        self.assertGreater(with_image.count(), 0)
+        self.assertLessEqual(
+            with_image.values('image').distinct().count(),
+            4,
+        )
+        self.assertFalse(with_image.filter(image_hash__isnull=True).exists())
+        self.assertEqual(
+            sum(ImageBlob.objects.values_list('refcount', flat=True)),
+            with_image.count(),
+        )
+        self.assertEqual(FaceEmbedding.objects.count(), with_image.count())
+        self.assertEqual(FaceTemplate.objects.count(), with_image.count())
+        user = with_image.first().user
+        self.assertEqual(
+            len(get_gallery(user.id)),
+            with_image.filter(user=user).count(),
+        )
+
+    def test_deterministic(self):
+        """Test the same seed generates the same dataset."""
+        seed(patients_sigma=0.5, seed=7)
+        first = dataset()
+        get_user_model().objects.all().delete()
+
+        seed(patients_sigma=0.5, seed=7)
+
+        self.assertEqual(dataset(), first)
+
+    def test_patients_spread(self):
+        """Test a log-normal spread gives users different sizes."""
+        seed(users=6, patients_sigma=1.0, image_ratio=0)
+
+        counts = {
+            user.patients_set.count()
+            for user in get_user_model().objects.all()
+        }
+        self.assertGreater(len(counts), 1)
+        self.assertFalse(FaceEmbedding.objects.exists())
+
+    def test_existing_seed_refused(self):
+        """Test a seed cannot be loaded twice."""
+        seed(users=1, patients=1, image_ratio=0)
+
+        with self.assertRaises(CommandError):
+            seed(users=1, patients=1, image_ratio=0)
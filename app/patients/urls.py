@@ -20,4 +20,9 @@ app_name = 'patients'
 
 urlpatterns = [
     path('', include(router.urls)),
+    path(
+        'images/<str:filename>',
+        views.PatientsImageFileView.as_view(),
+        name='image-file',
+    ),
 ]
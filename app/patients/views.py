@@ -1,6 +1,8 @@
 """
 Views for the patients APIs
 """
+from django.conf import settings
+
 from rest_framework import (
     viewsets,
     mixins,
@@ -14,17 +16,49 @@ from drf_spectacular.utils import (
     OpenApiTypes,
 )
 
+from django.http import (
+    Http404,
+    StreamingHttpResponse,
+)
+from django.utils import timezone
+
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 
 from core.models import (
     Patients,
+    PatientsImage,
     Tag,
     Treatment,
 )
-from patients import serializers
+from patients import (
+    export,
+    faces,
+    imagehash,
+    matcher,
+    media,
+    serializers,
+)
+from user.authentication import (
+    AccessTokenAuthentication,
+    CachedTokenAuthentication,
+)
+
+
+IDENTIFY_FILTERS = [
+    OpenApiParameter(
+        'tags',
+        OpenApiTypes.STR,
+        description='Comma separated list of tag IDs to search among',
+    ),
+    OpenApiParameter(
+        'treatment',
+        OpenApiTypes.STR,
+        description='Comma separated list of treatment IDs to search among',
+    ),
+]
 
 
 @extend_schema_view(
@@ -47,7 +81,10 @@ class PatientsViewSet(viewsets.ModelViewSet):
     """View for manage patients APIs."""
     serializer_class = serializers.PatientsDetailSerializer
     queryset = Patients.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        AccessTokenAuthentication,
+        CachedTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated]
 
     def _params_to_ints(self, qs):
@@ -76,6 +113,12 @@ class PatientsViewSet(viewsets.ModelViewSet):
             return serializers.PatientsSerializer
         elif self.action == 'upload_image':
             return serializers.PatientsImageSerializer
+        elif self.action in ('images', 'delete_image'):
+            return serializers.PatientsGalleryImageSerializer
+        elif self.action == 'identify':
+            return serializers.IdentifySerializer
+        elif self.action == 'identify_batch':
+            return serializers.BatchIdentifySerializer
 
         return self.serializer_class
 
@@ -90,11 +133,221 @@ class PatientsViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(patients, data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            image_hash = imagehash.hash_file(
+                serializer.validated_data['image']
+            )
+            duplicates = [
+                duplicate for duplicate, distance in imagehash.find_duplicates(
+                    Patients.objects.filter(user=request.user),
+                    image_hash,
+                    settings.IMAGE_DUPLICATE_DISTANCE,
+                )
+            ]
+            if patients in duplicates:
+                data = self.get_serializer(patients).data
+                data['duplicate_of'] = [patients.id]
+                return Response(data, status=status.HTTP_200_OK)
+
+            serializer.save(**imagehash.hash_fields(image_hash))
+            faces.enroll(patients, source=next(iter(duplicates), None))
+            data = serializer.data
+            data['duplicate_of'] = [duplicate.id for duplicate in duplicates]
+            return Response(data, status=status.HTTP_200_OK)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(methods=['GET', 'POST'], detail=True, url_path='images')
+    def images(self, request, pk=None):
+        """List or add gallery images of patients.
+
+        Each image is enrolled and folded into the face template of the
+        patients. A near duplicate of an image already in the gallery is
+        not stored again.
+        """
+        patients = self.get_object()
+        if request.method == 'GET':
+            serializer = self.get_serializer(
+                patients.images.order_by('id'),
+                many=True,
+            )
             return Response(serializer.data, status=status.HTTP_200_OK)
 
+        serializer = self.get_serializer(data=request.data)
+        if serializer.is_valid():
+            image_hash = imagehash.hash_file(
+                serializer.validated_data['image']
+            )
+            for existing in patients.images.exclude(image_hash=None):
+                distance = imagehash.hamming(
+                    imagehash.to_unsigned(existing.image_hash),
+                    image_hash,
+                )
+                if distance <= settings.IMAGE_DUPLICATE_DISTANCE:
+                    data = self.get_serializer(existing).data
+                    data['duplicate_of'] = [existing.id]
+                    return Response(data, status=status.HTTP_200_OK)
+
+            patients_image = serializer.save(
+                patients=patients,
+                image_hash=imagehash.to_signed(image_hash),
+            )
+            faces.enroll_image(patients_image)
+            data = serializer.data
+            data['duplicate_of'] = []
+            return Response(data, status=status.HTTP_201_CREATED)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @extend_schema(parameters=[
+        OpenApiParameter('image_id', OpenApiTypes.INT, OpenApiParameter.PATH),
+    ])
+    @action(
+        methods=['DELETE'],
+        detail=True,
+        url_path=r'images/(?P<image_id>[0-9]+)',
+    )
+    def delete_image(self, request, pk=None, image_id=None):
+        """Remove an image from the gallery of patients."""
+        patients = self.get_object()
+        deleted, _ = patients.images.filter(id=image_id).delete()
+        if not deleted:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        faces.update_template(patients)
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @extend_schema(
+        parameters=IDENTIFY_FILTERS,
+        responses={(200, 'application/zip'): OpenApiTypes.BINARY},
+    )
+    @action(methods=['GET'], detail=False, url_path='export')
+    def export_images(self, request):
+        """Download the images of the user's patients as a ZIP archive.
+
+        The archive is streamed entry by entry and ends with a manifest
+        CSV. The tags and treatment filters of the list apply.
+        """
+        response = StreamingHttpResponse(
+            export.stream_images(self.get_queryset()),
+            content_type='application/zip',
+        )
+        filename = f'patients-images-{timezone.now():%Y%m%d}.zip'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+
+        return response
+
+    def _identify(self, images, boxes, k):
+        """Identify the faces of images and describe the matches.
+
+        The tags and treatment query parameters restrict the search like
+        they filter the patients list.
+        """
+        tags = self.request.query_params.get('tags')
+        treatment = self.request.query_params.get('treatment')
+        results = matcher.identify(
+            self.request.user.id,
+            images,
+            boxes,
+            k=k,
+            tags=self._params_to_ints(tags) if tags else None,
+            treatments=self._params_to_ints(treatment) if treatment else None,
+        )
+        patients_ids = {
+            patients_id
+            for image_faces in results
+            for face in image_faces
+            for patients_id, score in face['matches']
+        }
+        patients = Patients.objects.filter(
+            user=self.request.user,
+        ).in_bulk(patients_ids)
+        for image_faces in results:
+            for face in image_faces:
+                face['matches'] = [
+                    {
+                        'id': patients_id,
+                        'first_name': patients[patients_id].first_name,
+                        'last_name': patients[patients_id].last_name,
+                        'score': score,
+                    }
+                    for patients_id, score in face['matches']
+                    if patients_id in patients
+                ]
+
+        return results
+
+    @extend_schema(parameters=IDENTIFY_FILTERS)
+    @action(methods=['POST'], detail=False, url_path='identify')
+    def identify(self, request):
+        """Identify the faces of an image among the user's patients."""
+        serializer = self.get_serializer(data=request.data)
+
+        if serializer.is_valid():
+            data = serializer.validated_data
+            boxes = data.get('boxes')
+            results = self._identify(
+                [data['image']],
+                [boxes] if boxes else None,
+                data['k'],
+            )
+            return Response({'faces': results[0]}, status=status.HTTP_200_OK)
+
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @extend_schema(parameters=IDENTIFY_FILTERS)
+    @action(methods=['POST'], detail=False, url_path='identify-batch')
+    def identify_batch(self, request):
+        """Identify the faces of several images in one batch."""
+        serializer = self.get_serializer(data=request.data)
+
+        if serializer.is_valid():
+            data = serializer.validated_data
+            results = self._identify(
+                data['images'],
+                data.get('boxes'),
+                data['k'],
+            )
+            return Response(
+                {'results': [{'faces': result} for result in results]},
+                status=status.HTTP_200_OK,
+            )
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class PatientsImageFileView(APIView):
+    """Serve a stored image of the authenticated user's patients.
+
+    URLs are named after the content of the image, so responses never
+    change and can be cached forever.
+    """
+    authentication_classes = [
+        AccessTokenAuthentication,
+        CachedTokenAuthentication,
+    ]
+    permission_classes = [IsAuthenticated]
+
+    def perform_content_negotiation(self, request, force=False):
+        """Serve images whatever the client accepts."""
+        return super().perform_content_negotiation(request, force=True)
+
+    @extend_schema(responses={(200, 'image/*'): OpenApiTypes.BINARY})
+    def get(self, request, filename):
+        name = media.blob_for_filename(filename)
+        if name is None:
+            raise Http404
+        owned = Patients.objects.filter(
+            user=request.user,
+            image=name,
+        ).exists() or PatientsImage.objects.filter(
+            patients__user=request.user,
+            image=name,
+        ).exists()
+        if not owned or not media.image_storage().exists(name):
+            raise Http404
+
+        return media.serve_blob(request, name)
+
 
 @extend_schema_view(
     list=extend_schema(
@@ -112,7 +365,10 @@ class BasePatientsAttrViewSet(mixins.DestroyModelMixin,
                               mixins.ListModelMixin,
                               viewsets.GenericViewSet):
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        AccessTokenAuthentication,
+        CachedTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -0,0 +1,203 @@
+"""
+Token authentication with cached lookups and signed access tokens.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    BaseAuthentication,
+    TokenAuthentication,
+    get_authorization_header,
+)
+
+from user.tokens import (
+    InvalidToken,
+    read_access_token,
+    usage,
+)
+
+
+class AuthCache:
+    """Two tier cache of authentication lookups by key.
+
+    A bounded in-process LRU with a short TTL sits in front of the
+    AUTH_TOKEN_CACHE cache, shared by the processes. Invalidation removes
+    both tiers in this process and the shared tier for the others, whose
+    local entries expire within AUTH_TOKEN_LOCAL_TTL seconds. A local
+    memory cache is private to each process and could not be invalidated
+    by the others, so it is skipped and entries live
+    AUTH_TOKEN_LOCAL_TTL seconds at most.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[settings.AUTH_TOKEN_CACHE]
+
+    @property
+    def shared(self):
+        """Whether the cache of the shared tier is shared by processes."""
+        return not isinstance(self.cache, LocMemCache)
+
+    def _cache_key(self, key):
+        digest = hashlib.sha256(str(key).encode()).hexdigest()[:32]
+        return f'auth:{self.prefix}:{digest}'
+
+    def get(self, key):
+        """Return the cached value of a key, or None."""
+        cache_key = self._cache_key(key)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.entries.move_to_end(cache_key)
+                    return entry[1]
+                del self.entries[cache_key]
+        if not self.shared:
+            return None
+        value = self.cache.get(cache_key)
+        if value is not None:
+            self._remember(cache_key, value, now)
+        return value
+
+    def set(self, key, value):
+        """Cache the value of a key in both tiers."""
+        cache_key = self._cache_key(key)
+        if self.shared:
+            self.cache.set(
+                cache_key, value, settings.AUTH_TOKEN_CACHE_TTL,
+            )
+        self._remember(cache_key, value, time.monotonic())
+
+    def invalidate(self, key):
+        """Forget a key in both tiers."""
+        cache_key = self._cache_key(key)
+        if self.shared:
+            self.cache.delete(cache_key)
+        with self.lock:
+            self.entries.pop(cache_key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def _remember(self, cache_key, value, now):
+        expires = now + settings.AUTH_TOKEN_LOCAL_TTL
+        with self.lock:
+            self.entries[cache_key] = (expires, value)
+            self.entries.move_to_end(cache_key)
+            while len(self.entries) > settings.AUTH_TOKEN_LOCAL_SIZE:
+                self.entries.popitem(last=False)
+
+
+# (user id, is_active, key, expiry) of DRF tokens by key, and (id,
+# is_active, token_version) of users by id.
+tokens = AuthCache('token')
+users = AuthCache('user')
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that skips the token and user query when cached.
+
+    Only the user id and status and the expiry of the token are cached.
+    Entries are dropped when the token is deleted or regenerated and when
+    its user is saved, which covers is_active changes. Expired tokens are
+    refused and the last use of the others recorded. The request user and
+    token are new instances with their other fields deferred.
+    """
+    user_fields = ('id', 'is_active')
+
+    def authenticate_credentials(self, key):
+        cached = tokens.get(key)
+        if cached is None:
+            cached = self.get_model().objects.filter(key=key).values_list(
+                'user_id', 'user__is_active', 'key', 'info__expires',
+            ).first()
+            if cached is None:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            cached = tuple(cached)
+            tokens.set(key, cached)
+        user_id, is_active, token_key, expires = cached
+
+        if not is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        if expires is not None and expires <= timezone.now():
+            raise exceptions.AuthenticationFailed(_('Token expired.'))
+        usage.record(key)
+        user = get_user_model().from_db(
+            DEFAULT_DB_ALIAS, list(self.user_fields), [user_id, is_active],
+        )
+        token = self.get_model().from_db(
+            DEFAULT_DB_ALIAS, ['key', 'user_id'], [token_key, user_id],
+        )
+        return user, token
+
+
+class AccessTokenAuthentication(BaseAuthentication):
+    """Authentication with signed access tokens as "Bearer <token>".
+
+    The signature and expiry are checked without the database, and the
+    token version against the status and token version of the user,
+    cached like DRF tokens. The request user is a new instance with its
+    other fields deferred, loaded from the database on first use.
+    """
+    keyword = 'Bearer'
+    user_fields = ('id', 'is_active', 'token_version')
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid token header.')
+            )
+        try:
+            claims = read_access_token(auth[1].decode())
+        except (InvalidToken, UnicodeError) as error:
+            raise exceptions.AuthenticationFailed(str(error))
+
+        user_model = get_user_model()
+        state = users.get(claims['uid'])
+        if state is None:
+            state = user_model.objects.filter(pk=claims['uid']).values_list(
+                *self.user_fields,
+            ).first()
+            if state is None:
+                raise exceptions.AuthenticationFailed(
+                    _('User inactive or deleted.')
+                )
+            users.set(claims['uid'], tuple(state))
+        is_active, token_version = state[1:]
+        if not is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        if token_version != claims['ver']:
+            raise exceptions.AuthenticationFailed(_('Token revoked.'))
+
+        user = user_model.from_db(
+            DEFAULT_DB_ALIAS, list(self.user_fields), list(state),
+        )
+        return user, claims
+
+    def authenticate_header(self, request):
+        return self.keyword
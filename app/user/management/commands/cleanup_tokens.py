@@ -0,0 +1,69 @@
+"""
+Django command to delete expired auth and refresh tokens.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from core.models import RefreshToken
+
+
+class Command(BaseCommand):
+    """Django command to delete expired tokens in small batches.
+
+    Every batch is deleted by primary key in its own short transaction,
+    so rows are only locked briefly and the command can be stopped and
+    run again at any time.
+    """
+
+    help = 'Delete expired auth tokens and refresh tokens.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Tokens deleted per transaction.',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.0,
+            help='Seconds to pause between batches.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        now = timezone.now()
+        tokens = self._delete(
+            Token.objects.filter(info__expires__lte=now),
+            options['batch_size'],
+            options['sleep'],
+        )
+        refresh_tokens = self._delete(
+            RefreshToken.objects.filter(expires__lte=now),
+            options['batch_size'],
+            options['sleep'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {tokens} expired auth token(s) and '
+            f'{refresh_tokens} refresh token(s).'
+        ))
+
+    def _delete(self, queryset, batch_size, sleep):
+        """Delete the rows of a queryset batch by batch, return the count."""
+        model = queryset.model
+        deleted = 0
+        while True:
+            pks = list(queryset.order_by('pk').values_list(
+                'pk', flat=True,
+            )[:batch_size])
+            if not pks:
+                return deleted
+            model.objects.filter(pk__in=pks).delete()
+            deleted += len(pks)
+            if sleep:
+                time.sleep(sleep)
@@ -0,0 +1,13 @@
+"""
+OpenAPI extensions for the user app.
+"""
+from drf_spectacular.extensions import OpenApiAuthenticationExtension
+
+
+class AccessTokenScheme(OpenApiAuthenticationExtension):
+    """Document signed access tokens as a bearer scheme."""
+    target_class = 'user.authentication.AccessTokenAuthentication'
+    name = 'accessTokenAuth'
+
+    def get_security_definition(self, auto_schema):
+        return {'type': 'http', 'scheme': 'bearer'}
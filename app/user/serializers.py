@@ -9,6 +9,8 @@ from django.utils.translation import gettext as _
 
 from rest_framework import serializers
 
+from user import throttling
+
 
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for the user object."""
@@ -46,14 +48,40 @@ class AuthTokenSerializer(serializers.Serializer):
         """Validate and authenticate the user."""
         email = attrs.get('email')
         password = attrs.get('password')
+        msg = _('Unable to authenticate with provided credentials.')
+        if throttling.is_unknown_email(email):
+            throttling.record_rejection('unknown_email')
+            raise serializers.ValidationError(msg, code='authorization')
         user = authenticate(
             request=self.context.get('request'),
             username=email,
             password=password,
         )
         if not user:
-            msg = _('Unable to authenticate with provided credentials.')
+            # Unknown emails are remembered case-insensitively, so only
+            # an email no user has in any case is unknown.
+            if not get_user_model().objects.filter(
+                email__iexact=email,
+            ).exists():
+                throttling.remember_unknown_email(email)
             raise serializers.ValidationError(msg, code='authorization')
 
         attrs['user'] = user
         return attrs
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    """Serializer for a refresh token."""
+    refresh = serializers.CharField(trim_whitespace=False)
+
+
+class LogoutSerializer(serializers.Serializer):
+    """Serializer for logging out, optionally with a refresh token."""
+    refresh = serializers.CharField(required=False, trim_whitespace=False)
+
+
+class TokenPairSerializer(serializers.Serializer):
+    """Serializer for an access and refresh token pair."""
+    access = serializers.CharField()
+    refresh = serializers.CharField()
+    expires_in = serializers.IntegerField()
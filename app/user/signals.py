@@ -0,0 +1,59 @@
+"""
+Signal handlers for the user app.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from core.models import AuthTokenInfo
+from user.authentication import tokens, users
+from user.throttling import forget_unknown_email
+from user.tokens import token_expiry
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def token_changed(sender, instance, created=False, **kwargs):
+    """Drop a saved or deleted token from the token cache.
+
+    New tokens expire AUTH_TOKEN_TTL seconds after their creation.
+    """
+    if created:
+        AuthTokenInfo.objects.create(token=instance, expires=token_expiry())
+    tokens.invalidate(instance.key)
+
+
+@receiver(post_save, sender=AuthTokenInfo)
+def token_info_changed(sender, instance, **kwargs):
+    """Drop a token whose expiry changed from the token cache."""
+    tokens.invalidate(instance.token_id)
+
+
+@receiver(post_init, sender=get_user_model())
+def user_loaded(sender, instance, **kwargs):
+    """Remember the email a user was loaded with, unless deferred."""
+    instance._loaded_email = instance.__dict__.get('email')
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def user_changed(sender, instance, created=False, **kwargs):
+    """Drop the cached status of a saved or deleted user.
+
+    Cached tokens hold the status of their user, so any save refreshes
+    them, including status and token version changes. A new or changed
+    email is no longer unknown.
+    """
+    email = instance.__dict__.get('email')
+    if email is not None and (created or email != instance._loaded_email):
+        forget_unknown_email(email)
+        instance._loaded_email = email
+    if created:
+        return
+    users.invalidate(instance.pk)
+    for key in Token.objects.filter(user=instance).values_list(
+        'key', flat=True,
+    ):
+        tokens.invalidate(key)
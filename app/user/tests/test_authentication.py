@@ -0,0 +1,178 @@
+"""
+Tests for cached token authentication.
+"""
+import json
+from io import StringIO
+from unittest.mock import PropertyMock, patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user.authentication import AuthCache, tokens
+
+
+ME_URL = reverse('user:me')
+LOGOUT_URL = reverse('user:logout')
+PATIENTS_URL = reverse('patients:patients-list')
+
+
+@override_settings(AUTH_TOKEN_USAGE_FLUSH_INTERVAL=3600)
+class CachedTokenAuthenticationTests(TestCase):
+    """Tests for authenticating with cached tokens."""
+
+    def setUp(self):
+        cache.clear()
+        tokens.clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return len(captured)
+
+    def test_cached_token_skips_query(self):
+        """Test repeated requests do not look the token up again."""
+        first = self.count_queries(PATIENTS_URL)
+        second = self.count_queries(PATIENTS_URL)
+
+        self.assertEqual(second, first - 1)
+
+    def test_local_tier_without_shared_cache(self):
+        """Test a local memory auth cache is not used as shared tier."""
+        first = self.count_queries(PATIENTS_URL)
+        tokens.clear()
+
+        self.assertFalse(tokens.shared)
+        self.assertIsNone(
+            tokens.cache.get(tokens._cache_key(self.token.key)),
+        )
+        self.assertEqual(self.count_queries(PATIENTS_URL), first)
+
+    def test_shared_cache_tier(self):
+        """Test tokens missing from the local tier come from the cache."""
+        with patch.object(
+            AuthCache, 'shared', new_callable=PropertyMock, return_value=True,
+        ):
+            first = self.count_queries(PATIENTS_URL)
+            tokens.clear()
+
+            second = self.count_queries(PATIENTS_URL)
+
+        self.assertEqual(second, first - 1)
+
+    @override_settings(AUTH_TOKEN_LOCAL_SIZE=1)
+    def test_local_tier_is_bounded(self):
+        """Test the local tier evicts its least recently used tokens."""
+        other = Token.objects.create(user=get_user_model().objects.create_user(
+            'other@example.com',
+            'password123',
+        ))
+        tokens.set(self.token.key, (self.user.pk, True, self.token.key, None))
+        tokens.set(other.key, (other.user.pk, True, other.key, None))
+
+        self.assertEqual(len(tokens.entries), 1)
+
+    def test_invalid_token_rejected(self):
+        """Test unknown tokens are still rejected."""
+        self.client.credentials(HTTP_AUTHORIZATION='Token unknown')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token_rejected(self):
+        """Test deleting a token revokes it immediately."""
+        self.count_queries(ME_URL)
+
+        self.token.delete()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_inactive_user_rejected(self):
+        """Test deactivating a user revokes their cached tokens."""
+        self.count_queries(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_only_token_status_cached(self):
+        """Test the cache holds no user instance or password hash."""
+        self.count_queries(ME_URL)
+
+        self.assertEqual(tokens.get(self.token.key), (
+            self.user.pk,
+            True,
+            self.token.key,
+            self.token.info.expires,
+        ))
+
+    def test_password_change(self):
+        """Test the deferred request user saves a new password."""
+        self.count_queries(ME_URL)
+
+        res = self.client.patch(ME_URL, {'password': 'newpassword123'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('newpassword123'))
+        self.assertEqual(self.user.email, 'user@example.com')
+
+    def test_logout(self):
+        """Test logging out deletes the token and revokes it."""
+        self.count_queries(ME_URL)
+
+        res = self.client.post(LOGOUT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_requires_auth(self):
+        """Test logging out requires a token."""
+        res = APIClient().post(LOGOUT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(AUTH_TOKEN_USAGE_FLUSH_INTERVAL=3600)
+class AuthBenchmarkTests(TestCase):
+    """Tests for the authentication benchmark."""
+
+    def test_benchmark_auth(self):
+        """Test the suite reports the queries saved per request."""
+        out = StringIO()
+
+        call_command(
+            'benchmark',
+            'auth',
+            param=['patients=3', 'requests=5'],
+            stdout=out,
+        )
+
+        results = json.loads(out.getvalue())['results']
+        self.assertEqual(results['queries_saved_per_request'], {
+            'cached_token': 1,
+            'access_token': 1,
+        })
+        self.assertFalse(get_user_model().objects.exists())
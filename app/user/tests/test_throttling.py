@@ -0,0 +1,182 @@
+"""
+Tests for login throttling.
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from user import throttling
+
+
+TOKEN_URL = reverse('user:token')
+
+
+class TokenBucketTests(SimpleTestCase):
+    """Tests for the token buckets."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_burst_then_refill(self):
+        """Test a bucket allows its burst and refills over time."""
+        waits = [
+            throttling.take('bucket', rate=0.5, burst=3, now=100)
+            for _ in range(4)
+        ]
+
+        self.assertEqual(waits[:3], [0, 0, 0])
+        self.assertAlmostEqual(waits[3], 2)
+        self.assertEqual(throttling.take('bucket', 0.5, 3, now=102), 0)
+
+    def test_buckets_are_separate(self):
+        """Test emptying one bucket leaves the others full."""
+        throttling.take('first', rate=1, burst=1, now=100)
+
+        self.assertGreater(throttling.take('first', 1, 1, now=100), 0)
+        self.assertEqual(throttling.take('second', 1, 1, now=100), 0)
+
+
+@override_settings(
+    LOGIN_THROTTLE_IP_BURST=100,
+    LOGIN_THROTTLE_EMAIL_BURST=3,
+    LOGIN_THROTTLE_EMAIL_RATE=0.01,
+)
+class LoginThrottleApiTests(TestCase):
+    """Tests for throttling the token endpoint."""
+
+    def setUp(self):
+        cache.clear()
+        throttling.rejections.clear()
+        self.client = APIClient()
+        get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+
+    def login(self, email='user@example.com', password='wrong', **extra):
+        return self.client.post(
+            TOKEN_URL,
+            {'email': email, 'password': password},
+            **extra,
+        )
+
+    def test_email_throttled(self):
+        """Test bad logins for one email are refused without hashing."""
+        for _ in range(3):
+            self.assertEqual(
+                self.login().status_code,
+                status.HTTP_400_BAD_REQUEST,
+            )
+
+        with patch('user.serializers.authenticate') as authenticate, \
+                self.assertLogs('user.throttling', 'WARNING'):
+            res = self.login(password='password123')
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+        authenticate.assert_not_called()
+        self.assertEqual(throttling.rejections['email'], 1)
+
+    def test_email_throttle_ignores_case(self):
+        """Test the email bucket does not depend on case or spaces."""
+        self.login(email='user@example.com')
+        self.login(email='USER@example.com')
+        self.login(email=' User@Example.com')
+
+        with self.assertLogs('user.throttling', 'WARNING'):
+            res = self.login()
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_other_email_allowed(self):
+        """Test throttling one email does not lock out others."""
+        with self.assertLogs('user.throttling', 'WARNING'):
+            for _ in range(4):
+                self.login()
+
+        res = self.login(email='other@example.com')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(LOGIN_THROTTLE_IP_BURST=2)
+    def test_ip_throttled(self):
+        """Test attempts from one IP are limited across emails."""
+        self.login(email='a@example.com')
+        self.login(email='b@example.com')
+
+        with self.assertLogs('user.throttling', 'WARNING') as logs:
+            res = self.login(email='c@example.com')
+        other = self.login(email='d@example.com', REMOTE_ADDR='10.0.0.2')
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(other.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(throttling.rejections['ip'], 1)
+        self.assertIn('ip', logs.output[0])
+
+    @override_settings(LOGIN_UNKNOWN_EMAIL_TTL=60)
+    def test_unknown_email_cached(self):
+        """Test unknown emails are refused without hashing once seen."""
+        self.login(email='unknown@example.com')
+
+        with patch('user.serializers.authenticate') as authenticate, \
+                self.assertLogs('user.throttling', 'WARNING'):
+            res = self.login(email='unknown@example.com')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        authenticate.assert_not_called()
+        self.assertEqual(throttling.rejections['unknown_email'], 1)
+
+    @override_settings(LOGIN_UNKNOWN_EMAIL_TTL=60)
+    def test_unknown_email_forgotten_on_signup(self):
+        """Test a new user can log in right after a failed attempt."""
+        self.login(email='new@example.com')
+        get_user_model().objects.create_user('new@example.com', 'pass12345')
+
+        res = self.login(email='new@example.com', password='pass12345')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(LOGIN_UNKNOWN_EMAIL_TTL=60)
+    def test_unknown_email_forgotten_on_email_change(self):
+        """Test a user can log in right after taking an unknown email."""
+        self.login(email='renamed@example.com', password='password123')
+        user = get_user_model().objects.get(email='user@example.com')
+        self.client.force_authenticate(user)
+        res = self.client.patch(reverse('user:me'), {
+            'email': 'renamed@example.com',
+        })
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.client.force_authenticate(None)
+
+        res = self.login(email='renamed@example.com', password='password123')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(LOGIN_UNKNOWN_EMAIL_TTL=60)
+    def test_other_case_not_unknown(self):
+        """Test a wrong case of an email does not lock its user out."""
+        get_user_model().objects.create_user('Mixed@example.com', 'pass12345')
+        self.login(email='mixed@example.com', password='pass12345')
+
+        res = self.login(email='Mixed@example.com', password='pass12345')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('unknown_email', throttling.rejections)
+
+    def test_unknown_email_not_cached_by_default(self):
+        """Test the negative cache is off unless configured."""
+        self.login(email='unknown@example.com')
+
+        with patch(
+            'user.serializers.authenticate',
+            return_value=None,
+        ) as authenticate:
+            self.login(email='unknown@example.com')
+
+        authenticate.assert_called_once()
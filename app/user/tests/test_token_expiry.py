@@ -0,0 +1,168 @@
+"""
+Tests for auth token expiry, last use and cleanup.
+"""
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import AuthTokenInfo, RefreshToken
+from user import tokens
+from user.authentication import tokens as token_cache
+
+
+TOKEN_URL = reverse('user:token')
+ME_URL = reverse('user:me')
+
+
+def create_user(email='user@example.com'):
+    """Create and return a user."""
+    return get_user_model().objects.create_user(email, 'password123')
+
+
+def expire(token):
+    """Make a token expired."""
+    AuthTokenInfo.objects.filter(token=token).update(
+        expires=timezone.now() - timedelta(seconds=1),
+    )
+    token_cache.invalidate(token.key)
+
+
+class TokenExpiryTests(TestCase):
+    """Tests for expiring auth tokens."""
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        tokens.usage.pending.clear()
+        self.user = create_user()
+        self.client = APIClient()
+
+    def login(self):
+        res = self.client.post(TOKEN_URL, {
+            'email': 'user@example.com',
+            'password': 'password123',
+        })
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data['token']
+
+    def test_new_token_expires(self):
+        """Test new tokens get an expiry a full lifetime ahead."""
+        token = Token.objects.create(user=self.user)
+
+        expires = AuthTokenInfo.objects.get(token=token).expires
+        self.assertAlmostEqual(
+            (expires - timezone.now()).total_seconds(),
+            30 * 24 * 60 * 60,
+            delta=60,
+        )
+
+    def test_expired_token_rejected(self):
+        """Test expired tokens are refused, even when cached."""
+        token = Token.objects.get(key=self.login())
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.client.get(ME_URL)
+
+        expire(token)
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_login_replaces_expired_token(self):
+        """Test logging in with an expired token issues a new key."""
+        old = self.login()
+        expire(Token.objects.get(key=old))
+
+        new = self.login()
+
+        self.assertNotEqual(new, old)
+        self.assertFalse(Token.objects.filter(key=old).exists())
+
+    def test_login_extends_valid_token(self):
+        """Test logging in again keeps the key and extends its expiry."""
+        key = self.login()
+        AuthTokenInfo.objects.filter(token_id=key).update(
+            expires=timezone.now() + timedelta(days=1),
+        )
+
+        self.assertEqual(self.login(), key)
+        self.assertGreater(
+            AuthTokenInfo.objects.get(token_id=key).expires,
+            timezone.now() + timedelta(days=29),
+        )
+
+    @override_settings(AUTH_TOKEN_USAGE_FLUSH_SIZE=3)
+    def test_last_used_written_in_batches(self):
+        """Test last use is written once for several tokens."""
+        keys = [
+            Token.objects.create(user=create_user(f'{i}@example.com')).key
+            for i in range(3)
+        ]
+        for key in keys[:2]:
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+            self.client.get(ME_URL)
+        self.assertFalse(AuthTokenInfo.objects.filter(
+            last_used__isnull=False,
+        ).exists())
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {keys[2]}')
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(ME_URL)
+
+        updates = [
+            query for query in captured
+            if query['sql'].startswith('UPDATE')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(AuthTokenInfo.objects.filter(
+            last_used__isnull=False,
+        ).count(), 3)
+
+    @override_settings(AUTH_TOKEN_USAGE_FLUSH_INTERVAL=0)
+    def test_last_used_flushed_after_interval(self):
+        """Test last use is written once the interval has passed."""
+        key = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+
+        self.client.get(ME_URL)
+
+        self.assertIsNotNone(AuthTokenInfo.objects.get(token_id=key).last_used)
+
+
+class CleanupTokensCommandTests(TestCase):
+    """Tests for the cleanup_tokens command."""
+
+    def test_deletes_expired_tokens_in_batches(self):
+        """Test only expired tokens are deleted, across batches."""
+        users = [create_user(f'{i}@example.com') for i in range(5)]
+        expired = [Token.objects.create(user=user) for user in users[:3]]
+        valid = Token.objects.create(user=users[3])
+        for token in expired:
+            expire(token)
+        RefreshToken.objects.create(
+            user=users[4],
+            key_hash='0' * 64,
+            token_version=0,
+            expires=timezone.now() - timedelta(seconds=1),
+        )
+        tokens.issue_refresh_token(users[4])
+        out = StringIO()
+
+        call_command('cleanup_tokens', batch_size=2, stdout=out)
+
+        self.assertEqual(list(Token.objects.all()), [valid])
+        self.assertEqual(AuthTokenInfo.objects.count(), 1)
+        self.assertEqual(RefreshToken.objects.count(), 1)
+        self.assertIn('3 expired auth token(s)', out.getvalue())
+        self.assertIn('1 refresh token(s)', out.getvalue())
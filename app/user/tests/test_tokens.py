@@ -0,0 +1,237 @@
+"""
+Tests for signed access tokens and refresh tokens.
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import RefreshToken
+from user import tokens
+from user.authentication import tokens as token_cache, users
+
+
+TOKEN_URL = reverse('user:token')
+REFRESH_URL = reverse('user:token-refresh')
+REVOKE_URL = reverse('user:token-revoke')
+LOGOUT_URL = reverse('user:logout')
+ME_URL = reverse('user:me')
+PATIENTS_URL = reverse('patients:patients-list')
+
+
+class AccessTokenTests(TestCase):
+    """Tests for logging in with signed access tokens."""
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        users.clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client = APIClient()
+
+    def login(self):
+        res = self.client.post(TOKEN_URL, {
+            'email': 'user@example.com',
+            'password': 'password123',
+        })
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_login_returns_both_tokens(self):
+        """Test logging in returns the DRF token and a token pair."""
+        data = self.login()
+
+        self.assertEqual(
+            data['token'],
+            Token.objects.get(user=self.user).key,
+        )
+        self.assertIn('access', data)
+        self.assertIn('refresh', data)
+        self.assertEqual(data['expires_in'], 300)
+
+    def test_access_token_without_queries(self):
+        """Test a cached user is authenticated without the database."""
+        access = self.login()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.client.get(PATIENTS_URL)
+
+        with CaptureQueriesContext(connection) as captured:
+            res = self.client.get(PATIENTS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(any(
+            'core_user' in query['sql'] for query in captured
+        ))
+
+    def test_only_user_status_cached(self):
+        """Test the cache holds the user status, not a shared instance."""
+        access = self.login()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['email'], 'user@example.com')
+        self.assertEqual(users.get(self.user.pk), (self.user.pk, True, 0))
+
+    def test_update_with_access_token(self):
+        """Test the deferred request user saves only what changed."""
+        access = self.login()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+        res = self.client.patch(ME_URL, {
+            'first_name': 'Jane',
+            'password': 'newpassword123',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Jane')
+        self.assertEqual(self.user.email, 'user@example.com')
+        self.assertTrue(self.user.check_password('newpassword123'))
+
+    def test_drf_token_still_works(self):
+        """Test DRF tokens are accepted alongside access tokens."""
+        token = self.login()['token']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_forged_token_rejected(self):
+        """Test tampered access tokens are rejected."""
+        access = self.login()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}x')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(res['WWW-Authenticate'], 'Bearer')
+
+    def test_expired_token_rejected(self):
+        """Test access tokens are refused after their expiry."""
+        access = tokens.issue_access_token(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+        with patch('user.tokens.time.time', return_value=2 ** 40):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_rejects_access_and_refresh(self):
+        """Test revoking bumps the token version and drops refreshes."""
+        data = self.login()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {data["access"]}',
+        )
+        self.client.get(ME_URL)
+
+        res = self.client.post(REVOKE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.token_version, 1)
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        res = self.client.post(REFRESH_URL, {'refresh': data['refresh']})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_inactive_user_rejected(self):
+        """Test access tokens of deactivated users are refused."""
+        access = self.login()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class RefreshTokenTests(TestCase):
+    """Tests for exchanging refresh tokens."""
+
+    def setUp(self):
+        cache.clear()
+        users.clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client = APIClient()
+        self.refresh = tokens.issue_refresh_token(self.user)
+
+    def test_refresh_rotates(self):
+        """Test refreshing returns a new pair and retires the old token."""
+        res = self.client.post(REFRESH_URL, {'refresh': self.refresh})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res.data['refresh'], self.refresh)
+        self.assertEqual(RefreshToken.objects.count(), 1)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {res.data["access"]}',
+        )
+        self.assertEqual(
+            self.client.get(ME_URL).status_code,
+            status.HTTP_200_OK,
+        )
+
+    def test_refresh_single_use(self):
+        """Test a replayed refresh token is refused."""
+        self.client.post(REFRESH_URL, {'refresh': self.refresh})
+
+        res = self.client.post(REFRESH_URL, {'refresh': self.refresh})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_stores_hash_only(self):
+        """Test refresh tokens are not stored in clear."""
+        self.assertFalse(
+            RefreshToken.objects.filter(key_hash=self.refresh).exists()
+        )
+
+    @override_settings(AUTH_REFRESH_TOKEN_TTL=-1)
+    def test_expired_refresh_rejected(self):
+        """Test expired refresh tokens are refused."""
+        refresh = tokens.issue_refresh_token(self.user)
+
+        res = self.client.post(REFRESH_URL, {'refresh': refresh})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(RefreshToken.objects.count(), 1)
+
+    def test_revoked_refresh_deleted(self):
+        """Test refresh tokens of an older token version are deleted."""
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            token_version=1,
+        )
+
+        res = self.client.post(REFRESH_URL, {'refresh': self.refresh})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertFalse(RefreshToken.objects.exists())
+
+    def test_logout_revokes_refresh(self):
+        """Test logging out with a refresh token deletes it."""
+        self.client.credentials(
+            HTTP_AUTHORIZATION=(
+                f'Bearer {tokens.issue_access_token(self.user)}'
+            ),
+        )
+
+        res = self.client.post(LOGOUT_URL, {'refresh': self.refresh})
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(RefreshToken.objects.exists())
@@ -0,0 +1,149 @@
+"""
+Token bucket throttling of login attempts.
+
+Every login attempt runs the password hasher, so attempts are limited per
+client IP and per email before the credentials are checked. Buckets live
+in the LOGIN_THROTTLE_CACHE cache, shared by all workers unless that cache
+is local memory.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+
+from rest_framework.throttling import BaseThrottle
+
+from core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Rejected login attempts of this process by reason.
+rejections = Counter()
+_lock = threading.Lock()
+
+
+def record_rejection(reason):
+    """Count and log a rejected login attempt."""
+    with _lock:
+        rejections[reason] += 1
+    registry.inc('login_rejections_total', {'reason': reason})
+    logger.warning('Login attempt rejected: %s', reason)
+
+
+def _digest(value):
+    return hashlib.sha256(value.encode()).hexdigest()[:32]
+
+
+def normalize_email(email):
+    """Return the email a login attempt is counted against."""
+    return email.strip().lower()
+
+
+def _unknown_key(email):
+    return f'login:unknown:{_digest(normalize_email(email))}'
+
+
+def is_unknown_email(email):
+    """Return whether an email recently matched no user."""
+    if not settings.LOGIN_UNKNOWN_EMAIL_TTL:
+        return False
+    cache = caches[settings.LOGIN_THROTTLE_CACHE]
+    return cache.get(_unknown_key(email), False)
+
+
+def remember_unknown_email(email):
+    """Remember that an email matched no user, if enabled."""
+    if settings.LOGIN_UNKNOWN_EMAIL_TTL:
+        caches[settings.LOGIN_THROTTLE_CACHE].set(
+            _unknown_key(email),
+            True,
+            settings.LOGIN_UNKNOWN_EMAIL_TTL,
+        )
+
+
+def forget_unknown_email(email):
+    """Forget an email once a user has it."""
+    caches[settings.LOGIN_THROTTLE_CACHE].delete(_unknown_key(email))
+
+
+def take(key, rate, burst, now=None):
+    """Take a token from a bucket, returning the seconds to wait if empty.
+
+    Buckets hold at most burst tokens and refill at rate tokens per
+    second. Concurrent workers may both take the last token, which lets
+    a few extra attempts through but never blocks legitimate ones.
+    """
+    cache = caches[settings.LOGIN_THROTTLE_CACHE]
+    now = time.time() if now is None else now
+    tokens, updated = cache.get(key, (burst, now))
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens < 1:
+        return (1 - tokens) / rate
+    cache.set(key, (tokens - 1, now), int(burst / rate) + 1)
+    return 0
+
+
+class LoginThrottle(BaseThrottle):
+    """Base token bucket throttle of login attempts."""
+    scope = None
+
+    def get_rate(self):
+        """Return the refill rate per second and the burst size."""
+        raise NotImplementedError
+
+    def get_key(self, request):
+        """Return the identity of the bucket, or None to skip it."""
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        ident = self.get_key(request)
+        if ident is None:
+            return True
+        rate, burst = self.get_rate()
+        self.delay = take(
+            f'login:{self.scope}:{_digest(ident)}',
+            rate,
+            burst,
+        )
+        if self.delay:
+            record_rejection(self.scope)
+            return False
+        return True
+
+    def wait(self):
+        return self.delay
+
+
+class LoginIPThrottle(LoginThrottle):
+    """Throttle login attempts per client IP."""
+    scope = 'ip'
+
+    def get_rate(self):
+        return (
+            settings.LOGIN_THROTTLE_IP_RATE,
+            settings.LOGIN_THROTTLE_IP_BURST,
+        )
+
+    def get_key(self, request):
+        return self.get_ident(request)
+
+
+class LoginEmailThrottle(LoginThrottle):
+    """Throttle login attempts per email, from any IP."""
+    scope = 'email'
+
+    def get_rate(self):
+        return (
+            settings.LOGIN_THROTTLE_EMAIL_RATE,
+            settings.LOGIN_THROTTLE_EMAIL_BURST,
+        )
+
+    def get_key(self, request):
+        email = request.data.get('email')
+        if not isinstance(email, str) or not email:
+            return None
+        return normalize_email(email)
@@ -0,0 +1,196 @@
+"""
+Signed access tokens and rotating refresh tokens.
+
+Access tokens are short-lived and carry the user id, their expiry and the
+user's token version, signed with HMAC-SHA256 over SECRET_KEY, so they are
+verified without the database. Refresh tokens are random, stored hashed,
+and exchanged for a new pair. Bumping a user's token version revokes both.
+
+DRF auth tokens expire AUTH_TOKEN_TTL seconds after login. Their last use
+is collected in memory and written for all tokens at once.
+"""
+import hashlib
+import secrets
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from core.models import AuthTokenInfo, RefreshToken
+
+ACCESS_TOKEN_SALT = 'user.access-token'
+
+
+class InvalidToken(ValueError):
+    """Raised for forged, expired or revoked tokens."""
+
+
+def issue_access_token(user):
+    """Return a signed access token of a user."""
+    return signing.dumps(
+        {
+            'uid': user.pk,
+            'ver': user.token_version,
+            'exp': int(time.time()) + settings.AUTH_ACCESS_TOKEN_TTL,
+        },
+        salt=ACCESS_TOKEN_SALT,
+    )
+
+
+def read_access_token(token):
+    """Return the claims of a valid access token.
+
+    The token version is not checked, it needs the current user.
+    """
+    try:
+        claims = signing.loads(token, salt=ACCESS_TOKEN_SALT)
+    except signing.BadSignature:
+        raise InvalidToken('Invalid access token.')
+    if claims['exp'] <= time.time():
+        raise InvalidToken('Access token expired.')
+
+    return claims
+
+
+def _hash(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def issue_refresh_token(user):
+    """Create and return a new refresh token of a user."""
+    key = secrets.token_urlsafe(32)
+    RefreshToken.objects.create(
+        user=user,
+        key_hash=_hash(key),
+        token_version=user.token_version,
+        expires=timezone.now() + timedelta(
+            seconds=settings.AUTH_REFRESH_TOKEN_TTL,
+        ),
+    )
+    return key
+
+
+def issue_tokens(user):
+    """Return a new access and refresh token pair of a user."""
+    return {
+        'access': issue_access_token(user),
+        'refresh': issue_refresh_token(user),
+        'expires_in': settings.AUTH_ACCESS_TOKEN_TTL,
+    }
+
+
+def refresh_tokens(key):
+    """Exchange a refresh token for a new token pair.
+
+    The refresh token is single use, so a replayed token is refused.
+    Expired and revoked tokens are deleted as they are refused.
+    """
+    with transaction.atomic():
+        refresh = RefreshToken.objects.select_for_update().select_related(
+            'user',
+        ).filter(key_hash=_hash(key)).first()
+        if refresh is None:
+            raise InvalidToken('Invalid refresh token.')
+        refresh.delete()
+        user = refresh.user
+        if (
+            refresh.expires > timezone.now()
+            and refresh.token_version == user.token_version
+            and user.is_active
+        ):
+            return issue_tokens(user)
+
+    raise InvalidToken('Refresh token expired or revoked.')
+
+
+def revoke_refresh_token(key):
+    """Delete a refresh token, returning whether it existed."""
+    deleted, _ = RefreshToken.objects.filter(key_hash=_hash(key)).delete()
+    return bool(deleted)
+
+
+def revoke_user_tokens(user):
+    """Revoke every access and refresh token issued to a user."""
+    user.token_version = F('token_version') + 1
+    user.save(update_fields=['token_version'])
+    user.refresh_from_db(fields=['token_version'])
+    RefreshToken.objects.filter(user=user).delete()
+
+
+def token_expiry():
+    """Return the expiry of a DRF auth token issued now."""
+    return timezone.now() + timedelta(seconds=settings.AUTH_TOKEN_TTL)
+
+
+def is_expired(token):
+    """Return whether a DRF auth token, with its info loaded, expired."""
+    info = getattr(token, 'info', None)
+    return info is not None and info.expires <= timezone.now()
+
+
+@transaction.atomic
+def issue_auth_token(user):
+    """Return the DRF auth token of a user, valid for a full lifetime.
+
+    An expired token is replaced by a new key, a valid one is extended.
+    """
+    token, created = Token.objects.select_related('info').get_or_create(
+        user=user,
+    )
+    if created:
+        return token
+    if is_expired(token):
+        token.delete()
+        return Token.objects.create(user=user)
+    AuthTokenInfo.objects.update_or_create(
+        token=token,
+        defaults={'expires': token_expiry()},
+    )
+    return token
+
+
+class TokenUsage:
+    """Last use of DRF auth tokens, written in coalesced batches.
+
+    Used keys are collected until AUTH_TOKEN_USAGE_FLUSH_INTERVAL seconds
+    have passed or AUTH_TOKEN_USAGE_FLUSH_SIZE keys are waiting, then all
+    are stamped with the time of the flush in a single UPDATE.
+    """
+
+    def __init__(self):
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.flushed = time.monotonic()
+
+    def record(self, key):
+        """Note the use of a token, flushing when a batch is due."""
+        with self.lock:
+            self.pending.add(key)
+            due = (
+                len(self.pending) >= settings.AUTH_TOKEN_USAGE_FLUSH_SIZE
+                or time.monotonic() - self.flushed
+                >= settings.AUTH_TOKEN_USAGE_FLUSH_INTERVAL
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write the last use of every pending token."""
+        with self.lock:
+            keys = list(self.pending)
+            self.pending.clear()
+            self.flushed = time.monotonic()
+        if keys:
+            AuthTokenInfo.objects.filter(token_id__in=keys).update(
+                last_used=timezone.now(),
+            )
+
+
+usage = TokenUsage()
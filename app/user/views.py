@@ -1,14 +1,27 @@
 """
 Views for the user API.
 """
-from rest_framework import generics, authentication, permissions
+from drf_spectacular.utils import extend_schema
+from rest_framework import exceptions, generics, permissions, status
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 
+from user import tokens
+from user.authentication import (
+    AccessTokenAuthentication,
+    CachedTokenAuthentication,
+)
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
+    LogoutSerializer,
+    RefreshTokenSerializer,
+    TokenPairSerializer,
 )
+from user.throttling import LoginEmailThrottle, LoginIPThrottle
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -17,18 +30,88 @@ class CreateUserView(generics.CreateAPIView):
 
 
 class CreateTokenView(ObtainAuthToken):
-    """Create a new auth token for user."""
+    """Create a new auth token for user.
+
+    Besides the DRF token, the response holds a signed access token and a
+    refresh token.
+    """
     serializer_class = AuthTokenSerializer
     # added colorfull api views
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    throttle_classes = [LoginIPThrottle, LoginEmailThrottle]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        token = tokens.issue_auth_token(user)
+        return Response({'token': token.key, **tokens.issue_tokens(user)})
+
+
+class RefreshTokenView(APIView):
+    """Exchange a refresh token for a new access and refresh token."""
+    authentication_classes = []
+    permission_classes = []
+
+    def get_authenticate_header(self, request):
+        return AccessTokenAuthentication.keyword
+
+    @extend_schema(
+        request=RefreshTokenSerializer,
+        responses=TokenPairSerializer,
+    )
+    def post(self, request):
+        serializer = RefreshTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            pair = tokens.refresh_tokens(serializer.validated_data['refresh'])
+        except tokens.InvalidToken as error:
+            raise exceptions.AuthenticationFailed(str(error))
+        return Response(pair)
+
+
+class RevokeTokensView(APIView):
+    """Revoke every access and refresh token of the authenticated user."""
+    authentication_classes = [
+        AccessTokenAuthentication,
+        CachedTokenAuthentication,
+    ]
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(request=None, responses={204: None})
+    def post(self, request):
+        tokens.revoke_user_tokens(request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """Manage the authenticated user."""
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [
+        AccessTokenAuthentication,
+        CachedTokenAuthentication,
+    ]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
         """Retrieve and return the authenticated user."""
         return self.request.user
+
+
+class LogoutView(APIView):
+    """Delete the auth token and the given refresh token of the user."""
+    authentication_classes = [
+        AccessTokenAuthentication,
+        CachedTokenAuthentication,
+    ]
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(request=LogoutSerializer, responses={204: None})
+    def post(self, request):
+        serializer = LogoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if isinstance(request.auth, Token):
+            request.auth.delete()
+        if 'refresh' in serializer.validated_data:
+            tokens.revoke_refresh_token(serializer.validated_data['refresh'])
+        return Response(status=status.HTTP_204_NO_CONTENT)